@@ -1,201 +1,155 @@
 import numpy as np
-import streamlit as st
 import pandas as pd
 import backend_sqlite
-import yfinance as yf
-import re
-import concurrent.futures
+import backend_market_data
+import backend_fundamentals
+import backend_history
+import backend_fx
+import backend_positions
+import backend_valuation
+import backend_holdings
+import backend_snapshots
+import backend_perf
+import backend_cache
 
 # --- Currency Conversion ---
-@st.cache_data(ttl=300)
+def _parse_fx_type(fx_type):
+    # 'usd_chf' -> ('USD', 'CHF')
+    currency, target = fx_type.split("_")
+    return currency.upper(), target.upper()
+
 def get_current_fx_rates(fx_type):
-    if fx_type == 'usd_chf':
-        fx_rate = yf.Ticker("USDCHF=X").history(period="1d")["Close"].iloc[-1]
-    elif fx_type == 'eur_chf':
-        fx_rate = yf.Ticker("EURCHF=X").history(period="1d")["Close"].iloc[-1]
-    return fx_rate
+    currency, target = _parse_fx_type(fx_type)
+    return backend_fx.get_fx_rate(currency, target=target)
 
-@st.cache_data(ttl=300)
 def get_fx_rate(fx_type, date):
     """
     Get exchange rates
     Args: 
-    - fx_type: [usd_chf, eur_chf]
+    - fx_type: '<currency>_<target>', e.g. usd_chf, eur_chf, gbp_chf
     - date: the date for which to retrieve the exchange rate, 'yyy-mm-dd'
+    Returns the last known rate on or before date
     """
-    if fx_type == 'usd_chf':
-        price_series = yf.Ticker("USDCHF=X").history(start=date, end=date, interval="1d")["Close"]
-        if not price_series.empty:
-            rx_rate = price_series.iloc[0]
-        else:
-            # fallback: use latest available rate
-            rx_rate = get_current_fx_rates('usd_chf')
-    elif fx_type == 'eur_chf':
-        price_series = yf.Ticker("EURCHF=X").history(start=date, end=date, interval="1d")["Close"]
-        if not price_series.empty:
-            rx_rate = price_series.iloc[0]
-        else:
-            rx_rate = get_current_fx_rates('eur_chf')
-    else:
-        rx_rate = None
-    return rx_rate
+    currency, target = _parse_fx_type(fx_type)
+    return backend_fx.get_fx_rate(currency, date, target=target)
 
 def convert_to_chf(row):
-    usd_chf = get_current_fx_rates('usd_chf')
-    eur_chf = get_current_fx_rates('eur_chf')
     price = row.get("Current Price", None)
-    if price is None:
+    if price is None or pd.isnull(price):
         return 0
-    if row["Currency"] == "USD":
-        return price * usd_chf
-    elif row["Currency"] == "CHF":
-        return price
-    elif row["Currency"] == "EUR":
-        return price * eur_chf
-    return 0
-
-def get_current_positions():
-    df = backend_sqlite.get_transactions()
-    df = df[df["buy_sell"].isin(["BUY", "SELL"])].copy()
-    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").fillna(0)
-    df["price_per_unit"] = pd.to_numeric(df["price_per_unit"], errors="coerce").fillna(0)
-    df["buy"] = pd.to_numeric(df["buy"], errors="coerce").fillna(0)
-    df["sell"] = pd.to_numeric(df["sell"], errors="coerce").fillna(0)
-
-    # Calculate quantity and average buying price (buy - sell)
-    df["signed_quantity"] = df.apply(lambda row: row["quantity"] if row["buy_sell"] == "BUY" else -row["quantity"], axis=1)
-    buy_df = df[df["buy_sell"] == "BUY"]
-    avg_buy_price = buy_df.groupby("Ticker")["price_per_unit"].mean().reset_index().rename(columns={"price_per_unit": "Buy Price"})
-    # Summe der Stückzahl
-    df = df.drop(columns=["quantity"])
-    positions = df.groupby("Ticker").agg({
-        "signed_quantity": "sum"
-    }).reset_index().rename(columns={"signed_quantity": "Quantity"})
-    positions = positions.merge(avg_buy_price, on="Ticker", how="left")
-
-    # Hole weitere Infos aus letzter Transaktion je Ticker
-    info_cols = ["Ticker", "transaction_info", "currency"]
-    latest_info = df.sort_values("date").groupby("Ticker").tail(1)[info_cols]
-    positions = positions.merge(latest_info, on="Ticker", how="left")
-    positions["Name"] = positions["transaction_info"]
-    positions["Name"] = positions["Name"].str.replace(r'^.*x ', '', regex=True).str.rstrip('"')
-    positions["Currency"] = positions["currency"]
+    rate = backend_fx.get_fx_rate(row["Currency"])
+    return price * rate if rate is not None else 0
 
-    # Nur Positionen mit Bestand > 0
-    positions = positions[positions["Quantity"] > 0].copy()
-    positions = positions[["Name", "Ticker", "Currency", "Quantity", "Buy Price"]]
-    kpis = positions.apply(lambda row: fetch_kpis(row["Ticker"], row["Currency"]), axis=1)
-    positions = pd.concat([positions, kpis], axis=1)
-
-    backend_sqlite.update_positions(positions)
+@backend_perf.timed()
+def get_current_positions(method="average"):
+    """
+    Current positions with cost basis and KPIs from the quote cache. Read only, the KPI columns of
+    current_positions are written where the quotes are stored (backend_fundamentals.refresh).
+    Args:
+    - method: cost accounting, "average" reads the incrementally maintained current_positions table,
+      "fifo" computes the positions from the transactions
+    """
+    if method == "average":
+        positions = backend_snapshots.read_positions(backend_positions.POSITION_COLUMNS)
+    else:
+        positions = backend_positions.compute_positions(backend_sqlite.transactions_snapshot(), method=method)
 
+    # Nur Positionen mit Bestand > 0
+    positions = positions[positions["Quantity"] > backend_positions.EPS].reset_index(drop=True)
+    positions = positions[backend_positions.POSITION_COLUMNS]
+    kpis = fetch_kpis_bulk(tuple(positions["Ticker"]), tuple(positions["Currency"]))
+    return positions.merge(kpis, left_on="Ticker", right_index=True, how="left")
+
+# rounded columns of the positions table in the dashboard
+ROUND_COLUMNS = ["Buy Price", "Current Price", "Value (CHF)", "Profit/Loss", "Profit/Loss (%)", "Cost Basis",
+                 "Realized P&L", "Fees", "EPS", "PE Ratio", "PEG Ratio", "Beta", "Free Cash Flow", "Revenue Growth YoY (%)"]
+
+@backend_cache.cached(tables=("transactions", "current_positions", "quote_cache"))
+@backend_perf.timed()
+def get_positions_overview():
+    """
+    Current positions with value in CHF and P&L, rounded for display. Cached until transactions,
+    positions or quotes are written; the result is shared, copy it before modifying.
+    """
+    positions = get_current_positions()
+    # Entferne doppelte Spaltennamen
+    positions = positions.loc[:, ~positions.columns.duplicated()]
+
+    if "Current Price" not in positions.columns or positions["Current Price"].isnull().any():
+        # Fallback: Hole die fehlenden Preise in einem Batch neu
+        if "Current Price" not in positions.columns:
+            positions["Current Price"] = None
+        missing = positions["Current Price"].isnull()
+        quotes = fetch_kpis_bulk(tuple(positions.loc[missing, "Ticker"]), tuple(positions.loc[missing, "Currency"]))
+        positions.loc[missing, "Current Price"] = positions.loc[missing, "Ticker"].map(quotes["Current Price"])
+
+    positions["Value (CHF)"] = backend_fx.convert(positions["Current Price"], positions["Currency"]).fillna(0) * positions["Quantity"]
+    positions["Profit/Loss"] = (positions["Current Price"] - positions["Buy Price"]) * positions["Quantity"]
+    positions["Profit/Loss (%)"] = ((positions["Current Price"] - positions["Buy Price"]) / positions["Buy Price"]) * 100
+
+    existing_round_cols = [col for col in ROUND_COLUMNS if col in positions.columns]
+    positions[existing_round_cols] = positions[existing_round_cols].round(3)
     return positions
 
+@backend_cache.cached(tables=("watchlist",))
+def get_watchlist():
+    """
+    Watchlist entries, cached until the watchlist is changed; the result is shared, don't modify it
+    """
+    return backend_sqlite.get_watchlist()
+
 def set_current_positions(positions):
     """
     Set current positions in the backend.
     """
     backend_sqlite.set_positions(positions)
 
+@backend_perf.timed()
 def get_total_up2_chf(periode):
     """
-    Get total quantity and value in CHF for each Ticker at a specific up_date.
+    Get total quantity and value in CHF for each Ticker at a specific up_date (value NaN without FX rate).
+    Args:
+    - periode: DateOffset arguments back from today, e.g. {"months": 1}
     """
-    # get transactions and filter them
+    # BUY/SELL totals and holdings at up_date from the holdings index (binary search, no transaction scan)
     up_date = pd.to_datetime("today") - pd.DateOffset(**periode)
-    df = backend_sqlite.get_transactions()
-    df["date"] = pd.to_datetime(df["date"])  # Ensure date column is datetime
-    df = df[df["date"] <= up_date]
-
-    # calculate total quantity per Ticker (buy, sell)
-    total_quantity = df.groupby(["Ticker", "buy_sell"])["quantity"].sum().unstack(fill_value=0)
-    total_quantity["Net"] = total_quantity.get("BUY", 0) - total_quantity.get("SELL", 0)
-
-    print(f"Total quantity up to {up_date.strftime('%Y-%m-%d')}: {total_quantity}")
-
-    # Get price for each ticker at up_date and convert to CHF if needed
-    prices_chf = {}
-    for ticker in total_quantity.index:
-        # Get last close price at up_date
-        try:
-            price = yf.Ticker(ticker).history(start=up_date, end=up_date + pd.DateOffset(days=1), interval="1d")["Close"]
-            price = price.iloc[0] if not price.empty else 0
-        except Exception:
-            price = 0
-
-        # Get currency for ticker
-        currency = df[df["Ticker"] == ticker]["currency"].iloc[-1] if not df[df["Ticker"] == ticker].empty else "CHF"
-        if currency == "USD":
-            fx = get_fx_rate("usd_chf", up_date.strftime("%Y-%m-%d"))
-            price_chf = price * fx
-        elif currency == "EUR":
-            fx = get_fx_rate("eur_chf", up_date.strftime("%Y-%m-%d"))
-            price_chf = price * fx
-        else:
-            price_chf = price
-        prices_chf[ticker] = price_chf
-
-    # Calculate total value in CHF
-    total_value = total_quantity["Net"].copy()
-    for ticker in total_value.index:
-        total_value[ticker] = total_value[ticker] * prices_chf.get(ticker, 0)
+    state = backend_holdings.positions_at(up_date)
+    state = state[(state["bought"] > 0) | (state["sold"] > 0)]
+    total_quantity = pd.DataFrame({"BUY": state["bought"], "SELL": state["sold"], "Net": state["quantity"]})
+
+    # value per ticker at up_date in CHF, holdings * close * fx
+    currencies = backend_sqlite.get_current_positions().set_index("Ticker")["Currency"]
+    held = pd.DataFrame([state["quantity"].to_numpy()], index=pd.DatetimeIndex([up_date.normalize()]), columns=state.index)
+    # NaN marks a position without FX rate
+    total_value = backend_valuation.value_holdings(held, currencies).iloc[0]
 
     return total_quantity, total_value
 
+@backend_perf.timed()
 def get_total_graph_chf(periode, interval):
     """
     Get total value for the graph period with interval
+    Args:
+    - periode: '1d', '1wk', '1mo', ..., 'max' (see change_duration) or DateOffset arguments
+    - interval: '1m', '1d', '1wk', '1mo'
+    Returns: Series of the portfolio value in CHF indexed by date
     """
-    # get transactions and filter them
-    total_start_quantity, total_value = get_total_up2_chf(periode)
+    return backend_valuation.get_valuation_series(backend_sqlite.transactions_snapshot(), periode, interval)
 
-    # graph list or pandas dataframe
-
-@st.cache_data(ttl=300)
 def fetch_kpis(ticker, currency):
-    "fetch data from Yahoo Finance - can take some time plus can fail"
-    # Add crypto ticker mapping
-    special_ticker_map = {
-        "ADA": "ADA-USD",
-        "ALG": "ALGO-USD",
-        "ASML": "ASML.AS",
-        "DOT": "DOT-USD",
-        "ETH": "ETH-USD",
-        "LNK": "LINK-USD",
-        "LTC": "LTC-USD",
-        "XBT": "BTC-USD",
-        "RND": "RENDER-USD",
-        "VAX": "AVAX-USD",
-        "ETH": "ETH-USD",
-        "SOL": "SOL-USD",
-        "XRP": "XRP-USD",
-        "GAL": "GALA-USD",
-        "AAV": "AAVE-USD",
-        "BNT": "BNT-USD",
-        "POL": "POL-USD",
-        "ZRX": "ZRX-USD",
-        "CHDVD SW Equity": "CHDVD.SW",
-        # Add more mappings as needed
-    }
-    try:
-        if ticker in special_ticker_map:
-            stock = yf.Ticker(special_ticker_map[ticker])
-        elif currency == "CHF":
-            stock = yf.Ticker(f"{ticker}.SW")
-        else:
-            stock = yf.Ticker(ticker)
-        info = stock.info
-        price = stock.history(period="1d")["Close"].iloc[-1]
-        return pd.Series({
-            "Current Price": price,
-            "Price/Book": info.get("priceToBook"),
-            "PE Ratio": info.get("trailingPE"),
-            "Market Cap": info.get("marketCap"),
-            "PEG Ratio": info.get("pegRatio"),
-            "Beta": info.get("beta"),
-            "Free Cash Flow": info.get("freeCashflow"),
-            "Revenue Growth YoY (%)": info.get("revenueGrowth") * 100 if info.get("revenueGrowth") else None
-        })
-    except Exception as e:
-        print(f"Error fetching data for {ticker}-{currency}: {e} use None")
-        return pd.Series({col: None for col in ["Current Price", "EPS", "PE Ratio", "Market Cap", "PEG Ratio", "Beta", "Free Cash Flow", "Revenue Growth YoY (%)"]})
\ No newline at end of file
+    "KPIs of one ticker from the fundamentals cache, refreshed from Yahoo Finance in the background"
+    quotes, _ = backend_fundamentals.get_quotes([ticker], [currency])
+    return quotes.loc[ticker]
+
+@backend_perf.timed()
+def fetch_kpis_bulk(tickers, currencies):
+    """
+    KPIs for many tickers from the fundamentals cache, stale values are refreshed in the background
+    Args:
+    - tickers, currencies: tuples of broker tickers and their currency
+    Returns: DataFrame indexed by Ticker with the KPI columns, failed tickers are None
+    """
+    # with a refresh worker running, never fetched symbols are left to the worker as well
+    worker = backend_sqlite.get_meta("last_refresh") is not None
+    quotes, _ = backend_fundamentals.get_quotes(list(tickers), list(currencies), wait_for_missing=not worker)
+    return quotes
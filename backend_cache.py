@@ -0,0 +1,112 @@
+import time
+import threading
+import functools
+from collections import OrderedDict
+import backend_perf
+import backend_sqlite
+
+# Result cache of the analytics functions, replaces st.cache_data so the backend runs without Streamlit.
+# The backend is pluggable: MemoryCache (default), NullCache (no caching, for tests and benchmarks)
+# or any object with get/set/clear. Results can be keyed by data versions (backend_sqlite.data_versions),
+# they are then invalidated by the next write to one of the tables instead of after a fixed time.
+
+_MISSING = object()
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache with a TTL per entry
+    Args:
+    - maxsize: entries kept per process, the least recently used are dropped first
+    """
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            expires, value = entry
+            if expires is not None and time.monotonic() > expires:
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self, prefix=None):
+        with self._lock:
+            if prefix is None:
+                self._data.clear()
+            else:
+                for key in [key for key in self._data if key[0] == prefix]:
+                    del self._data[key]
+
+
+class NullCache:
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self, prefix=None):
+        pass
+
+
+_backend = MemoryCache()
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Replace the cache backend, e.g. NullCache() to always recompute
+    """
+    global _backend
+    _backend = backend
+
+
+def cached(ttl=None, tables=()):
+    """
+    Cache the results of a function by its arguments (which must be hashable)
+    Args:
+    - ttl: seconds a result is valid, None for no expiry
+    - tables: tables whose data version is part of the key, e.g. ("transactions", "watchlist"):
+      a write to one of them (insert_transactions, update_positions, add_to_watchlist, ...) invalidates
+      the results. Costs one meta query per call.
+    The decorated function gets .clear() like st.cache_data functions.
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+        short_name = name.replace("backend_", "")
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            if tables:
+                key += (backend_sqlite.DB_URLS["portfolio"], backend_sqlite.data_versions(tables))
+            value = _backend.get(key)
+            if value is _MISSING:
+                backend_perf.count("cache.miss")
+                backend_perf.count(f"cache.miss:{short_name}")
+                value = fn(*args, **kwargs)
+                _backend.set(key, value, ttl)
+            else:
+                backend_perf.count("cache.hit")
+            return value
+
+        wrapper.clear = lambda: _backend.clear(name)
+        return wrapper
+    return decorator
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import pandas as pd
+import backend_history
+
+# Chart data reduced to a point budget before it goes to plotly: line series are downsampled
+# (largest-triangle-three-buckets or min/max per bucket), price bars aggregated to OHLC candles and
+# transaction markers clipped to the visible range. The payload stays bounded for any history length.
+
+DEFAULT_POINT_BUDGET = int(os.environ.get("PORTFOLIO_CHART_POINTS", 1500))
+
+# candle sizes from fine to coarse with their (approximate) length, the first that fits the budget is used
+OHLC_RULES = [
+    ("1min", pd.Timedelta(minutes=1)),
+    ("5min", pd.Timedelta(minutes=5)),
+    ("15min", pd.Timedelta(minutes=15)),
+    ("30min", pd.Timedelta(minutes=30)),
+    ("1h", pd.Timedelta(hours=1)),
+    ("4h", pd.Timedelta(hours=4)),
+    ("1D", pd.Timedelta(days=1)),
+    ("1W", pd.Timedelta(weeks=1)),
+    ("2W", pd.Timedelta(weeks=2)),
+    ("1ME", pd.Timedelta(days=31)),
+    ("3ME", pd.Timedelta(days=92)),
+    ("1YE", pd.Timedelta(days=366)),
+]
+
+
+def _as_float(index):
+    # datetimes as nanoseconds, so the triangle areas can be computed on plain floats
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(float)
+    return np.asarray(index, dtype=float)
+
+
+def lttb(x, y, n_out):
+    """
+    Indices of the points kept by largest-triangle-three-buckets: first and last point, and per bucket
+    the point with the largest triangle to the previously kept point and the mean of the next bucket
+    Args:
+    - x, y: float arrays of the same length, x sorted
+    - n_out: number of points to keep
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # bucket i (0..n_out-3) covers edges[i]:edges[i+1] of the points between first and last
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(int)
+    edges[-1] = n - 1
+    csum_x = np.r_[0.0, np.cumsum(x)]
+    csum_y = np.r_[0.0, np.cumsum(y)]
+    next_start = np.r_[edges[1:], n - 1]
+    next_end = np.r_[edges[2:], n, n]
+    mean_x = (csum_x[next_end] - csum_x[next_start]) / (next_end - next_start)
+    mean_y = (csum_y[next_end] - csum_y[next_start]) / (next_end - next_start)
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(y, n_out):
+    """
+    Indices of the minimum and maximum of each of n_out / 2 equal buckets (and first/last point),
+    fully vectorized. Keeps every spike, the shape is rougher than lttb.
+    """
+    n = len(y)
+    n_buckets = max(n_out // 2 - 1, 1)
+    if n_out >= n:
+        return np.arange(n)
+    starts = np.floor(np.arange(n_buckets) * n / n_buckets).astype(int)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.r_[starts, n]))
+    order = np.lexsort((y, bucket))  # sorted by bucket, then value
+    last = np.r_[starts[1:], n] - 1
+    keep = np.concatenate([[0], order[starts], order[last], [n - 1]])
+    return np.unique(keep)
+
+
+def downsample(series, budget=None, method="lttb"):
+    """
+    Series reduced to at most `budget` points (NaN dropped)
+    Args:
+    - method: 'lttb' (shape preserving) or 'minmax' (keeps the extremes of every bucket)
+    """
+    budget = budget or DEFAULT_POINT_BUDGET
+    series = series.dropna()
+    if len(series) <= budget:
+        return series
+    y = series.to_numpy(dtype=float)
+    keep = lttb(_as_float(series.index), y, budget) if method == "lttb" else minmax(y, budget)
+    return series.iloc[keep]
+
+
+def to_ohlc(hist, budget=None):
+    """
+    OHLC(V) bars aggregated to the finest candle size from OHLC_RULES that gives at most `budget`
+    candles. Bars without Open/High/Low (e.g. a close-only series) use Close.
+    """
+    budget = budget or DEFAULT_POINT_BUDGET
+    bars = hist.copy()
+    for col in ("Open", "High", "Low"):
+        bars[col] = bars[col].fillna(bars["Close"]) if col in bars.columns else bars["Close"]
+    bars = bars.dropna(subset=["Close"])
+    if len(bars) <= budget:
+        return bars
+    span = bars.index[-1] - bars.index[0]
+    rule = next((rule for rule, length in OHLC_RULES if span / length < budget), OHLC_RULES[-1][0])
+    agg = {col: how for col, how in backend_history.OHLCV_AGG.items() if col in bars.columns}
+    return bars.resample(rule, label="left", closed="left").agg(agg).dropna(subset=["Close"])
+
+
+def clip_markers(markers, start, end, budget=None):
+    """
+    Transaction markers inside [start, end]. More markers than the budget are merged per time bucket
+    and side (BUY/SELL) into one marker with the quantity weighted price.
+    Args:
+    - markers: DataFrame with date (datetime), buy_sell, price_per_unit and optionally quantity
+    """
+    budget = budget or DEFAULT_POINT_BUDGET
+    markers = markers[(markers["date"] >= start) & (markers["date"] <= end)]
+    if len(markers) <= budget:
+        return markers
+    quantity = markers["quantity"].abs() if "quantity" in markers.columns else pd.Series(1.0, index=markers.index)
+    n_buckets = max(budget // 2, 1)  # one marker per side and bucket
+    bucket = ((markers["date"] - start) / ((end - start) / n_buckets)).astype(int).clip(upper=n_buckets - 1)
+    merged = pd.DataFrame({"bucket": bucket, "buy_sell": markers["buy_sell"], "quantity": quantity,
+                           "value": quantity * markers["price_per_unit"], "date": markers["date"]}) \
+        .groupby(["bucket", "buy_sell"], sort=True) \
+        .agg(date=("date", "first"), quantity=("quantity", "sum"), value=("value", "sum")).reset_index()
+    merged["price_per_unit"] = merged["value"] / merged["quantity"]
+    return merged[["date", "buy_sell", "price_per_unit", "quantity"]]
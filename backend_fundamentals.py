@@ -0,0 +1,174 @@
+import threading
+import concurrent.futures
+import pandas as pd
+import backend_sqlite
+import backend_market_data
+import backend_symbols
+import backend_perf
+
+# How long cached values count as fresh. Prices move all day, Market Cap, PEG, Free Cash Flow and
+# revenue growth change with the quarterly reports.
+QUOTE_TTL = pd.Timedelta(minutes=5)
+FUNDAMENTALS_TTL = pd.Timedelta(days=1)
+
+# Failing fundamentals are not fetched again before 5 min, 10 min, 20 min, ... at most 1 day
+BACKOFF_BASE = pd.Timedelta(minutes=5)
+BACKOFF_MAX = pd.Timedelta(days=1)
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# one background refresh at a time, the provider calls inside are parallel already
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="fundamentals")
+_lock = threading.Lock()
+_inflight = set()  # ("price"|"info", symbol) with a scheduled refresh
+
+
+def backoff(failures):
+    """
+    Wait time after the n-th failure in a row
+    """
+    return min(BACKOFF_BASE * 2 ** max(failures - 1, 0), BACKOFF_MAX)
+
+
+def _timestamps(values):
+    return pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+
+
+def stale_symbols(cache, symbols, now=None):
+    """
+    Symbols that need a refresh
+    Args:
+    - cache: output of backend_sqlite.get_quote_cache
+    Returns: (symbols with a stale price, symbols with stale fundamentals that are not in backoff)
+    """
+    now = now or pd.Timestamp.now()
+    cache = cache.reindex(list(symbols))
+    price_fresh = (now - _timestamps(cache["price_at"])) <= QUOTE_TTL
+    info_fresh = (now - _timestamps(cache["fundamentals_at"])) <= FUNDAMENTALS_TTL
+    waiting = _timestamps(cache["retry_at"]) > now
+    # symbols in backoff that never had a price are unknown to the provider
+    unknown = waiting & cache["Current Price"].isna()
+    return list(cache.index[~price_fresh & ~unknown]), list(cache.index[~info_fresh & ~waiting])
+
+
+def refresh(price_symbols, info_symbols, provider=None, max_workers=8, timeout=10.0):
+    """
+    Fetch prices (one bulk call) and fundamentals (thread pool, timeout per symbol) and store them
+    in the cache and the KPI columns of the positions. Failed fundamentals get a retry time with
+    exponential backoff.
+    Returns {symbol: error message} of the failed symbols
+    """
+    provider = provider or backend_market_data.get_provider()
+    now = pd.Timestamp.now()
+    stamp = now.strftime(DATE_FORMAT)
+
+    prices = {}
+    if price_symbols:
+        backend_perf.count("provider.calls")
+        try:
+            with backend_perf.span("provider.download_prices", symbols=len(price_symbols)):
+                prices = provider.download_prices(list(price_symbols))
+        except Exception as e:
+            print(f"Bulk price download failed: {e}")
+
+    def fetch_one(symbol):
+        backend_perf.count("provider.calls")
+        with backend_perf.span("provider.fetch_info", symbol=symbol):
+            return backend_market_data.info_to_quote(provider.fetch_info(symbol))
+
+    infos, errors = backend_market_data.map_with_timeouts(fetch_one, set(info_symbols), max_workers, timeout)
+    for symbol, quote in infos.items():
+        # the bulk download missed it, the info price is better than none
+        if symbol not in prices and quote.get("Current Price") is not None:
+            prices[symbol] = quote["Current Price"]
+
+    failures = {}
+    if errors:
+        previous = backend_sqlite.get_quote_cache(list(errors))["failures"]
+        for symbol, error in errors.items():
+            count = int(previous.get(symbol, 0) or 0) + 1
+            failures[symbol] = (count, (now + backoff(count)).strftime(DATE_FORMAT), str(error))
+            print(f"Error fetching fundamentals for {symbol} (failure {count}, retry after {failures[symbol][1]}): {error}")
+
+    backend_sqlite.store_quote_prices(prices, stamp)
+    backend_sqlite.store_fundamentals(infos, stamp)
+    backend_sqlite.store_quote_failures(failures)
+    if prices or infos:
+        store_position_kpis()
+    return {symbol: str(error) for symbol, error in errors.items()}
+
+
+def store_position_kpis():
+    """
+    Copy the cached quotes into the KPI columns of current_positions (the stored positions as they are,
+    only rows whose KPIs changed are written)
+    """
+    positions = backend_sqlite.get_current_positions(apply_pending=False)
+    symbols = [backend_symbols.resolve_symbol(t, c) for t, c in zip(positions["Ticker"], positions["Currency"])]
+    cache = backend_sqlite.get_quote_cache(symbols).reindex(symbols)
+    kpis = cache[backend_sqlite.KPI_COLUMNS].set_axis(positions["Ticker"].to_numpy())
+    backend_sqlite.update_positions(kpis.rename_axis("Ticker").reset_index())
+
+
+def schedule_refresh(price_symbols, info_symbols, provider=None):
+    """
+    Refresh in the background, symbols that are already scheduled are skipped.
+    Returns the Future or None if there was nothing to do.
+    """
+    provider = provider or backend_market_data.get_provider()
+    with _lock:
+        price_symbols = [s for s in dict.fromkeys(price_symbols) if ("price", s) not in _inflight]
+        info_symbols = [s for s in dict.fromkeys(info_symbols) if ("info", s) not in _inflight]
+        keys = {("price", s) for s in price_symbols} | {("info", s) for s in info_symbols}
+        if not keys:
+            return None
+        _inflight.update(keys)
+
+    def run():
+        try:
+            refresh(price_symbols, info_symbols, provider)
+        except Exception as e:
+            print(f"Background refresh failed: {e}")
+        finally:
+            with _lock:
+                _inflight.difference_update(keys)
+
+    return _executor.submit(run)
+
+
+@backend_perf.timed()
+def get_quotes(tickers, currencies, provider=None, wait_for_missing=True):
+    """
+    Price and fundamentals per ticker from the persistent cache (stale-while-revalidate).
+    Stale values are returned right away and refreshed in the background. Only symbols that were
+    never fetched are loaded before returning, there is nothing to serve for them yet.
+    Args:
+    - tickers, currencies: broker tickers and their trading currency (same length)
+    - wait_for_missing: False returns None for never fetched symbols and loads them in the background
+    Returns: (DataFrame indexed by Ticker with the KPI columns, {ticker: last error} for failing symbols)
+    """
+    pairs = list(dict.fromkeys(zip(tickers, currencies)))
+    symbols = {pair: backend_symbols.resolve_symbol(*pair) for pair in pairs}
+    unique = list(dict.fromkeys(symbols.values()))
+
+    # symbols the provider doesn't know (symbol index) are not fetched, not even once
+    failed = backend_symbols.failed_symbols(unique)
+    cache = backend_sqlite.get_quote_cache(unique)
+    missing = [symbol for symbol in unique if symbol not in cache.index and symbol not in failed]
+    if missing and wait_for_missing:
+        refresh(missing, missing, provider)
+        cache = backend_sqlite.get_quote_cache(unique)
+    stale_prices, stale_infos = stale_symbols(cache, [symbol for symbol in unique if symbol not in failed])
+    backend_perf.count("quotes.missing", len(missing))
+    backend_perf.count("quotes.stale", len(set(stale_prices) | set(stale_infos)))
+    if stale_prices or stale_infos:
+        schedule_refresh(stale_prices, stale_infos, provider)
+
+    cache = cache.reindex(unique)
+    quotes = cache.reindex([symbols[pair] for pair in pairs])[backend_sqlite.KPI_COLUMNS]
+    quotes.index = pd.Index([ticker for ticker, _ in pairs], name="Ticker")
+    quotes = quotes[~quotes.index.duplicated(keep="last")]
+    errors = {ticker: cache.loc[symbol, "last_error"] for (ticker, _), symbol in symbols.items()
+              if pd.notna(cache.loc[symbol, "last_error"])}
+    errors.update({ticker: f"unknown symbol {symbol}" for (ticker, _), symbol in symbols.items() if symbol in failed})
+    return quotes, errors
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import backend_cache
+import backend_perf
+import backend_history
+import backend_sqlite
+
+BASE_CURRENCY = "CHF"
+
+# Crypto currencies are quoted in USD on Yahoo and chained over USD
+CRYPTO_CURRENCIES = {"BTC", "XBT", "ETH", "ADA", "SOL", "DOT", "LTC", "XRP", "LINK", "AVAX", "ALGO"}
+CRYPTO_SYMBOLS = {"XBT": "BTC-USD"}
+
+# Minor units: quoted in pence/cents of the major currency
+SUBUNITS = {"GBp": ("GBP", 0.01), "GBX": ("GBP", 0.01), "ZAc": ("ZAR", 0.01), "ILA": ("ILS", 0.01)}
+
+
+def _pair_start(start):
+    # round down to the year so different start dates share one cache entry
+    return None if start is None else pd.Timestamp(start).to_period("Y").start_time
+
+
+def _load_close(symbol, start):
+    hist = backend_history.get_history_range(symbol, start=start, interval="1d", columns=["Close"])
+    close = hist["Close"].dropna()
+    close.index = close.index.normalize()
+    return close[~close.index.duplicated(keep="last")]
+
+
+@backend_cache.cached(ttl=3600)
+def get_fx_series(currency, target=BASE_CURRENCY, start=None):
+    """
+    Daily exchange rates currency -> target as Series indexed by date (1 currency = x target)
+    Args:
+    - currency: ISO code (USD, GBP, SEK), crypto code (BTC, ETH) or minor unit (GBp)
+    - target: ISO code of the target currency
+    - start: first date needed, None for the full history
+    """
+    start = _pair_start(start)
+    if currency in SUBUNITS:
+        major, factor = SUBUNITS[currency]
+        return get_fx_series(major, target, start) * factor
+    if currency == target:
+        return pd.Series(dtype=float)
+    if currency in CRYPTO_CURRENCIES:
+        usd = _load_close(CRYPTO_SYMBOLS.get(currency, f"{currency}-USD"), start)
+        if target == "USD":
+            return usd
+        usd_target = get_fx_series("USD", target, start)
+        return _align(usd, usd_target).prod(axis=1)
+    return _load_close(f"{currency}{target}=X", start)
+
+
+def fx_symbols(currency, target=BASE_CURRENCY):
+    """
+    History symbols get_fx_series reads for currency -> target (to prefetch them)
+    """
+    if currency in SUBUNITS:
+        currency = SUBUNITS[currency][0]
+    if currency == target:
+        return []
+    if currency in CRYPTO_CURRENCIES:
+        crypto = CRYPTO_SYMBOLS.get(currency, f"{currency}-USD")
+        return [crypto] if target == "USD" else [crypto] + fx_symbols("USD", target)
+    return [f"{currency}{target}=X"]
+
+
+def stored_rates(currencies, target=BASE_CURRENCY):
+    """
+    Latest rate per currency from the stored daily closes only: nothing is downloaded or written, for
+    loops that must not block (backend_live). Returns {currency: rate}, NaN if a pair was never loaded
+    """
+    chains = {currency: fx_symbols(currency, target) for currency in dict.fromkeys(currencies)}
+    closes = backend_sqlite.get_last_closes(list(dict.fromkeys(s for chain in chains.values() for s in chain)))
+    rates = {}
+    for currency, chain in chains.items():
+        factor = SUBUNITS[currency][1] if currency in SUBUNITS else 1.0
+        rates[currency] = factor * float(np.prod([closes.get(symbol, np.nan) for symbol in chain]))
+    return rates
+
+
+def _align(*series):
+    """
+    Outer join of the series on date, gaps are filled with the last known rate
+    """
+    return pd.concat(series, axis=1).sort_index().ffill().dropna()
+
+
+def _asof(rates, dates):
+    """
+    Rate on or before each date (vectorized as-of lookup), dates before the first rate get the first rate
+    """
+    idx = rates.index.searchsorted(dates, side="right") - 1
+    return rates.to_numpy()[np.clip(idx, 0, None)]
+
+
+def get_fx_rate(currency, date=None, target=BASE_CURRENCY):
+    """
+    Exchange rate currency -> target on date (last known rate on or before), latest rate if date is None
+    """
+    if currency == target:
+        return 1.0
+    date = pd.Timestamp(date) if date is not None else None
+    rates = get_fx_series(currency, target, start=date - pd.DateOffset(days=7) if date is not None else pd.Timestamp("today") - pd.DateOffset(days=7))
+    if rates.empty:
+        return None
+    if date is None:
+        return float(rates.iloc[-1])
+    return float(_asof(rates, pd.DatetimeIndex([date]))[0])
+
+
+def get_rates(currency, dates, target=BASE_CURRENCY):
+    """
+    Rates currency -> target as of each date (array, same length as dates), NaN if the pair has no data
+    """
+    dates = pd.DatetimeIndex(dates)
+    if currency == target:
+        return np.ones(len(dates))
+    if len(dates) == 0:
+        return np.zeros(0)
+    series = get_fx_series(currency, target, start=dates.min() - pd.DateOffset(days=7))
+    if series.empty:
+        return np.full(len(dates), np.nan)
+    return _asof(series, dates.normalize())
+
+
+@backend_perf.timed()
+def convert(amounts, currencies, dates=None, target=BASE_CURRENCY):
+    """
+    Convert a column of amounts to target currency with one rate series per currency
+    Args:
+    - amounts: Series of amounts
+    - currencies: Series (same index) or single currency code
+    - dates: Series of dates for historical conversion, None for the latest rates
+    Returns: Series of converted amounts, NaN where no rate is known
+    """
+    amounts = pd.to_numeric(pd.Series(amounts), errors="coerce")
+    if isinstance(currencies, str):
+        currencies = pd.Series(currencies, index=amounts.index)
+    if dates is not None:
+        dates = pd.to_datetime(pd.Series(dates, index=amounts.index)).dt.normalize()
+
+    rates = pd.Series(np.nan, index=amounts.index)
+    for currency, idx in currencies.groupby(currencies, sort=False).groups.items():
+        if dates is None:
+            rates[idx] = get_rates(currency, [pd.Timestamp("today")], target)[0]
+        else:
+            rates[idx] = get_rates(currency, dates[idx], target)
+    return amounts * rates
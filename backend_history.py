@@ -0,0 +1,143 @@
+import pandas as pd
+import backend_sqlite
+import backend_market_data
+import backend_symbols
+import backend_snapshots
+import backend_perf
+
+# Sentinel start of a range that was downloaded with period="max"
+MAX_START = "1900-01-01 00:00:00"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+PERIOD_OFFSETS = {
+    "1d": pd.DateOffset(days=5),  # intraday: last session, sliced after reading
+    "5d": pd.DateOffset(days=5),
+    "1wk": pd.DateOffset(weeks=1),
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+    "20y": pd.DateOffset(years=20),
+}
+
+# Coarse intervals are aggregated from the stored daily bars, no extra download
+RESAMPLED_INTERVALS = {"1wk": "W-MON", "1mo": "MS"}
+OHLCV_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+# How old the last bar may be before the right edge is downloaded again
+MAX_AGE = {
+    "1m": pd.Timedelta(minutes=1),
+    "15m": pd.Timedelta(minutes=15),
+    "1d": pd.Timedelta(hours=1),
+}
+
+# First downloads that failed are not tried again before FAILED_RETRY: (symbol, interval) -> retry time
+FAILED_RETRY = pd.Timedelta(minutes=15)
+_failed = {}
+
+
+def _download(symbol, interval, start, end, provider):
+    """
+    Download [start, end) from the provider and store it. start=None means period="max".
+    Returns False if the provider failed.
+    """
+    backend_perf.count("provider.calls")
+    try:
+        with backend_perf.span("provider.history", symbol=symbol, interval=interval):
+            if start is None:
+                df = provider.history(symbol, period="max", interval=interval)
+            else:
+                df = provider.history(symbol, interval=interval, start=start, end=end)
+    except Exception as e:
+        print(f"Error downloading history for {symbol} ({interval}): {e}")
+        return False
+    if df is not None and not df.empty:
+        df = df[[col for col in OHLCV_AGG if col in df.columns]]
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        backend_sqlite.upsert_price_history(symbol, interval, df)
+    return True
+
+
+def fill_gaps(symbol, interval, start=None, provider=None):
+    """
+    Make sure [start, now] is stored for (symbol, interval). Only the missing ranges are requested
+    from the provider: before the stored range, and the last bar if it is older than MAX_AGE.
+    Args:
+    - start: pd.Timestamp or None for the full history
+    """
+    if backend_symbols.is_failed(symbol):
+        # unknown to the provider (symbol index), don't try until the next validation
+        return
+    provider = provider or backend_market_data.get_provider()
+    now = pd.Timestamp.now().floor("s")
+    fetch_end = now.normalize() + pd.DateOffset(days=1)  # provider end is exclusive
+    coverage = backend_sqlite.get_history_coverage(symbol, interval)
+
+    if coverage is None:
+        if _failed.get((symbol, interval), pd.Timestamp.min) > now:
+            return
+        if not _download(symbol, interval, start, fetch_end, provider):
+            # negative cache: nothing stored and the provider failed, don't ask again on every read
+            _failed[(symbol, interval)] = now + FAILED_RETRY
+            return
+        _failed.pop((symbol, interval), None)
+        cov_start = MAX_START if start is None else start.strftime(DATE_FORMAT)
+        backend_sqlite.set_history_coverage(symbol, interval, cov_start, now.strftime(DATE_FORMAT), now.strftime(DATE_FORMAT))
+        return
+
+    cov_start = coverage["start"]
+    if start is None and cov_start != MAX_START:
+        if _download(symbol, interval, None, pd.Timestamp(cov_start), provider):
+            cov_start = MAX_START
+    elif start is not None and start.strftime(DATE_FORMAT) < cov_start:
+        if _download(symbol, interval, start, pd.Timestamp(cov_start) + pd.DateOffset(days=1), provider):
+            cov_start = start.strftime(DATE_FORMAT)
+
+    cov_end, fetched_at = coverage["end"], coverage["fetched_at"]
+    if now - pd.Timestamp(fetched_at) > MAX_AGE.get(interval, MAX_AGE["1d"]):
+        # re-download from the start of the last stored day, the last bar may have been incomplete
+        if _download(symbol, interval, pd.Timestamp(cov_end).normalize(), fetch_end, provider):
+            cov_end = fetched_at = now.strftime(DATE_FORMAT)
+    backend_sqlite.set_history_coverage(symbol, interval, cov_start, cov_end, fetched_at)
+
+
+@backend_perf.timed()
+def get_history_range(ticker, start=None, end=None, interval="1d", provider=None, columns=None):
+    """
+    OHLCV bars of ticker in [start, end] from the local store, missing ranges are downloaded first
+    Args:
+    - columns: subset of the OHLCV columns to read (must include Close), default all
+    """
+    base_interval = "1d" if interval in RESAMPLED_INTERVALS else interval
+    start = pd.Timestamp(start) if start is not None else None
+    fill_gaps(ticker, base_interval, start, provider)
+    hist = backend_snapshots.read_price_history(
+        ticker, base_interval,
+        start=start.strftime(DATE_FORMAT) if start is not None else None,
+        end=pd.Timestamp(end).strftime(DATE_FORMAT) if end is not None else None,
+        columns=columns,
+    )
+    if interval in RESAMPLED_INTERVALS and not hist.empty:
+        agg = {col: how for col, how in OHLCV_AGG.items() if col in hist.columns}
+        hist = hist.resample(RESAMPLED_INTERVALS[interval], label="left", closed="left").agg(agg).dropna(subset=["Close"])
+    return hist
+
+
+def get_history(ticker, period="1mo", interval="1d", provider=None):
+    """
+    Same as yf.Ticker(ticker).history(period=period, interval=interval), served from the local store
+    """
+    if period == "max":
+        start = None
+    else:
+        start = pd.Timestamp.now().normalize() - PERIOD_OFFSETS.get(period, PERIOD_OFFSETS["1mo"])
+    hist = get_history_range(ticker, start=start, interval=interval, provider=provider)
+    if period == "1d" and not hist.empty:
+        # only the last trading session
+        hist = hist[hist.index.normalize() == hist.index[-1].normalize()]
+    return hist
+
@@ -0,0 +1,90 @@
+import threading
+import numpy as np
+import pandas as pd
+import backend_perf
+import backend_sqlite
+
+# Point-in-time holdings from the persisted holdings index (holdings_index table, updated on every
+# insert by backend_sqlite.apply_position_deltas; lookups read it as stored and never write). The
+# index is held in memory as one array sorted by (ticker, date); the state of every ticker at every
+# requested date is found with a single searchsorted over all tickers, no pass over the transactions.
+
+FIELDS = ["quantity", "cost_basis", "bought", "sold"]
+
+_lock = threading.Lock()
+_state = {"key": None, "index": None}
+
+
+class HoldingsIndex:
+    """
+    Sorted running totals of all tickers. Keys are (ticker code, seconds since the first date) packed
+    into one int64, so the rows of one ticker form a contiguous sorted block.
+    """
+    def __init__(self, rows: pd.DataFrame):
+        codes, tickers = pd.factorize(rows["Ticker"], sort=True)
+        seconds = pd.DatetimeIndex(pd.to_datetime(rows["date"])).as_unit("s").asi8 if len(rows) else np.zeros(0, np.int64)
+        self.tickers = pd.Index(tickers, name="Ticker")
+        self.origin = int(seconds.min()) if len(rows) else 0
+        self.span = int(seconds.max()) - self.origin + 2 if len(rows) else 2
+        keys = codes.astype(np.int64) * self.span + (seconds - self.origin)
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.codes = keys[order], codes[order]
+        self.values = {field: rows[field].to_numpy(dtype=float)[order] for field in FIELDS}
+
+    def lookup(self, dates, tickers=None):
+        """
+        Row of the last index entry on or before each date for each ticker (-1: nothing yet)
+        Returns (rows as array dates x tickers, the tickers)
+        """
+        tickers = self.tickers if tickers is None else pd.Index(tickers, name="Ticker")
+        codes = self.tickers.get_indexer(tickers)
+        seconds = pd.DatetimeIndex(dates).floor("s").as_unit("s").asi8 - self.origin
+        # before the first date: -1 lands in the previous ticker's block, after the last: the last slot
+        offset = np.clip(seconds, -1, self.span - 1)
+        query = codes.astype(np.int64)[None, :] * self.span + offset[:, None]
+        if not len(self.keys):
+            return np.full(query.shape, -1), tickers
+        rows = np.searchsorted(self.keys, query.ravel(), side="right").reshape(query.shape) - 1
+        valid = (rows >= 0) & (codes[None, :] >= 0) & (self.codes[np.clip(rows, 0, None)] == codes[None, :])
+        return np.where(valid, rows, -1), tickers
+
+    def at(self, dates, tickers=None, field="quantity"):
+        rows, tickers = self.lookup(dates, tickers)
+        values = self.values[field][np.clip(rows, 0, None)] if len(self.keys) else np.zeros(rows.shape)
+        return pd.DataFrame(np.where(rows >= 0, values, 0.0), index=pd.DatetimeIndex(dates), columns=tickers)
+
+
+def load_index():
+    """
+    The holdings index in memory, reloaded when the holdings_index data version changed
+    """
+    key = (backend_sqlite.DB_URLS["portfolio"], backend_sqlite.data_version("holdings_index"))
+    with _lock:
+        if _state["key"] != key:
+            backend_perf.count("holdings.reload")
+            _state["index"] = HoldingsIndex(backend_sqlite.get_holdings_index(apply_pending=False))
+            _state["key"] = key
+        return _state["index"]
+
+
+@backend_perf.timed()
+def holdings_at(dates, tickers=None, field="quantity"):
+    """
+    Holdings of every ticker at every date in one vectorized lookup: the state after all transactions
+    up to and including the date (a date without time means midnight, like holdings_matrix)
+    Args:
+    - dates: sorted or unsorted dates (anything pd.DatetimeIndex accepts)
+    - tickers: tickers to return, default all (unknown tickers hold 0)
+    - field: 'quantity', 'cost_basis' (weighted-average, incl. fees), 'bought' or 'sold' (cumulative)
+    Returns DataFrame dates x tickers
+    """
+    return load_index().at(dates, tickers, field)
+
+
+def positions_at(date, tickers=None):
+    """
+    Quantity, cost basis and cumulative bought/sold quantities of every ticker at one date
+    Returns DataFrame indexed by Ticker with FIELDS
+    """
+    index = load_index()
+    return pd.DataFrame({field: index.at([date], tickers, field).iloc[0] for field in FIELDS})
@@ -0,0 +1,212 @@
+import io
+import time
+import zipfile
+import multiprocessing
+import concurrent.futures
+from pathlib import Path
+import pandas as pd
+import backend_perf
+import backend_sqlite
+import backend_snapshots
+
+# Bulk import of broker exports: a directory, a zip archive or uploaded files are parsed in a process
+# pool, each file by the adapter of its broker (detected from the header), and committed in large
+# batches. Duplicates (overlapping monthly exports, files imported twice) are skipped by tx_hash.
+
+REPORT_COLUMNS = ["file", "broker", "rows", "inserted", "duplicates", "parse_s", "error"]
+BATCH_ROWS = 200_000  # rows per database transaction
+
+
+class BrokerAdapter:
+    """
+    How to read the exports of one broker
+    Args:
+    - name: broker name, stored as platform if the export has none
+    - required_columns: header columns that identify an export of this broker
+    - normalize: function(raw DataFrame of strings) -> DataFrame in the transactions schema
+    - date_format: strftime format of the export's dates, parsed vectorized (rows that don't match
+      fall back to backend_positions.parse_dates, which goes row by row for non-ISO dates)
+    - read_options: options for pd.read_csv (sep, encoding, ...)
+    """
+    def __init__(self, name, required_columns, normalize, date_format=None, **read_options):
+        self.name = name
+        self.required_columns = list(required_columns)
+        self.normalize = normalize
+        self.date_format = date_format
+        self.read_options = read_options
+
+    def matches(self, header):
+        try:
+            columns = pd.read_csv(io.BytesIO(header), nrows=0, **self.read_options).columns
+        except Exception:
+            return False
+        return all(col in columns for col in self.required_columns)
+
+    def parse(self, data):
+        raw = pd.read_csv(io.BytesIO(data), dtype=str, **self.read_options)
+        df = self.normalize(raw)
+        if "platform" not in df.columns:
+            df["platform"] = self.name
+        if self.date_format:
+            parsed = pd.to_datetime(df["date"], format=self.date_format, errors="coerce")
+            df["date"] = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").where(parsed.notna(), df["date"])
+        df["date"] = backend_sqlite.to_iso_dates(df["date"])
+        return df
+
+
+def _normalize_transactions(df):
+    # export of the transactions table itself (e.g. a backup), only types are restored
+    df = df[[col for col in backend_sqlite.TRANSACTION_COLUMNS if col in df.columns]].copy()
+    for col in backend_sqlite.NUMERIC_TRANSACTION_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+# Registry of the known brokers, checked in order. Add a broker with register_adapter(BrokerAdapter(...)).
+ADAPTERS = {}
+
+
+def register_adapter(adapter):
+    ADAPTERS[adapter.name] = adapter
+    return adapter
+
+
+register_adapter(BrokerAdapter("Yuh", backend_sqlite.YUH_REQUIRED_COLUMNS, backend_sqlite._normalize_yuh_chunk,
+                               date_format="%d/%m/%Y %H:%M", sep=";", on_bad_lines="skip"))
+register_adapter(BrokerAdapter("Transactions", ["date", "buy_sell", "quantity", "Ticker", "price_per_unit"],
+                               _normalize_transactions, sep=","))
+
+
+def detect_adapter(data):
+    """
+    Adapter whose required columns are all in the header of the file, None if no broker matches
+    """
+    header = data.split(b"\n", 1)[0]
+    return next((adapter for adapter in ADAPTERS.values() if adapter.matches(header)), None)
+
+
+def collect_sources(path):
+    """
+    CSV files of a directory (recursive) or a zip archive, sorted by name, as (name, loader) sources
+    that the pool workers open themselves
+    """
+    path = Path(path)
+    if path.is_dir():
+        return [(str(p.relative_to(path)), ("file", str(p))) for p in sorted(path.rglob("*")) if p.suffix.lower() == ".csv"]
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = sorted(name for name in archive.namelist() if name.lower().endswith(".csv"))
+        return [(name, ("zip", str(path), name)) for name in members]
+    return [(path.name, ("file", str(path)))]
+
+
+def upload_sources(files):
+    """
+    Sources of uploaded files (name + bytes), zip uploads are unpacked
+    Args:
+    - files: objects with .name and .getvalue() like streamlit's UploadedFile
+    """
+    sources = []
+    for file in files:
+        data = file.getvalue()
+        if file.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                sources += [(name, ("bytes", archive.read(name))) for name in sorted(archive.namelist())
+                            if name.lower().endswith(".csv")]
+        else:
+            sources.append((file.name, ("bytes", data)))
+    return sources
+
+
+def _read(source):
+    kind = source[0]
+    if kind == "file":
+        return Path(source[1]).read_bytes()
+    if kind == "zip":
+        with zipfile.ZipFile(source[1]) as archive:
+            return archive.read(source[2])
+    return source[1]
+
+
+def parse_source(name, source, broker=None):
+    """
+    Parse one file into the transactions schema with tx_hash, runs in the pool workers.
+    Returns (name, broker, DataFrame or None, seconds, error)
+    """
+    started = time.perf_counter()
+    try:
+        data = _read(source)
+        adapter = ADAPTERS[broker] if broker else detect_adapter(data)
+        if adapter is None:
+            return name, None, None, time.perf_counter() - started, "Unbekanntes Format (kein Broker erkannt)"
+        df = adapter.parse(data)
+        # hashes per file: identical rows in one export are distinct orders, the same row in an
+        # overlapping export is the same transaction and skipped on insert
+        df["tx_hash"] = backend_sqlite.transaction_hashes(df)
+        return name, adapter.name, df, time.perf_counter() - started, None
+    except Exception as e:
+        return name, broker, None, time.perf_counter() - started, str(e)
+
+
+def _parse_all(sources, broker, max_workers):
+    if max_workers <= 1 or len(sources) <= 1:
+        return [parse_source(name, source, broker) for name, source in sources]
+    # spawn: forking the (threaded) dashboard process is not safe
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        return list(pool.map(parse_source, *zip(*sources), [broker] * len(sources)))
+
+
+@backend_perf.timed()
+def import_sources(sources, broker=None, max_workers=None, batch_rows=BATCH_ROWS):
+    """
+    Parse the sources in parallel and insert them in batched transactions (in file name order)
+    Args:
+    - sources: list of (name, source) from collect_sources or upload_sources
+    - broker: adapter name for all files, None to detect it per file
+    - max_workers: processes, default one per CPU (at most one per file)
+    Returns the report per file (REPORT_COLUMNS)
+    """
+    max_workers = max_workers or min(len(sources), multiprocessing.cpu_count())
+    parsed = _parse_all(sources, broker, max_workers)
+
+    engine = backend_sqlite.get_engine("portfolio")
+    backend_sqlite.ensure_schema(engine, backend_sqlite.PORTFOLIO_MIGRATIONS)
+    report = []
+    batch, batch_size = [], 0
+
+    def commit(batch):
+        with engine.begin() as conn:
+            for entry, df in batch:
+                entry["inserted"] = backend_sqlite._insert_or_ignore(conn, df)
+                entry["duplicates"] = len(df) - entry["inserted"]
+
+    for name, adapter, df, seconds, error in parsed:
+        entry = {"file": name, "broker": adapter, "rows": 0 if df is None else len(df), "inserted": 0,
+                 "duplicates": 0, "parse_s": round(seconds, 3), "error": error}
+        report.append(entry)
+        if df is None:
+            continue
+        batch.append((entry, df))
+        batch_size += len(df)
+        if batch_size >= batch_rows:
+            commit(batch)
+            batch, batch_size = [], 0
+    if batch:
+        commit(batch)
+    backend_sqlite.apply_position_deltas(engine)
+    # only the new rows are appended to the Parquet snapshot
+    backend_snapshots.refresh(("transactions", "positions"))
+
+    report = pd.DataFrame(report, columns=REPORT_COLUMNS)
+    print(f"Imported {report['inserted'].sum()} new transactions from {len(report)} files, "
+          f"{report['duplicates'].sum()} duplicates, {report['error'].notna().sum()} errors")
+    return report
+
+
+def import_path(path, broker=None, max_workers=None):
+    """
+    Import all CSV exports of a directory or zip archive (or a single file)
+    """
+    return import_sources(collect_sources(path), broker=broker, max_workers=max_workers)
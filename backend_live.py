@@ -0,0 +1,244 @@
+import time
+import asyncio
+import threading
+import numpy as np
+import pandas as pd
+import backend_sqlite
+import backend_market_data
+import backend_symbols
+import backend_fx
+import backend_positions
+import backend_perf
+
+# Live mode: an asyncio loop (in a background thread) polls only the latest quotes of the held and
+# watched symbols, a few batched provider requests per tick. Prices that changed get the sequence
+# number of the tick; a view asks for the rows changed since the number it has seen and updates only
+# those (several ticks between two reads coalesce into the latest value per ticker). The loop only
+# reads what is stored (see LiveQuotes.sync) and writes nothing, refresh_worker.py keeps persisting
+# the prices.
+
+LIVE_COLUMNS = ["Name", "Current Price", "Value (CHF)", "Profit/Loss", "Profit/Loss (%)", "Change (%)"]
+
+
+class LiveQuotes:
+    """
+    Latest prices, value and P&L of the positions and watchlist, updated by polling the provider
+    Args:
+    - provider: MarketDataProvider with latest_quotes, default the configured provider
+    - interval: seconds between two ticks; a tick that runs late skips the missed ones
+    - batch_size: symbols per provider request
+    - rate: provider requests per second at most
+    - max_concurrent: requests in flight at the same time
+    - idle_timeout: seconds without a reader after which the loop stops
+    """
+    def __init__(self, provider=None, interval=5.0, batch_size=50, rate=2.0, max_concurrent=2, idle_timeout=120.0):
+        self.provider = provider or backend_market_data.get_provider()
+        self.interval = interval
+        self.batch_size = batch_size
+        self.min_gap = 1.0 / rate
+        self.max_concurrent = max_concurrent
+        self.idle_timeout = idle_timeout
+        self.seq = 0
+        self.reload_seq = 0
+        self.stats = {"ticks": 0, "skipped_ticks": 0, "provider_calls": 0, "errors": 0, "changed": 0,
+                      "last_tick": None, "last_tick_ms": 0.0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._versions = None
+        self._next_call = 0.0
+        self._last_read = time.monotonic()
+        self.sync()
+
+    # --- targets ---
+    def sync(self):
+        """
+        (Re)load the positions and watchlist when they changed, keeps the live prices of known tickers.
+        Read only: the materialized positions as they are, start prices from the quote cache, FX rates
+        from the stored closes (no provider call, no write); runs off the event loop (asyncio.to_thread).
+        """
+        versions = backend_sqlite.data_versions(("transactions", "current_positions", "watchlist"))
+        if versions == self._versions:
+            return False
+        positions = backend_sqlite.get_current_positions(apply_pending=False)
+        positions = positions[positions["Quantity"] > backend_positions.EPS]
+        watchlist = backend_sqlite.get_watchlist()
+        watched = watchlist[~watchlist["Ticker"].isin(positions["Ticker"])]
+        targets = pd.DataFrame({
+            "Ticker": pd.concat([positions["Ticker"], watched["Ticker"]], ignore_index=True),
+            "Name": pd.concat([positions["Name"], watched["Name"]], ignore_index=True),
+            "Currency": pd.concat([positions["Currency"], watched["Currency"]], ignore_index=True),
+            "Quantity": np.concatenate([positions["Quantity"].to_numpy(float), np.zeros(len(watched))]),
+            "Buy Price": np.concatenate([positions["Buy Price"].to_numpy(float), np.full(len(watched), np.nan)]),
+            "Stored Price": np.concatenate([positions["Current Price"].to_numpy(float), np.full(len(watched), np.nan)]),
+        }).drop_duplicates("Ticker").reset_index(drop=True)
+        symbols = [backend_symbols.resolve_symbol(t, c) for t, c in zip(targets["Ticker"], targets["Currency"])]
+        failed = backend_symbols.failed_symbols(symbols)
+        cached = backend_sqlite.get_quote_cache(symbols)["Current Price"]
+        start_price = pd.Series(symbols).map(cached).astype(float).fillna(targets["Stored Price"]).to_numpy(copy=True)
+        rates = backend_fx.stored_rates(targets["Currency"])
+        fx = np.nan_to_num(targets["Currency"].map(rates).to_numpy(float), nan=1.0)
+
+        with self._lock:
+            price = start_price
+            open_price = price.copy()
+            previous = getattr(self, "targets", None)
+            if previous is not None:
+                # live prices (and the price the live mode started with) survive a reload
+                live = targets["Ticker"].map(pd.Series(self.price, index=previous["Ticker"])).to_numpy(float)
+                opened = targets["Ticker"].map(pd.Series(self.open_price, index=previous["Ticker"])).to_numpy(float)
+                price = np.where(np.isnan(live), price, live)
+                open_price = np.where(np.isnan(opened), open_price, opened)
+            self.targets = targets
+            self.symbols = np.array(symbols, dtype=object)
+            self.active = ~np.isin(self.symbols, list(failed))
+            self.fx = fx
+            self.price = price
+            self.open_price = open_price
+            self.held = targets["Quantity"].to_numpy() > backend_positions.EPS
+            self.total = float(np.nansum((self.price * fx * targets["Quantity"].to_numpy())[self.held]))
+            # a reload replaces every row
+            self.seq += 1
+            self.reload_seq = self.seq
+            self.changed_seq = np.full(len(targets), self.seq)
+            self._versions = versions
+        return True
+
+    # --- polling ---
+    async def _slot(self):
+        # rate limit: reserve the next free start time (one event loop, no lock needed)
+        now = time.monotonic()
+        start = max(now, self._next_call)
+        self._next_call = start + self.min_gap
+        await asyncio.sleep(start - now)
+
+    async def _fetch(self, symbols, semaphore):
+        async def one(batch):
+            async with semaphore:
+                await self._slot()
+                self.stats["provider_calls"] += 1
+                try:
+                    return await asyncio.to_thread(self.provider.latest_quotes, batch)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Live quotes failed for {len(batch)} symbols: {e}")
+                    return {}
+
+        batches = [symbols[i:i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
+        quotes = {}
+        for result in await asyncio.gather(*(one(batch) for batch in batches)):
+            quotes.update(result)
+        return quotes
+
+    async def tick(self, semaphore=None):
+        """
+        One poll: latest quotes of all active symbols, changed prices get a new sequence number
+        Returns the number of changed rows
+        """
+        started = time.perf_counter()
+        await asyncio.to_thread(self.sync)
+        symbols = list(dict.fromkeys(self.symbols[self.active]))
+        quotes = await self._fetch(symbols, semaphore or asyncio.Semaphore(self.max_concurrent))
+
+        with self._lock:
+            new = np.array([quotes.get(symbol, np.nan) for symbol in self.symbols], dtype=float)
+            changed = ~np.isnan(new) & (np.isnan(self.price) | (new != self.price))
+            if changed.any():
+                self.seq += 1
+                quantity = self.targets["Quantity"].to_numpy()
+                # total value by the deltas of the changed held rows only
+                delta = (new - np.nan_to_num(self.price)) * self.fx * quantity
+                self.total += float(delta[changed & self.held].sum())
+                self.price[changed] = new[changed]
+                self.open_price = np.where(np.isnan(self.open_price), self.price, self.open_price)
+                self.changed_seq[changed] = self.seq
+            self.stats["ticks"] += 1
+            self.stats["changed"] += int(changed.sum())
+            self.stats["last_tick"] = pd.Timestamp.now().floor("s")
+            self.stats["last_tick_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        backend_perf.count("live.ticks")
+        return int(changed.sum())
+
+    async def run(self):
+        """
+        Tick every interval until stop() or no reader for idle_timeout seconds
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        next_tick = time.monotonic()
+        while not self._stop.is_set() and time.monotonic() - self._last_read < self.idle_timeout:
+            try:
+                await self.tick(semaphore)
+            except Exception as e:
+                # keep the loop alive, the next tick may succeed
+                self.stats["errors"] += 1
+                print(f"Live tick failed: {e}")
+            next_tick += self.interval
+            now = time.monotonic()
+            if now > next_tick:
+                # coalesce: the overdue ticks are not run one after another
+                missed = int((now - next_tick) // self.interval) + 1
+                self.stats["skipped_ticks"] += missed
+                next_tick += missed * self.interval
+            await asyncio.sleep(next_tick - now)
+
+    def start(self):
+        """
+        Run the loop in a daemon thread (no-op if it is running)
+        """
+        if self.running():
+            return self
+        self._stop.clear()
+        self._last_read = time.monotonic()
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="live-quotes", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- readers ---
+    def changes_since(self, seq=-1):
+        """
+        Rows changed after sequence number seq (-1: all rows)
+        Returns (DataFrame indexed by Ticker with LIVE_COLUMNS and held, current sequence number, total
+        value of the positions in CHF, whether the rows replace all rows seen so far)
+        """
+        self._last_read = time.monotonic()
+        with self._lock:
+            full = seq < self.reload_seq
+            rows = np.flatnonzero(self.changed_seq > seq) if not full else np.arange(len(self.price))
+            price = self.price[rows]
+            quantity = self.targets["Quantity"].to_numpy()[rows]
+            buy = self.targets["Buy Price"].to_numpy()[rows]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                changes = pd.DataFrame({
+                    "Ticker": self.targets["Ticker"].to_numpy()[rows],
+                    "Name": self.targets["Name"].to_numpy()[rows],
+                    "Current Price": price,
+                    "Value (CHF)": price * self.fx[rows] * quantity,
+                    "Profit/Loss": (price - buy) * quantity,
+                    "Profit/Loss (%)": (price - buy) / buy * 100,
+                    "Change (%)": (price / self.open_price[rows] - 1) * 100,
+                    "held": self.held[rows],
+                }).set_index("Ticker")
+            return changes, self.seq, self.total, full
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_feed(interval=5.0, provider=None) -> LiveQuotes:
+    """
+    Running live feed of the configured portfolio, shared by all dashboard sessions. Started on first
+    use and again after it stopped for lack of readers.
+    """
+    key = (backend_sqlite.DB_URLS["portfolio"], interval)
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = _feeds[key] = LiveQuotes(provider=provider, interval=interval)
+        return feed.start()
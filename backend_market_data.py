@@ -0,0 +1,362 @@
+import time
+import zlib
+import threading
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import backend_perf
+
+
+def info_to_quote(info, price=None):
+    """
+    Convert a provider info dict to the quote columns
+    """
+    if price is None:
+        price = info.get("currentPrice", info.get("regularMarketPrice"))
+    revenue_growth = info.get("revenueGrowth")
+    return {
+        "Current Price": price,
+        "Price/Book": info.get("priceToBook"),
+        "PE Ratio": info.get("trailingPE"),
+        "Market Cap": info.get("marketCap"),
+        "PEG Ratio": info.get("pegRatio"),
+        "Beta": info.get("beta"),
+        "Free Cash Flow": info.get("freeCashflow"),
+        "Revenue Growth YoY (%)": revenue_growth * 100 if revenue_growth else None
+    }
+
+
+# --- Provider ---
+class MarketDataProvider:
+    """
+    Interface of a market data source. Symbols are already resolved provider symbols.
+    """
+    name = "base"
+
+    def download_prices(self, symbols):
+        """
+        Bulk download of the last close for all symbols, returns {symbol: price}. Missing symbols are left out.
+        """
+        raise NotImplementedError
+
+    def fetch_info(self, symbol):
+        """
+        Fundamentals of one symbol as dict (yfinance `info` keys)
+        """
+        raise NotImplementedError
+
+    def history(self, symbol, period=None, interval="1d", start=None, end=None):
+        """
+        OHLCV history of one symbol with a DatetimeIndex
+        """
+        raise NotImplementedError
+
+    def latest_quotes(self, symbols):
+        """
+        Latest (intraday) price of all symbols in one request, returns {symbol: price}. Used by the live
+        mode (backend_live), defaults to the bulk close.
+        """
+        return self.download_prices(symbols)
+
+
+def _yf():
+    # imported on first use, yfinance is slow to import and not needed for offline runs
+    import yfinance
+    return yfinance
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def download_prices(self, symbols):
+        return self._last_close(symbols, period="5d", interval="1d")
+
+    def latest_quotes(self, symbols):
+        # last 1m bar of the current session
+        return self._last_close(symbols, period="1d", interval="1m")
+
+    def _last_close(self, symbols, period, interval):
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        data = _yf().download(symbols, period=period, interval=interval, progress=False, threads=True,
+                           timeout=self.timeout, group_by="column")
+        if data is None or data.empty:
+            return {}
+        close = data["Close"]
+        if isinstance(close, pd.Series):
+            close = close.to_frame(symbols[0])
+        last = close.ffill().iloc[-1].dropna()
+        return {symbol: float(price) for symbol, price in last.items()}
+
+    def fetch_info(self, symbol):
+        return _yf().Ticker(symbol).info
+
+    def history(self, symbol, period=None, interval="1d", start=None, end=None):
+        if start is not None or end is not None:
+            return _yf().Ticker(symbol).history(start=start, end=end, interval=interval, timeout=self.timeout)
+        return _yf().Ticker(symbol).history(period=period or "1mo", interval=interval, timeout=self.timeout)
+
+
+class FakeProvider(MarketDataProvider):
+    """
+    Local offline provider for tests and benchmarks. Values are fixed by the constructor or derived
+    deterministically from the symbol and the date, so runs are reproducible without network and
+    overlapping history requests return the same bars.
+    FX pairs ('USDCHF=X') and crypto ('BTC-USD') move around realistic levels.
+    Args:
+    - prices: {symbol: current price}, overrides the generated price (history is scaled to it)
+    - infos: {symbol: info dict}, overrides the generated fundamentals
+    - failing: symbols that raise on every call
+    - delay: seconds each fetch_info call sleeps (to test timeouts)
+    """
+    name = "fake"
+
+    # value of one unit in CHF, for the FX pairs
+    FX_LEVELS = {"CHF": 1.0, "USD": 0.88, "EUR": 0.94, "GBP": 1.1, "SEK": 0.083, "NOK": 0.082, "DKK": 0.126,
+                 "JPY": 0.0059, "CAD": 0.64, "AUD": 0.58, "HKD": 0.113, "ZAR": 0.048, "ILS": 0.24}
+    CRYPTO_LEVELS = {"BTC": 60000.0, "ETH": 3000.0, "SOL": 150.0, "AVAX": 30.0, "LINK": 15.0, "LTC": 80.0}
+    EPOCH = pd.Timestamp("2000-01-01")
+
+    def __init__(self, prices=None, infos=None, failing=(), delay=0.0):
+        self.prices = dict(prices or {})
+        self.infos = dict(infos or {})
+        self.failing = set(failing)
+        self.delay = delay
+        self.calls = {"download_prices": 0, "fetch_info": 0, "history": 0, "latest_quotes": 0}
+
+    @staticmethod
+    def _seed(symbol):
+        return zlib.crc32(symbol.encode("utf-8"))
+
+    def _level(self, symbol):
+        # price level the path moves around
+        if symbol.endswith("=X") and len(symbol) == 8:
+            base, quote = symbol[:3], symbol[3:6]
+            if base in self.FX_LEVELS and quote in self.FX_LEVELS:
+                return self.FX_LEVELS[base] / self.FX_LEVELS[quote]
+        if symbol.endswith("-USD") and symbol[:-4] in self.CRYPTO_LEVELS:
+            return self.CRYPTO_LEVELS[symbol[:-4]]
+        return 10 + self._seed(symbol) % 49000 / 100
+
+    def _log_path(self, symbol, index):
+        """
+        Deterministic log deviation from the level at each timestamp: two cycles, a drift and noise
+        that only depend on (symbol, timestamp)
+        """
+        seed = self._seed(symbol)
+        t = np.asarray((pd.DatetimeIndex(index) - self.EPOCH) / pd.Timedelta(days=1), dtype=float)
+        scale = 0.1 if symbol.endswith("=X") else 1.0
+        phase1, phase2 = seed % 628 / 100, seed % 314 / 50
+        drift = (seed % 21 - 5) / 100  # -5% .. +15% per year
+        noise = np.sin(np.floor(t * 1440) * 12.9898 + seed % 1000) * 43758.5453 % 1 - 0.5
+        return scale * (0.15 * np.sin(2 * np.pi * t / 365 + phase1) + 0.05 * np.sin(2 * np.pi * t / 29 + phase2)
+                        + drift * (t - 9000) / 365 + 0.02 * noise)
+
+    def _close(self, symbol, index):
+        close = self._level(symbol) * np.exp(self._log_path(symbol, index))
+        if symbol in self.prices:
+            now = self._level(symbol) * np.exp(self._log_path(symbol, [pd.Timestamp.now().normalize()]))[0]
+            close = close * self.prices[symbol] / now
+        return close
+
+    def _price(self, symbol):
+        if symbol in self.prices:
+            return self.prices[symbol]
+        return round(float(self._close(symbol, [pd.Timestamp.now().normalize()])[0]), 4)
+
+    def download_prices(self, symbols):
+        self.calls["download_prices"] += 1
+        return {symbol: self._price(symbol) for symbol in dict.fromkeys(symbols) if symbol not in self.failing}
+
+    def latest_quotes(self, symbols):
+        self.calls["latest_quotes"] += 1
+        now = [pd.Timestamp.now().floor("min")]
+        return {symbol: self.prices.get(symbol, round(float(self._close(symbol, now)[0]), 4))
+                for symbol in dict.fromkeys(symbols) if symbol not in self.failing}
+
+    def fetch_info(self, symbol):
+        self.calls["fetch_info"] += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if symbol in self.failing:
+            raise ValueError(f"fake provider: unknown symbol {symbol}")
+        if symbol in self.infos:
+            return dict(self.infos[symbol])
+        seed = self._seed(symbol)
+        return {
+            "currentPrice": self._price(symbol),
+            "priceToBook": round(0.5 + seed % 900 / 100, 2),
+            "trailingPE": round(5 + seed % 4500 / 100, 2),
+            "marketCap": int(1e8 + seed % 10_000 * 1e7),
+            "pegRatio": round(0.2 + seed % 300 / 100, 2),
+            "beta": round(0.3 + seed % 150 / 100, 2),
+            "freeCashflow": int(seed % 5_000 * 1e6),
+            "revenueGrowth": round((seed % 60 - 20) / 100, 2),
+        }
+
+    def history(self, symbol, period=None, interval="1d", start=None, end=None):
+        self.calls["history"] += 1
+        if symbol in self.failing:
+            raise ValueError(f"fake provider: unknown symbol {symbol}")
+        freq = {"1m": "min", "15m": "15min", "1h": "h", "1d": "B", "1wk": "W-MON", "1mo": "MS"}.get(interval, "B")
+        # like yfinance: an explicit end is exclusive
+        intraday = interval in ("1m", "15m", "1h")
+        inclusive = "left" if end is not None or intraday else "both"
+        if end is None:
+            end = pd.Timestamp.now().floor("min") if intraday else pd.Timestamp("today").normalize()
+        end = pd.Timestamp(end)
+        if start is not None:
+            start = pd.Timestamp(start)
+        else:
+            offsets = {"1d": pd.DateOffset(days=1), "5d": pd.DateOffset(days=5), "1wk": pd.DateOffset(weeks=1),
+                       "1mo": pd.DateOffset(months=1), "6mo": pd.DateOffset(months=6), "1y": pd.DateOffset(years=1),
+                       "5y": pd.DateOffset(years=5), "10y": pd.DateOffset(years=10), "20y": pd.DateOffset(years=20),
+                       "max": pd.DateOffset(years=30)}
+            start = end - offsets.get(period or "1mo", pd.DateOffset(months=1))
+            if intraday and period in ("1d", None):
+                start = end.normalize() - pd.DateOffset(days=4)  # covers the last session over a weekend
+        index = pd.date_range(start, end, freq=freq, inclusive=inclusive)
+        if intraday:
+            # trading hours only, like the real intraday bars
+            index = index[(index.dayofweek < 5) & (index.hour >= 9) & (index.hour < 17)]
+        close = self._close(symbol, index)
+        volume = (self._seed(symbol) % 90_000 + 1_000) * (1 + np.abs(self._log_path(symbol + "V", index)))
+        return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                             "Volume": volume.round()}, index=index)
+
+
+class SimulatedQuoteFeed(FakeProvider):
+    """
+    Local quote feed for the live mode: at every latest_quotes call a share of the symbols moves by a
+    random step, the others keep their last price. Seeded, so test runs are reproducible. History and
+    fundamentals as FakeProvider.
+    Args:
+    - change_probability: chance that a symbol has a new price at a call
+    - volatility: standard deviation of the relative step
+    - latency: seconds each latest_quotes call sleeps (network round trip)
+    - seed: seed of the random steps
+    """
+    name = "simulated"
+
+    def __init__(self, change_probability=0.3, volatility=0.002, latency=0.0, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.change_probability = change_probability
+        self.volatility = volatility
+        self.latency = latency
+        self._rng = np.random.default_rng(seed)
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def latest_quotes(self, symbols):
+        if self.latency:
+            time.sleep(self.latency)
+        quotes = {}
+        with self._lock:
+            self.calls["latest_quotes"] += 1
+            for symbol in dict.fromkeys(symbols):
+                if symbol in self.failing:
+                    continue
+                price = self._last.get(symbol)
+                if price is None:
+                    price = self._price(symbol)
+                elif self._rng.random() < self.change_probability:
+                    price = round(price * (1 + self._rng.normal(0, self.volatility)), 4)
+                self._last[symbol] = quotes[symbol] = price
+        return quotes
+
+
+class RateLimitedProvider(MarketDataProvider):
+    """
+    Wraps a provider so that at most `rate` calls per second start, over all threads
+    """
+    def __init__(self, provider, rate):
+        self.provider = provider
+        self.name = provider.name
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        # reserve the next free slot, then sleep outside the lock
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+    def download_prices(self, symbols):
+        self._wait()
+        return self.provider.download_prices(symbols)
+
+    def fetch_info(self, symbol):
+        self._wait()
+        return self.provider.fetch_info(symbol)
+
+    def history(self, symbol, period=None, interval="1d", start=None, end=None):
+        self._wait()
+        return self.provider.history(symbol, period=period, interval=interval, start=start, end=end)
+
+    def latest_quotes(self, symbols):
+        self._wait()
+        return self.provider.latest_quotes(symbols)
+
+
+_default_provider = None
+
+
+def get_provider():
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = YFinanceProvider()
+    return _default_provider
+
+
+def set_provider(provider):
+    """
+    Replace the default provider, e.g. with FakeProvider() for offline runs
+    """
+    global _default_provider
+    _default_provider = provider
+
+
+# --- Batched fetch ---
+def map_with_timeouts(fn, items, max_workers, timeout):
+    """
+    Run fn for every item on a bounded thread pool. Each item gets `timeout` seconds from the moment
+    it starts running. Returns ({item: result}, {item: exception}).
+    """
+    results, errors, started = {}, {}, {}
+
+    def call(item):
+        started[item] = time.monotonic()
+        return fn(item)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    call = backend_perf.bind(call)  # spans of the workers belong to the caller's run
+    futures = {pool.submit(call, item): item for item in items}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=min(0.1, timeout),
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item = futures[future]
+                try:
+                    results[item] = future.result()
+                except Exception as e:
+                    errors[item] = e
+            now = time.monotonic()
+            for future in list(pending):
+                item = futures[future]
+                if item in started and now - started[item] > timeout:
+                    errors[item] = TimeoutError(f"timeout after {timeout}s")
+                    pending.discard(future)
+    finally:
+        # don't wait for hanging calls, they finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results, errors
+
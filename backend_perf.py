@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import functools
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Lightweight instrumentation: timing spans and counters, collected per run (one dashboard rerun,
+# one refresh of the worker) and written as one JSON log line per run.
+# Set PORTFOLIO_PERF_LOG to a file path (or "-" for stderr) to enable the JSON log.
+
+logger = logging.getLogger("portfolio.perf")
+MAX_SPANS = 10_000  # per recorder, older spans are dropped
+
+_local = threading.local()
+
+
+class Recorder:
+    def __init__(self, name="run"):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = deque(maxlen=MAX_SPANS)
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add_span(self, name, ms, attrs):
+        with self._lock:
+            self.spans.append((name, ms, attrs))
+
+    def add(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def summary(self, top=15):
+        """
+        Spans aggregated per name (count, total_ms, max_ms), counters and the slowest single spans
+        """
+        with self._lock:
+            spans, counters = list(self.spans), dict(self.counters)
+        per_name = {}
+        for name, ms, _ in spans:
+            agg = per_name.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            agg["count"] += 1
+            agg["total_ms"] += ms
+            agg["max_ms"] = max(agg["max_ms"], ms)
+        for agg in per_name.values():
+            agg["total_ms"], agg["max_ms"] = round(agg["total_ms"], 2), round(agg["max_ms"], 2)
+        slowest = sorted(spans, key=lambda span: span[1], reverse=True)[:top]
+        return {
+            "run": self.name,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": per_name,
+            "counters": counters,
+            "slowest": [{"name": name, "ms": round(ms, 2), **attrs} for name, ms, attrs in slowest],
+        }
+
+
+# spans outside of a run (background threads, imports) end up here
+_background = Recorder("background")
+
+
+def current():
+    return getattr(_local, "recorder", None) or _background
+
+
+def start_run(name="rerun"):
+    """
+    Start collecting for the current thread, e.g. at the top of a dashboard rerun
+    """
+    _local.recorder = Recorder(name)
+    return _local.recorder
+
+
+def active():
+    """
+    True between start_run and end_run in the current thread
+    """
+    return getattr(_local, "recorder", None) is not None
+
+
+def end_run():
+    """
+    Stop collecting, log the summary as JSON and return it
+    """
+    summary = current().summary()
+    log(summary.pop("run"), **summary)
+    _local.recorder = None
+    return summary
+
+
+def record(name, ms, **attrs):
+    current().add_span(name, ms, attrs)
+
+
+def count(name, n=1):
+    current().add(name, n)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block: with span("provider.history", symbol="AAPL"): ...
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000, **attrs)
+
+
+def timed(name=None):
+    """
+    Decorator version of span, the name defaults to module.function
+    """
+    def decorator(fn):
+        span_name = name or f"{fn.__module__.replace('backend_', '')}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn):
+    """
+    Run fn in another thread (thread pool) but record into the recorder of the calling thread
+    """
+    recorder = current()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "recorder", None)
+        _local.recorder = recorder
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.recorder = previous
+    return wrapper
+
+
+def log(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, "ts": time.strftime("%Y-%m-%dT%H:%M:%S"), **fields}, default=str))
+
+
+def _configure_from_env():
+    target = os.environ.get("PORTFOLIO_PERF_LOG")
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if target == "-" else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configure_from_env()
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+
+# Quantities below this count as a closed position
+EPS = 1e-9
+# Range of the log scale factor of _average_cost before it is renormalized (exp overflows at 709)
+LOG_LIMIT = 300.0
+POSITION_COLUMNS = ["Name", "Ticker", "Currency", "Quantity", "Buy Price", "Cost Basis", "Realized P&L", "Fees"]
+HOLDINGS_INDEX_COLUMNS = ["Ticker", "date", "quantity", "cost_basis", "bought", "sold"]
+
+
+def parse_dates(values):
+    """
+    ISO dates, or the day-first dates of older Yuh imports (both may be mixed)
+    """
+    values = pd.Series(values)
+    parsed = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], dayfirst=True, format="mixed", errors="coerce")
+    return parsed
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+
+def prepare_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    BUY/SELL rows as numeric columns, sorted by Ticker and date (stable, keeps the insert order per day)
+    Columns: code (ticker code into .attrs["tickers"]), Ticker, date, is_buy, quantity, price_per_unit,
+    fees (always positive), signed_quantity, amount (quantity * price_per_unit), row (position in df)
+    """
+    rows = np.flatnonzero((df["buy_sell"].isin(["BUY", "SELL"]) & df["Ticker"].notna()).to_numpy())
+    codes, tickers = pd.factorize(df["Ticker"], sort=True)
+    codes = codes[rows]
+    dates = parse_dates(df["date"]).to_numpy()[rows]
+    order = np.lexsort((dates, codes))  # stable, same-day rows keep their order
+    rows, codes, dates = rows[order], codes[order], dates[order]
+
+    is_buy = (df["buy_sell"] == "BUY").to_numpy()[rows]
+    quantity = np.abs(_numeric(df, "quantity")[rows])
+    price = _numeric(df, "price_per_unit")[rows]
+    tx = pd.DataFrame({
+        "code": codes,
+        "Ticker": pd.Categorical.from_codes(codes, categories=tickers) if len(tickers) else pd.Categorical([]),
+        "date": dates,
+        "is_buy": is_buy,
+        "quantity": quantity,
+        "price_per_unit": price,
+        "fees": np.abs(_numeric(df, "fees")[rows]),
+        "signed_quantity": np.where(is_buy, quantity, -quantity),
+        "amount": quantity * price,
+        "row": rows,
+    })
+    tx.attrs["tickers"] = tickers
+    tx.attrs["info"] = _latest_info(df, rows[_last_per_ticker(codes)], tickers[codes[_last_per_ticker(codes)]])
+    return tx
+
+
+def _latest_info(df, last_rows, index):
+    # Name and currency from the last transaction per ticker
+    source = df.iloc[last_rows]
+    name = source["transaction_info"].astype(str).str.replace(r'^.*x ', '', regex=True).str.rstrip('"') \
+        if "transaction_info" in source else pd.Series(None, index=source.index, dtype=object)
+    currency = source["currency"] if "currency" in source else pd.Series(None, index=source.index, dtype=object)
+    return pd.DataFrame({"Name": name.to_numpy(), "Currency": currency.to_numpy()}, index=pd.Index(index, name="Ticker"))
+
+
+def _last_per_ticker(codes):
+    return np.r_[codes[1:] != codes[:-1], True] if len(codes) else np.zeros(0, bool)
+
+
+def _average_cost(tx):
+    """
+    Weighted-average cost basis after each row. Buys add their cost (incl. fees), sells remove the
+    sold share of the basis at the current average. Solved as the linear recurrence
+    C_t = a_t * C_t-1 + b_t per holding period with cumulative (log) products, no loop.
+    Returns (quantity after, cost basis before, cost basis after) per row.
+    """
+    codes = tx["code"].to_numpy()
+    signed = tx["signed_quantity"].to_numpy()
+    is_buy = tx["is_buy"].to_numpy()
+    q_after = pd.Series(signed).groupby(codes, sort=False).cumsum().to_numpy()
+    q_before = q_after - signed
+    closing = q_after <= EPS
+
+    # new holding period at every new ticker and after every row that closed the position
+    new_ticker = np.r_[True, codes[1:] != codes[:-1]]
+    period = np.cumsum(new_ticker | np.r_[False, closing[:-1]])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(is_buy | closing | (q_before <= EPS), 1.0, q_after / q_before)
+    b = np.where(is_buy, tx["amount"].to_numpy() + tx["fees"].to_numpy(), 0.0)
+
+    log_ratio = np.log(ratio)
+    log_p = pd.Series(log_ratio).groupby(period, sort=False).cumsum().to_numpy()
+    # exp(-log_p) overflows after many partial sells in one period: log_p only falls within a period,
+    # so the period is cut into segments of LOG_LIMIT and each segment is scaled from its own start
+    level = np.floor(-log_p / LOG_LIMIT)
+    new_period = np.r_[True, period[1:] != period[:-1]]
+    seg_start = new_period | np.r_[False, level[1:] != level[:-1]]
+    starts = np.flatnonzero(seg_start)
+    segment = np.cumsum(seg_start) - 1
+    local = log_p - (log_p - log_ratio)[starts][segment]
+    scale = np.exp(local)
+    c_after = scale * pd.Series(b * np.exp(-local)).groupby(segment, sort=False).cumsum().to_numpy()
+    # carry the cost into the segments that continue a period (rare, only after ~LOG_LIMIT of sells)
+    ends = np.r_[starts[1:], len(c_after)]
+    for start, end in zip(starts, ends):
+        if not new_period[start]:
+            c_after[start:end] += scale[start:end] * c_after[start - 1]
+    c_after = np.where(closing, 0.0, c_after)
+    c_before = np.where(np.r_[True, period[1:] != period[:-1]], 0.0, np.r_[0.0, c_after[:-1]])
+    return q_after, c_before, c_after
+
+
+def _fifo_cost(tx):
+    """
+    FIFO cost of the sold units. The first x units of a ticker cost F(x), read off the cumulative
+    buy quantity/cost with one searchsorted over all tickers (offset per ticker keeps keys sorted).
+    Returns (buy rows, remaining quantity per buy lot, cost removed per sell row).
+    """
+    is_buy = tx["is_buy"].to_numpy()
+    codes = tx["code"].to_numpy()
+    n = len(tx.attrs["tickers"])
+    buys = tx[is_buy]
+    buy_codes, sell_codes = codes[is_buy], codes[~is_buy]
+
+    buy_qty = buys["quantity"].to_numpy()
+    buy_cost = buys["amount"].to_numpy() + buys["fees"].to_numpy()
+    cum_qty = pd.Series(buy_qty).groupby(buy_codes, sort=False).cumsum().to_numpy()
+    cum_cost = pd.Series(buy_cost).groupby(buy_codes, sort=False).cumsum().to_numpy()
+    total_bought = np.bincount(buy_codes, weights=buy_qty, minlength=n)
+    offset = np.r_[0.0, np.cumsum(total_bought + 1)[:-1]]
+    keys = cum_qty + offset[buy_codes]
+
+    def cost_of_first(x, x_codes):
+        if len(keys) == 0:
+            return np.zeros(len(x))
+        x = np.minimum(x, total_bought[x_codes])
+        lot = np.clip(np.searchsorted(keys, x + offset[x_codes], side="left"), 0, len(keys) - 1)
+        # tickers without any buy have no lot
+        valid = buy_codes[lot] == x_codes
+        unit = np.divide(buy_cost[lot], buy_qty[lot], out=np.zeros(len(lot)), where=buy_qty[lot] > 0)
+        before_qty = cum_qty[lot] - buy_qty[lot]
+        before_cost = cum_cost[lot] - buy_cost[lot]
+        return np.where(valid, before_cost + (x - before_qty) * unit, 0.0)
+
+    sell_qty = tx["quantity"].to_numpy()[~is_buy]
+    sold_after = pd.Series(sell_qty).groupby(sell_codes, sort=False).cumsum().to_numpy()
+    cost_removed = cost_of_first(sold_after, sell_codes) - cost_of_first(sold_after - sell_qty, sell_codes)
+
+    total_sold = np.bincount(sell_codes, weights=sell_qty, minlength=n)
+    remaining = np.clip(cum_qty - total_sold[buy_codes], 0, buy_qty)
+    return buys, remaining, cost_removed
+
+
+def compute_positions(df: pd.DataFrame, method="average") -> pd.DataFrame:
+    """
+    Positions per ticker from raw transactions, fully vectorized
+    Args:
+    - df: transactions table (or the output of prepare_transactions)
+    - method: "average" (weighted-average cost) or "fifo"
+    Returns: DataFrame with POSITION_COLUMNS for every ticker, also closed ones (Quantity 0).
+    Buy Price is the cost basis per unit including buy fees, Realized P&L is net of sell fees.
+    """
+    tx = df if "signed_quantity" in df.columns else prepare_transactions(df)
+    if tx.empty:
+        return pd.DataFrame(columns=POSITION_COLUMNS)
+    n = len(tx.attrs["tickers"])
+    codes = tx["code"].to_numpy()
+    is_buy = tx["is_buy"].to_numpy()
+    last = _last_per_ticker(codes)
+    proceeds = np.where(is_buy, 0.0, tx["amount"].to_numpy() - tx["fees"].to_numpy())
+
+    if method == "average":
+        q_after, c_before, c_after = _average_cost(tx)
+        cost_removed = np.where(is_buy, 0.0, c_before - c_after)
+        quantity = np.bincount(codes, weights=tx["signed_quantity"].to_numpy(), minlength=n)
+        cost_basis = np.zeros(n)
+        cost_basis[codes[last]] = c_after[last]
+        realized = np.bincount(codes, weights=proceeds - cost_removed, minlength=n)
+    elif method == "fifo":
+        buys, remaining, sell_cost = _fifo_cost(tx)
+        quantity = np.bincount(codes, weights=tx["signed_quantity"].to_numpy(), minlength=n)
+        unit = np.divide((buys["amount"] + buys["fees"]).to_numpy(), buys["quantity"].to_numpy(),
+                         out=np.zeros(len(buys)), where=buys["quantity"].to_numpy() > 0)
+        cost_basis = np.bincount(buys["code"].to_numpy(), weights=remaining * unit, minlength=n)
+        realized = np.bincount(codes[~is_buy], weights=proceeds[~is_buy] - sell_cost, minlength=n)
+    else:
+        raise ValueError(f"Unknown cost method: {method}")
+
+    present = codes[last]
+    positions = tx.attrs["info"].copy()
+    positions["Quantity"] = quantity[present]
+    positions["Cost Basis"] = cost_basis[present]
+    positions["Realized P&L"] = realized[present]
+    positions["Fees"] = np.bincount(codes, weights=tx["fees"].to_numpy(), minlength=n)[present]
+    held = positions["Quantity"] > EPS
+    positions["Buy Price"] = (positions["Cost Basis"] / positions["Quantity"]).where(held)
+    return positions.reset_index()[POSITION_COLUMNS]
+
+
+def holdings_index(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Running totals per ticker after every transaction date (the last row of each timestamp): quantity,
+    weighted-average cost basis and the cumulative bought/sold quantities. Sorted by Ticker and date,
+    the state at any date is the last row on or before it.
+    Returns DataFrame with HOLDINGS_INDEX_COLUMNS
+    """
+    tx = df if "signed_quantity" in df.columns else prepare_transactions(df)
+    if tx.empty:
+        return pd.DataFrame(columns=HOLDINGS_INDEX_COLUMNS)
+    codes = tx["code"].to_numpy()
+    q_after, _, c_after = _average_cost(tx)
+    quantity = np.where(tx["is_buy"], tx["quantity"], 0.0)
+    bought = pd.Series(quantity).groupby(codes, sort=False).cumsum().to_numpy()
+    sold = pd.Series(tx["quantity"].to_numpy() - quantity).groupby(codes, sort=False).cumsum().to_numpy()
+    dates = tx["date"].to_numpy()
+    last = np.r_[(codes[1:] != codes[:-1]) | (dates[1:] != dates[:-1]), True]
+    return pd.DataFrame({
+        "Ticker": tx["Ticker"].astype(object).to_numpy()[last],
+        "date": dates[last],
+        "quantity": q_after[last],
+        "cost_basis": c_after[last],
+        "bought": bought[last],
+        "sold": sold[last],
+    })
+
+
+def add_unrealized_pnl(positions: pd.DataFrame, price_col="Current Price") -> pd.DataFrame:
+    """
+    Unrealized P&L = market value - cost basis, in the trading currency
+    """
+    positions = positions.copy()
+    positions["Unrealized P&L"] = positions["Quantity"] * positions[price_col] - positions["Cost Basis"]
+    return positions
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+import backend_perf
+import backend_sqlite
+import backend_positions
+import backend_fx
+import backend_valuation
+
+# Time-weighted (TWR) and money-weighted (XIRR) returns of the portfolio and every ticker, for all
+# periods at once. Values come from the daily valuation matrix in CHF, the external cash flows from
+# the buy/sell/fees columns of the transactions.
+
+DAYS_PER_YEAR = 365.25
+PORTFOLIO = "Portfolio"
+PERIODS = ["1d", "1wk", "1mo", "6mo", "1y", "5y", "10y", "20y", "max"]
+RETURN_COLUMNS = ["Period", "Ticker", "TWR (%)", "MWR (%)", "XIRR p.a. (%)"]
+
+# fingerprint of the transactions and the day -> returns table, see get_returns
+_returns_cache = {}
+
+
+def contributions(tx, df):
+    """
+    Money put into each position per transaction in CHF (buys positive, sells negative), fees included.
+    Uses the booked buy/sell amounts, quantity * price where they are missing.
+    Args:
+    - tx: output of backend_positions.prepare_transactions(df)
+    - df: the transactions table
+    """
+    rows = tx["row"].to_numpy()
+    booked = (backend_positions._numeric(df, "sell") + backend_positions._numeric(df, "buy"))[rows]
+    gross = np.where(tx["is_buy"], tx["amount"], -tx["amount"])
+    amount = np.where(booked != 0, -booked, gross) + tx["fees"].to_numpy()
+    currencies = df["currency"].to_numpy()[rows] if "currency" in df.columns else np.full(len(rows), None)
+    currencies = pd.Series(currencies, dtype=object).fillna(
+        pd.Series(tx["Ticker"].map(tx.attrs["info"]["Currency"]).to_numpy(), dtype=object)).fillna(backend_fx.BASE_CURRENCY)
+    return backend_fx.convert(pd.Series(amount), currencies, pd.Series(tx["date"].to_numpy())).fillna(0.0).to_numpy()
+
+
+def flow_matrix(tx, amounts, dates):
+    """
+    Contributions summed per grid date and ticker (dates x tickers). A transaction belongs to the
+    first grid date at or after it, the same rule holdings_matrix uses.
+    """
+    flows = np.zeros((len(dates), len(tx.attrs["tickers"])))
+    idx = dates.searchsorted(pd.DatetimeIndex(tx["date"]), side="left")
+    inside = idx < len(dates)
+    np.add.at(flows, (idx[inside], tx["code"].to_numpy()[inside]), amounts[inside])
+    return flows
+
+
+def linked_returns(values, flows):
+    """
+    Return of every grid step: the flows count from the start of the step (the trades happened
+    before the grid date), r_t = (V_t - V_t-1 - F_t) / (V_t-1 + F_t). When the position is closed
+    in the step the proceeds are taken at its end, r_t = (F_t-proceeds - V_t-1) / V_t-1.
+    """
+    previous = values[:-1]
+    flow = flows[1:]
+    base = np.where(values[1:] > backend_positions.EPS, previous + flow, previous)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.where(base > backend_positions.EPS, (values[1:] - previous - flow) / base, 0.0)
+    return np.clip(returns, -1 + 1e-12, None)
+
+
+def xirr(amounts, times, groups, n_groups, tol=1e-10, max_iter=50):
+    """
+    Annual internal rate of return of many cash flow series at once
+    Args:
+    - amounts: cash flows (negative = paid in), flat array over all series
+    - times: years since the start of the series of each flow
+    - groups: series id (0..n_groups-1) of each flow
+    Solves sum(a * exp(-x * t)) = 0 for x = log(1 + rate) with a Newton step on all series per
+    iteration, series that do not converge are bisected. NaN where there is no sign change.
+    """
+    amounts, times, groups = np.asarray(amounts, dtype=float), np.asarray(times, dtype=float), np.asarray(groups, dtype=int)
+
+    def npv(x):
+        discounted = amounts * np.exp(np.clip(-x[groups] * times, -700, 700))
+        return (np.bincount(groups, discounted, n_groups),
+                np.bincount(groups, -times * discounted, n_groups))
+
+    has_in = np.bincount(groups, amounts > 0, n_groups) > 0
+    has_out = np.bincount(groups, amounts < 0, n_groups) > 0
+    horizon = np.zeros(n_groups)
+    np.maximum.at(horizon, groups, times)
+    solvable = has_in & has_out & (horizon > 0)
+
+    x = np.zeros(n_groups)
+    converged = ~solvable
+    for _ in range(max_iter):
+        value, slope = npv(x)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.where(converged | (slope == 0), 0.0, value / slope)
+        x = x - np.clip(step, -1, 1)
+        converged |= np.abs(step) < tol
+        if converged.all():
+            break
+
+    # bisection for the rest, the bracket allows a growth factor of e^±50 over the horizon
+    rest = solvable & ~(converged & np.isfinite(x))
+    if rest.any():
+        bound = 50 / np.where(horizon > 0, horizon, 1)
+        lo, hi = np.where(rest, -bound, 0.0), np.where(rest, bound, 0.0)
+        f_lo = npv(lo)[0]
+        bracketed = rest & (np.sign(f_lo) != np.sign(npv(hi)[0]))
+        for _ in range(200):
+            mid = (lo + hi) / 2
+            f_mid = npv(mid)[0]
+            left = np.sign(f_mid) == np.sign(f_lo)
+            lo, f_lo = np.where(left, mid, lo), np.where(left, f_mid, f_lo)
+            hi = np.where(left, hi, mid)
+        x = np.where(rest, np.where(bracketed, (lo + hi) / 2, np.nan), x)
+    return np.where(solvable, np.expm1(x), np.nan), np.where(solvable, x * horizon, np.nan)
+
+
+def period_starts(dates, periods, first_date):
+    """
+    Grid index each period starts from: the last grid date on or before the period start
+    ('1d' is the previous grid date)
+    """
+    starts = []
+    for period in periods:
+        if period == "1d":
+            starts.append(max(len(dates) - 2, 0))
+            continue
+        start = backend_valuation.period_start(period, first_date)
+        starts.append(max(int(dates.searchsorted(start, side="right")) - 1, 0))
+    return np.array(starts, dtype=int)
+
+
+@backend_perf.timed()
+def compute_returns(df, periods=PERIODS, end=None):
+    """
+    TWR and money-weighted return of the portfolio and every ticker for every period
+    Args:
+    - df: transactions table
+    - periods: dashboard periods ('1d', '1wk', ..., 'max')
+    Returns a long table with RETURN_COLUMNS: TWR and MWR are the returns over the period, XIRR the
+    annualized money-weighted return. NaN for tickers that were not held in the period.
+    """
+    tx = backend_positions.prepare_transactions(df)
+    if tx.empty:
+        return pd.DataFrame(columns=RETURN_COLUMNS)
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+    dates = backend_valuation.date_grid(pd.Timestamp(tx["date"].min()), end, "1d")
+    tickers = list(tx.attrs["tickers"]) + [PORTFOLIO]
+
+    values = backend_valuation.valuation_matrix(tx, dates).to_numpy()
+    flows = flow_matrix(tx, contributions(tx, df), dates)
+    # tickers without FX rate (NaN values) get NaN returns and are left out of the portfolio
+    valued = ~np.isnan(values).any(axis=0)
+    values = np.column_stack([values, values[:, valued].sum(axis=1)])
+    flows = np.column_stack([flows, flows[:, valued].sum(axis=1)])
+
+    # TWR: cumulative log growth, any period is a difference of two rows
+    growth = np.vstack([np.zeros((1, len(tickers))), np.cumsum(np.log1p(linked_returns(values, flows)), axis=0)])
+    starts = period_starts(dates, periods, tx["date"].min())
+    twr = np.expm1(growth[-1] - growth[starts])
+
+    # XIRR: one cash flow series per (period, ticker): value at the start paid in, the contributions
+    # in between, the value at the end paid out
+    years = (dates - dates[0]).days.to_numpy() / DAYS_PER_YEAR
+    flow_rows, flow_cols = np.nonzero(flows)
+    amounts, times, groups = [], [], []
+    n = len(tickers)
+    for p, start in enumerate(starts):
+        inside = flow_rows > start
+        group = p * n + np.arange(n)
+        amounts += [-values[start], -flows[flow_rows[inside], flow_cols[inside]], values[-1]]
+        times += [np.zeros(n), years[flow_rows[inside]] - years[start], np.full(n, years[-1] - years[start])]
+        groups += [group, p * n + flow_cols[inside], group]
+    rates, log_growth = xirr(np.concatenate(amounts), np.concatenate(times), np.concatenate(groups), len(periods) * n)
+
+    held = np.array([(values[start:] > backend_positions.EPS).any(axis=0) | (flows[start + 1:] != 0).any(axis=0)
+                     for start in starts])
+    result = pd.DataFrame({
+        "Period": np.repeat(list(periods), n),
+        "Ticker": np.tile(tickers, len(periods)),
+        "TWR (%)": np.where(held, twr, np.nan).ravel() * 100,
+        "MWR (%)": np.where(held.ravel(), np.expm1(log_growth), np.nan) * 100,
+        "XIRR p.a. (%)": np.where(held.ravel(), rates, np.nan) * 100,
+    })
+    return result[RETURN_COLUMNS]
+
+
+def get_returns(df, periods=PERIODS):
+    """
+    compute_returns, cached until the transactions change, new prices were fetched (refresh_worker.py)
+    or a new day starts
+    """
+    tx = backend_positions.prepare_transactions(df)
+    key = (backend_valuation._fingerprint(tx), tuple(periods), pd.Timestamp.now().strftime("%Y-%m-%d"),
+           backend_sqlite.get_meta("last_refresh"))
+    cached = _returns_cache.get("returns")
+    if cached is not None and cached[0] == key:
+        backend_perf.count("returns.hit")
+        return cached[1]
+    result = compute_returns(df, periods)
+    _returns_cache["returns"] = (key, result)
+    return result
@@ -0,0 +1,370 @@
+import copy
+import numpy as np
+import pandas as pd
+from collections import deque
+from statistics import NormalDist
+import backend_perf
+import backend_positions
+import backend_fx
+import backend_symbols
+import backend_valuation
+
+# Risk metrics of the current holdings, vectorized over one aligned price matrix in CHF
+# (business days x tickers). Returns are simple daily returns, annualized with TRADING_DAYS.
+
+TRADING_DAYS = 252
+PORTFOLIO = "Portfolio"
+BENCHMARKS = {
+    "SMI": ("^SSMI", "CHF"),
+    "S&P 500": ("^GSPC", "USD"),
+    "MSCI World": ("URTH", "USD"),
+    "Euro Stoxx 50": ("^STOXX50E", "EUR"),
+}
+
+
+
+def benchmark_symbol(benchmark):
+    """
+    Provider symbol and currency price_matrix reads for a benchmark (key of BENCHMARKS or a
+    (symbol, currency) tuple), e.g. for the refresh worker to prefetch exactly these bars
+    """
+    symbol, currency = BENCHMARKS.get(benchmark, benchmark)
+    return backend_symbols.resolve_symbol(symbol, currency), currency
+
+# (tickers, benchmark, window) -> (last date, RollingWindow, rolling volatility, rolling beta), see rolling_risk
+_rolling_cache = {}
+
+
+def price_matrix(tickers, currencies, start, end=None):
+    """
+    Daily closes in CHF of all tickers on business days from start to end (NaN before the first close
+    and for currencies without FX rate)
+    Args:
+    - tickers, currencies: same length, the currency of each ticker
+    - start, end: pd.Timestamp, end defaults to today
+    """
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+    dates = pd.bdate_range(pd.Timestamp(start).normalize(), end.normalize())
+    currencies = pd.Series(list(currencies), dtype=object).fillna(backend_fx.BASE_CURRENCY).to_numpy()
+    symbols = tuple(backend_symbols.resolve_symbol(t, c) for t, c in zip(tickers, currencies))
+    if not symbols or len(dates) == 0:
+        return pd.DataFrame(index=dates, columns=list(tickers), dtype=float)
+    closes = backend_valuation.close_matrix(symbols, dates, fill_start=False).to_numpy()
+    # no FX rate: NaN prices (the ticker gets no returns and no weight) instead of assuming parity
+    fx = backend_valuation.fx_matrix(currencies, dates).to_numpy()
+    return pd.DataFrame(closes * fx, index=dates, columns=list(tickers))
+
+
+def daily_returns(prices):
+    """
+    Simple returns p[t] / p[t-1] - 1 of every column, the first row is dropped
+    """
+    values = prices.to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = values[1:] / values[:-1] - 1
+    returns[~np.isfinite(returns)] = np.nan
+    return pd.DataFrame(returns, index=prices.index[1:], columns=prices.columns)
+
+
+def volatility(returns, annualize=True):
+    """
+    Standard deviation of the returns per column, annualized with sqrt(TRADING_DAYS)
+    """
+    vol = np.nanstd(returns.to_numpy(dtype=float), axis=0, ddof=1)
+    return pd.Series(vol * np.sqrt(TRADING_DAYS) if annualize else vol, index=returns.columns)
+
+
+def _pairwise(returns):
+    """
+    Pairwise covariance over the days both columns have a return, and the variance of column i over
+    the days shared with column j, from masked matrix products (same result as DataFrame.cov/corr)
+    """
+    values = returns.to_numpy(dtype=float)
+    mask = (~np.isnan(values)).astype(float)
+    x = np.where(mask > 0, values, 0.0)
+    n = mask.T @ mask
+    sums = x.T @ mask  # [i, j]: sum of column i over the days column j has a return
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (x.T @ x - sums * sums.T / n) / (n - 1)
+        var = ((x * x).T @ mask - sums * sums / n) / (n - 1)
+    cov[n < 2] = np.nan
+    return cov, var
+
+
+def covariance(returns, annualize=True):
+    """
+    Covariance matrix of the returns, pairwise over the common days if some columns have gaps
+    (tickers listed later)
+    """
+    cov, _ = _pairwise(returns)
+    cov = pd.DataFrame(cov, index=returns.columns, columns=returns.columns)
+    return cov * TRADING_DAYS if annualize else cov
+
+
+def correlation(returns):
+    cov, var = _pairwise(returns)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.sqrt(var * var.T)
+    return pd.DataFrame(np.clip(corr, -1, 1), index=returns.columns, columns=returns.columns)
+
+
+def portfolio_returns(returns, weights):
+    """
+    Daily returns of a portfolio with constant weights (days without a return count as 0)
+    """
+    weights = np.asarray(weights, dtype=float)
+    return pd.Series(np.nan_to_num(returns.to_numpy(dtype=float)) @ weights, index=returns.index, name=PORTFOLIO)
+
+
+def value_at_risk(returns, level=0.95, method="historical"):
+    """
+    One-day VaR and CVaR (expected shortfall) as positive losses, per column
+    Args:
+    - returns: DataFrame of daily returns
+    - level: confidence level, e.g. 0.95 or 0.99
+    - method: 'historical' (empirical quantile) or 'parametric' (normal distribution)
+    Returns a DataFrame with the columns VaR and CVaR.
+    """
+    values = returns.to_numpy(dtype=float)
+    if method == "parametric":
+        mu = np.nanmean(values, axis=0)
+        sigma = np.nanstd(values, axis=0, ddof=1)
+        z = NormalDist().inv_cdf(1 - level)
+        var = -(mu + z * sigma)
+        cvar = -(mu - sigma * NormalDist().pdf(z) / (1 - level))
+    else:
+        quantile = np.nanquantile(values, 1 - level, axis=0)
+        tail = np.where(values <= quantile, values, np.nan)
+        var = -quantile
+        cvar = -np.nanmean(tail, axis=0)
+    return pd.DataFrame({"VaR": var, "CVaR": cvar}, index=returns.columns)
+
+
+def max_drawdown(prices):
+    """
+    Largest drop from a running peak per column, as a negative fraction (-0.25 = -25 %)
+    """
+    values = prices.to_numpy(dtype=float)
+    peaks = np.fmax.accumulate(values, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        drawdown = values / peaks - 1
+    return pd.Series(np.nanmin(np.where(np.isfinite(drawdown), drawdown, np.nan), axis=0), index=prices.columns)
+
+
+def beta(returns, benchmark_returns):
+    """
+    Beta of every column against the benchmark: cov(r, b) / var(b) over the days both have a return
+    """
+    values = returns.to_numpy(dtype=float)
+    bench = np.broadcast_to(benchmark_returns.reindex(returns.index).to_numpy(dtype=float)[:, None], values.shape)
+    valid = ~np.isnan(values) & ~np.isnan(bench)
+    n = valid.sum(axis=0)
+    x = np.where(valid, values, 0.0)
+    b = np.where(valid, bench, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_x, mean_b = x.sum(axis=0) / n, b.sum(axis=0) / n
+        cov = (x * b).sum(axis=0) / n - mean_x * mean_b
+        var = (b * b).sum(axis=0) / n - mean_b ** 2
+        result = np.where(n > 1, cov / var, np.nan)
+    return pd.Series(result, index=returns.columns)
+
+
+def rolling_stats(returns, benchmark_returns, window=63):
+    """
+    Rolling annualized volatility and beta of every column over the last `window` days, computed
+    from cumulative sums in one pass. Missing returns count as 0.
+    Returns (volatility, beta) DataFrames, the first window - 1 rows are NaN.
+    """
+    x = np.nan_to_num(returns.to_numpy(dtype=float))
+    b = np.nan_to_num(benchmark_returns.reindex(returns.index).to_numpy(dtype=float))[:, None]
+    vol = np.full(x.shape, np.nan)
+    bet = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        def window_sums(values):
+            csum = np.cumsum(np.vstack([np.zeros((1, values.shape[1])), values]), axis=0)
+            return csum[window:] - csum[:-window]
+        s1, s2 = window_sums(x), window_sums(x * x)
+        sb, sbb, sxb = window_sums(b), window_sums(b * b), window_sums(x * b)
+        vol[window - 1:], bet[window - 1:] = _moments(window, s1, s2, sb, sbb, sxb)
+    return (pd.DataFrame(vol, index=returns.index, columns=returns.columns),
+            pd.DataFrame(bet, index=returns.index, columns=returns.columns))
+
+
+def _moments(n, s1, s2, sb, sbb, sxb):
+    # annualized volatility and beta from the window sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_x = np.clip(s2 - s1 * s1 / n, 0, None) / (n - 1)
+        var_b = (sbb - sb * sb / n) / (n - 1)
+        cov = (sxb - s1 * sb / n) / (n - 1)
+        return np.sqrt(var_x * TRADING_DAYS), np.where(var_b > 0, cov / var_b, np.nan)
+
+
+class RollingWindow:
+    """
+    Window sums of the returns of n columns and a benchmark, updated in O(n) per new day instead of
+    recomputing the whole window
+    Args:
+    - window: number of days
+    """
+    def __init__(self, window):
+        self.window = window
+        self.rows = deque()
+        self._since_reset = 0
+
+    @classmethod
+    def from_returns(cls, returns, benchmark_returns, window):
+        rolling = cls(window)
+        bench = np.nan_to_num(benchmark_returns.reindex(returns.index).to_numpy(dtype=float))
+        for row, b in zip(np.nan_to_num(returns.to_numpy(dtype=float))[-window:], bench[-window:]):
+            rolling.rows.append((row, b))
+        rolling._resum()
+        return rolling
+
+    def _resum(self):
+        # exact sums of the buffer, also used to drop the rounding drift of the running sums
+        x = np.array([row for row, _ in self.rows]) if self.rows else np.zeros((0, 0))
+        b = np.array([b for _, b in self.rows])[:, None] if self.rows else np.zeros((0, 1))
+        self.s1, self.s2 = x.sum(axis=0), (x * x).sum(axis=0)
+        self.sb, self.sbb, self.sxb = b.sum(), (b * b).sum(), (x * b).sum(axis=0)
+        self._since_reset = 0
+
+    def push(self, row, benchmark_return):
+        """
+        Add the returns of a new day, the oldest day leaves the window
+        """
+        row = np.nan_to_num(np.asarray(row, dtype=float))
+        b = 0.0 if np.isnan(benchmark_return) else float(benchmark_return)
+        self.rows.append((row, b))
+        self.s1, self.s2 = self.s1 + row, self.s2 + row * row
+        self.sb, self.sbb, self.sxb = self.sb + b, self.sbb + b * b, self.sxb + row * b
+        if len(self.rows) > self.window:
+            old, old_b = self.rows.popleft()
+            self.s1, self.s2 = self.s1 - old, self.s2 - old * old
+            self.sb, self.sbb, self.sxb = self.sb - old_b, self.sbb - old_b * old_b, self.sxb - old * old_b
+        self._since_reset += 1
+        if self._since_reset >= self.window:
+            self._resum()
+
+    def stats(self):
+        """
+        (volatility, beta) arrays of the current window, NaN while the window is not full
+        """
+        if len(self.rows) < self.window:
+            nan = np.full(len(self.s1), np.nan)
+            return nan, nan
+        return _moments(self.window, self.s1, self.s2, self.sb, self.sbb, self.sxb)
+
+
+def rolling_risk(returns, benchmark_returns, window=63):
+    """
+    Rolling volatility and beta like rolling_stats. The window sums of the completed days are kept
+    between calls, so when a new day arrives only that day is added (via RollingWindow). The last day
+    may still change (intraday price) and is evaluated on a copy. The cache is dropped if the returns
+    in the kept window changed (e.g. backfilled history).
+    """
+    key = (tuple(returns.columns), benchmark_returns.name, window)
+    cached = _rolling_cache.get(key)
+    complete = returns.index[:-1]
+    bench = benchmark_returns.reindex(returns.index).to_numpy(dtype=float)
+    values = returns.to_numpy(dtype=float)
+    if cached is not None and _still_valid(cached, returns, values, bench):
+        _, rolling, vol, bet = cached
+        backend_perf.count("risk.rolling_incremental")
+        new_vol, new_bet = [], []
+        for i in range(len(vol), len(returns) - 1):
+            rolling.push(values[i], bench[i])
+            new_vol.append(rolling.stats()[0])
+            new_bet.append(rolling.stats()[1])
+        open_day = copy.deepcopy(rolling)
+        open_day.push(values[-1], bench[-1])
+        new_vol.append(open_day.stats()[0])
+        new_bet.append(open_day.stats()[1])
+        new = returns.index[len(vol):]
+        vol = pd.concat([vol, pd.DataFrame(new_vol, index=new, columns=returns.columns)])
+        bet = pd.concat([bet, pd.DataFrame(new_bet, index=new, columns=returns.columns)])
+    else:
+        backend_perf.count("risk.rolling_full")
+        vol, bet = rolling_stats(returns, benchmark_returns, window)
+        if len(complete) == 0:
+            return vol, bet
+        rolling = RollingWindow.from_returns(returns.iloc[:-1], benchmark_returns, window)
+    _rolling_cache[key] = (complete[-1], rolling, vol.iloc[:-1], bet.iloc[:-1])
+    return vol, bet
+
+
+def _still_valid(cached, returns, values, bench):
+    # same first day, the cached days are a prefix of the completed days and the window is unchanged
+    last, rolling, vol, _ = cached
+    if len(returns) < 2 or vol.index[0] != returns.index[0] or len(vol) > len(returns) - 1 \
+            or returns.index[len(vol) - 1] != last:
+        return False
+    if not rolling.rows:
+        return True
+    kept = np.array([row for row, _ in rolling.rows])
+    kept_bench = np.array([b for _, b in rolling.rows])
+    window = slice(len(vol) - len(kept), len(vol))
+    return np.allclose(kept, np.nan_to_num(values[window])) and np.allclose(kept_bench, np.nan_to_num(bench[window]))
+
+
+@backend_perf.timed()
+def portfolio_risk(positions, benchmark="SMI", period="1y", level=0.95, window=63):
+    """
+    Risk of the current holdings over a period
+    Args:
+    - positions: DataFrame with Ticker, Currency, Quantity and Current Price
+    - benchmark: key of BENCHMARKS or a (symbol, currency) tuple
+    - period: lookback like the dashboard ('6mo', '1y', '5y', ...)
+    - level: VaR/CVaR confidence level
+    - window: days of the rolling volatility and beta
+    Returns a dict with
+    - summary: volatility, VaR/CVaR (historical and parametric), max drawdown and beta of the portfolio
+    - per_ticker: the same metrics per ticker plus the weight
+    - correlation: correlation matrix of the tickers
+    - rolling_volatility, rolling_beta: DataFrames (days x tickers + Portfolio)
+    """
+    held = positions[positions["Quantity"] > backend_positions.EPS]
+    held = held[~held["Ticker"].duplicated(keep="last")]
+    tickers, currencies = list(held["Ticker"]), list(held["Currency"])
+    start = backend_valuation.period_start(period)
+    prices = price_matrix(tickers, currencies, start)
+
+    values = backend_fx.convert(held["Current Price"], held["Currency"]).to_numpy(dtype=float) * held["Quantity"].to_numpy(dtype=float)
+    # fall back to the last close if there is no current price
+    last_close = prices.ffill().iloc[-1].to_numpy(dtype=float) * held["Quantity"].to_numpy(dtype=float) if len(prices) else values
+    values = np.where(np.isnan(values), last_close, values)
+    weights = np.nan_to_num(values) / np.nansum(values) if np.nansum(values) > 0 else np.zeros(len(values))
+
+    symbol, currency = BENCHMARKS.get(benchmark, benchmark)
+    bench_prices = price_matrix([symbol], [currency], start)
+    bench_returns = daily_returns(bench_prices)[symbol] if len(bench_prices) > 1 else pd.Series(dtype=float)
+
+    returns = daily_returns(prices)
+    returns[PORTFOLIO] = portfolio_returns(returns, weights)
+    # value path of the current holdings (not the historic portfolio, which bought and sold)
+    growth = (1 + returns.fillna(0.0)).cumprod()
+
+    risk = pd.DataFrame({
+        "Weight (%)": pd.Series(np.append(weights, 1.0) * 100, index=returns.columns),
+        "Volatility (%)": volatility(returns) * 100,
+        "Max Drawdown (%)": max_drawdown(growth) * 100,
+        "Beta": beta(returns, bench_returns),
+    })
+    for method in ("historical", "parametric"):
+        var = value_at_risk(returns, level, method) * 100
+        suffix = "hist." if method == "historical" else "param."
+        risk[f"VaR {suffix} (%)"] = var["VaR"]
+        risk[f"CVaR {suffix} (%)"] = var["CVaR"]
+    risk.index.name = "Ticker"
+
+    # per ticker incremental, the portfolio column depends on today's weights and is recomputed
+    rolling_volatility, rolling_beta = rolling_risk(returns.drop(columns=PORTFOLIO), bench_returns, window)
+    portfolio_volatility, portfolio_beta = rolling_stats(returns[[PORTFOLIO]], bench_returns, window)
+    rolling_volatility[PORTFOLIO] = portfolio_volatility[PORTFOLIO]
+    rolling_beta[PORTFOLIO] = portfolio_beta[PORTFOLIO]
+    return {
+        "summary": risk.loc[PORTFOLIO],
+        "per_ticker": risk.drop(index=PORTFOLIO),
+        "correlation": correlation(returns.drop(columns=PORTFOLIO)),
+        "rolling_volatility": rolling_volatility * 100,
+        "rolling_beta": rolling_beta,
+    }
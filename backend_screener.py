@@ -0,0 +1,157 @@
+import operator
+import numpy as np
+import pandas as pd
+import backend_cache
+import backend_perf
+import backend_sqlite
+import backend_symbols
+
+# Screener over the watchlist: KPIs from the quote cache and price statistics from the stored daily
+# closes, both read in bulk (no provider calls). Filters and rankings are column operations on the
+# whole universe, the result is served page by page.
+
+MOMENTUM_MONTHS = {"Momentum 1M (%)": 1, "Momentum 3M (%)": 3, "Momentum 6M (%)": 6, "Momentum 12M (%)": 12}
+PRICE_COLUMNS = list(MOMENTUM_MONTHS) + ["52W High", "52W Low", "Distance 52W High (%)", "Distance 52W Low (%)"]
+SCREEN_COLUMNS = ["Name", "Ticker", "Currency", "Symbol"] + backend_sqlite.KPI_COLUMNS + PRICE_COLUMNS
+
+OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "between": lambda column, bounds: column.between(*bounds),
+}
+
+# True: lower values rank better. Valuation ratios <= 0 (losses) are not ranked.
+RANK_ASCENDING = {
+    "PE Ratio": True,
+    "PEG Ratio": True,
+    "Price/Book": True,
+    "Beta": True,
+    "Market Cap": False,
+    "Free Cash Flow": False,
+    "Revenue Growth YoY (%)": False,
+    "Momentum 1M (%)": False,
+    "Momentum 3M (%)": False,
+    "Momentum 6M (%)": False,
+    "Momentum 12M (%)": False,
+    "Distance 52W High (%)": False,
+    "Distance 52W Low (%)": False,
+}
+POSITIVE_ONLY = {"PE Ratio", "PEG Ratio", "Price/Book"}
+
+
+def price_statistics(symbols, prices=None, now=None):
+    """
+    Momentum and 52 week range per symbol from the stored daily closes, aggregated in SQL for all
+    symbols at once
+    Args:
+    - prices: current prices per symbol (Series), the last close where missing
+    """
+    now = pd.Timestamp(now) if now is not None else pd.Timestamp.now()
+    as_of = [now] + [now - pd.DateOffset(months=months) for months in MOMENTUM_MONTHS.values()]
+    summary = backend_sqlite.get_close_summary(symbols, as_of, now - pd.DateOffset(years=1))
+    closes = summary[[f"Close {date:%Y-%m-%d}" for date in as_of]].to_numpy(dtype=float)
+    last = closes[:, 0]
+    if prices is not None:
+        current = prices.reindex(summary.index).to_numpy(dtype=float)
+        last = np.where(np.isnan(current), last, current)
+
+    stats = pd.DataFrame(index=summary.index.rename("Symbol"), columns=PRICE_COLUMNS, dtype=float)
+    has_year = summary["Count"].to_numpy() > 0
+    high = np.where(has_year, np.fmax(summary["High"].to_numpy(dtype=float), last), np.nan)
+    low = np.where(has_year, np.fmin(summary["Low"].to_numpy(dtype=float), last), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, column in enumerate(MOMENTUM_MONTHS, start=1):
+            stats[column] = (last / closes[:, i] - 1) * 100
+        stats["52W High"], stats["52W Low"] = high, low
+        stats["Distance 52W High (%)"] = (last / high - 1) * 100
+        stats["Distance 52W Low (%)"] = (last / low - 1) * 100
+    return stats.replace([np.inf, -np.inf], np.nan).reindex(list(symbols))
+
+
+@backend_cache.cached(ttl=300)
+def _universe(entries, refreshed_at):
+    names, tickers, currencies = (list(column) for column in zip(*entries)) if entries else ([], [], [])
+    symbols = [backend_symbols.resolve_symbol(t, c) for t, c in zip(tickers, currencies)]
+    quotes = backend_sqlite.get_quote_cache(symbols).reindex(symbols)
+    stats = price_statistics(symbols, quotes["Current Price"])
+    universe = pd.DataFrame({"Name": names, "Ticker": tickers, "Currency": currencies, "Symbol": symbols})
+    universe = pd.concat([universe, quotes[backend_sqlite.KPI_COLUMNS].reset_index(drop=True),
+                          stats.reset_index(drop=True)], axis=1)
+    for column in backend_sqlite.KPI_COLUMNS + PRICE_COLUMNS:
+        universe[column] = pd.to_numeric(universe[column], errors="coerce")
+    return universe[SCREEN_COLUMNS]
+
+
+@backend_perf.timed()
+def load_universe(watchlist=None):
+    """
+    Screener table of all watchlist entries (SCREEN_COLUMNS), cached until the next refresh
+    (refresh_worker.py) or for 5 minutes
+    """
+    watchlist = backend_sqlite.get_watchlist() if watchlist is None else watchlist
+    entries = tuple(zip(watchlist["Name"], watchlist["Ticker"], watchlist["Currency"]))
+    return _universe(entries, backend_sqlite.get_meta("last_refresh"))
+
+
+def apply_filters(universe, filters):
+    """
+    Rows matching all filters
+    Args:
+    - filters: list of (column, op, value) with op from OPS, 'between' takes (low, high).
+      Missing values never match.
+    """
+    mask = pd.Series(True, index=universe.index)
+    for column, op, value in filters:
+        # NaN != value is True, the notna keeps missing values out for every op
+        mask &= OPS[op](universe[column], value).fillna(False).astype(bool) & universe[column].notna()
+    return universe[mask]
+
+
+def score(universe, weights):
+    """
+    Composite score 0..100: weighted mean of the percentile ranks of the columns (direction from
+    RANK_ASCENDING), columns a row has no value for are left out of its mean
+    Args:
+    - weights: {column: weight}
+    """
+    total = pd.Series(0.0, index=universe.index)
+    weight_sum = pd.Series(0.0, index=universe.index)
+    for column, weight in weights.items():
+        values = universe[column]
+        if column in POSITIVE_ONLY:
+            values = values.where(values > 0)
+        ranks = values.rank(pct=True, ascending=not RANK_ASCENDING.get(column, False))
+        total += ranks.fillna(0.0) * weight
+        weight_sum += ranks.notna() * weight
+    return (total / weight_sum.where(weight_sum > 0) * 100).rename("Score")
+
+
+def paginate(df, page=1, page_size=50):
+    """
+    One page (1-based) of df and the number of pages
+    """
+    n_pages = max(int(np.ceil(len(df) / page_size)), 1)
+    page = min(max(int(page), 1), n_pages)
+    return df.iloc[(page - 1) * page_size: page * page_size], n_pages
+
+
+@backend_perf.timed()
+def screen(universe, filters=(), weights=None, sort_by=None, ascending=False, page=1, page_size=50):
+    """
+    Filter, rank and page the universe in one call
+    Args:
+    - weights: {column: weight} for the Score column, sorted by Score if sort_by is None
+    Returns (page of results, number of matches, number of pages)
+    """
+    result = apply_filters(universe, filters)
+    if weights:
+        result = result.assign(Score=score(result, weights))
+        sort_by = sort_by or "Score"
+    if sort_by:
+        result = result.sort_values(sort_by, ascending=ascending, na_position="last", kind="stable")
+    rows, n_pages = paginate(result, page, page_size)
+    return rows, len(result), n_pages
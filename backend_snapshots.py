@@ -0,0 +1,329 @@
+import os
+import threading
+from pathlib import Path
+from urllib.parse import quote
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+import backend_sqlite
+import backend_positions
+import backend_perf
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, without it every read goes to SQLite
+    pa = pq = None
+
+# Columnar snapshots of the transactions, the positions and the price history: typed, zstd compressed
+# Parquet files next to the databases (snapshots/<database>/...). They are refreshed from SQLite when a
+# read finds them stale (transactions: only the new rows as an extra part file; positions: on a new data
+# version; price history: per symbol, the bars since the last stored day as an extra part) and read
+# memory mapped with column projection. SQLite stays the source of truth: the snapshots can be deleted at any time.
+# Without pyarrow, with PORTFOLIO_SNAPSHOTS=0 or for in-memory databases the readers fall back to SQL.
+
+ENABLED = os.environ.get("PORTFOLIO_SNAPSHOTS", "1") != "0"
+COMPRESSION = "zstd"
+# part files (transactions, price history tails) before they are compacted into one
+MAX_PARTS = 16
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+_lock = threading.Lock()
+_file_locks = {}
+
+if pa is not None:
+    TRANSACTION_SCHEMA = pa.schema(
+        [("id", pa.int64()), ("date", pa.timestamp("us"))]
+        + [(col, pa.float64() if col in backend_sqlite.NUMERIC_TRANSACTION_COLUMNS else pa.string())
+           for col in backend_sqlite.TRANSACTION_COLUMNS if col != "date"])
+    PRICE_SCHEMA = pa.schema([("date", pa.timestamp("us"))] + [(col, pa.float64()) for col in PRICE_COLUMNS])
+
+
+def directory(name="portfolio"):
+    """
+    Snapshot directory of a database ("portfolio", "market"), None if snapshots are not available
+    """
+    if pa is None or not ENABLED:
+        return None
+    database = make_url(backend_sqlite.DB_URLS[name]).database
+    if not database or database == ":memory:":
+        return None
+    path = Path(database)
+    return path.parent / "snapshots" / path.stem
+
+
+def _write(table, path, **metadata):
+    # write to a temporary file and rename: readers (other processes too) never see a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    table = table.replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+    pq.write_table(table, tmp, compression=COMPRESSION)
+    os.replace(tmp, path)
+    backend_perf.count("snapshot.write")
+
+
+def _metadata(path, key=None):
+    # one key, or all keys as a dict with key=None
+    metadata = {k.decode(): v.decode() for k, v in (pq.read_metadata(path).metadata or {}).items()}
+    return metadata.get(key) if key is not None else metadata
+
+
+def _file_lock(path):
+    # one lock per snapshot file, reads of different symbols don't wait for each other
+    with _lock:
+        return _file_locks.setdefault(path, threading.Lock())
+
+
+# --- Transactions: append-only parts part-<first id>-<last id>.parquet ---
+def _parts(path):
+    """
+    (first id, last id, file) of the transaction parts in id order, None if they overlap. Parts inside
+    another part (left over by a compaction or a concurrent refresh) are skipped.
+    """
+    parts = []
+    for file in path.glob("part-*.parquet"):
+        _, first, last = file.stem.split("-")
+        parts.append((int(first), int(last), file))
+    kept = []
+    for first, last, file in sorted(parts, key=lambda part: (part[0], -part[1])):
+        if kept and last <= kept[-1][1]:
+            continue
+        if kept and first <= kept[-1][1]:
+            return None
+        kept.append((first, last, file))
+    return kept
+
+
+def _transaction_table(df):
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601", errors="coerce").astype("datetime64[us]")
+    for col in backend_sqlite.TRANSACTION_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    return pa.Table.from_pandas(df[TRANSACTION_SCHEMA.names], schema=TRANSACTION_SCHEMA, preserve_index=False)
+
+
+def refresh_transactions():
+    """
+    Write the transactions inserted since the last refresh as a new part. The snapshot is rewritten
+    completely when it does not match the table (another database, a migration, overlapping parts).
+    Returns the number of rows written
+    """
+    path = directory("portfolio")
+    if path is None:
+        return 0
+    path = path / "transactions"
+    engine = backend_sqlite.get_engine("portfolio")
+    backend_sqlite.ensure_schema(engine, backend_sqlite.PORTFOLIO_MIGRATIONS)
+    with _lock:
+        parts = _parts(path) if path.exists() else []
+        watermark = parts[-1][1] if parts else 0
+        if parts:
+            # same rows up to the watermark: row count and hash of the last row
+            with engine.connect() as conn:
+                count, last_hash = conn.execute(text("""
+                    SELECT COUNT(*), (SELECT tx_hash FROM transactions WHERE id = :watermark)
+                    FROM transactions WHERE id <= :watermark"""), {"watermark": watermark}).one()
+            rows = sum(pq.read_metadata(file).num_rows for _, _, file in parts)
+            if rows != count or _metadata(parts[-1][2], "last_hash") != str(last_hash):
+                parts = None
+        if parts is None:
+            backend_perf.count("snapshot.rebuild")
+            for file in path.glob("part-*.parquet"):
+                file.unlink()
+            parts, watermark = [], 0
+
+        columns = ", ".join(f"[{col}]" for col in ["id"] + backend_sqlite.TRANSACTION_COLUMNS + ["tx_hash"])
+        new = pd.read_sql(text(f"SELECT {columns} FROM transactions WHERE id > :watermark ORDER BY id"), engine,
+                          params={"watermark": watermark})
+        if new.empty:
+            return 0
+        first, last = int(new["id"].iloc[0]), int(new["id"].iloc[-1])
+        if len(parts) + 1 > MAX_PARTS:
+            # compact: all parts and the new rows into one file
+            table = pa.concat_tables([pq.read_table(file, memory_map=True) for _, _, file in parts] + [_transaction_table(new)])
+            first = parts[0][0]
+        else:
+            table = _transaction_table(new)
+        _write(table, path / f"part-{first:012d}-{last:012d}.parquet", last_hash=int(new["tx_hash"].iloc[-1]))
+        for part_first, _, file in parts:
+            if part_first >= first:
+                file.unlink(missing_ok=True)
+    return len(new)
+
+
+@backend_perf.timed()
+def read_transactions(columns=None) -> pd.DataFrame:
+    """
+    Transactions in id order with a datetime date column, from the snapshot (refreshed first)
+    Args:
+    - columns: columns to read (default TRANSACTION_COLUMNS), the others are not loaded at all
+    """
+    columns = list(columns or backend_sqlite.TRANSACTION_COLUMNS)
+    path = directory("portfolio")
+    if path is None:
+        df = backend_sqlite.query_transactions(columns=columns)
+        if "date" in columns:
+            df["date"] = backend_positions.parse_dates(df["date"]).to_numpy()
+        return df
+    refresh_transactions()
+    parts = _parts(path / "transactions") if (path / "transactions").exists() else []
+    if not parts:
+        return pd.DataFrame({field.name: pd.Series(dtype=field.type.to_pandas_dtype())
+                             for field in TRANSACTION_SCHEMA if field.name in columns})[columns]
+    table = pa.concat_tables([pq.read_table(file, columns=columns, memory_map=True) for _, _, file in parts])
+    return table.to_pandas(split_blocks=True)
+
+
+# --- Positions: one file, rewritten on a new current_positions data version ---
+@backend_perf.timed()
+def read_positions(columns=None) -> pd.DataFrame:
+    """
+    Current positions (pending transactions are applied first), like backend_sqlite.get_current_positions
+    Args:
+    - columns: columns to read, default all
+    """
+    path = directory("portfolio")
+    if path is None:
+        positions = backend_sqlite.get_current_positions()
+        return positions[list(columns)] if columns is not None else positions
+    file, _ = refresh_positions()
+    return pq.read_table(file, columns=list(columns) if columns is not None else None, memory_map=True).to_pandas()
+
+
+def refresh_positions():
+    """
+    Rewrite the positions snapshot if current_positions changed (pending transactions are applied first)
+    Returns (file, whether it was written)
+    """
+    backend_sqlite.apply_position_deltas()
+    file = directory("portfolio") / "positions.parquet"
+    version = str(backend_sqlite.data_version("current_positions"))
+    with _lock:
+        if file.exists() and _metadata(file, "version") == version:
+            return file, False
+        positions = backend_sqlite.get_current_positions()
+        _write(pa.Table.from_pandas(positions, preserve_index=False), file, version=version)
+    return file, True
+
+
+# --- Price history: per symbol and interval a full part and the appended tails ---
+# part-<seq>-<base>.parquet: seq counts up, base is the seq of the full part the tail builds on. A tail
+# holds the bars from the start of the last stored day on (fill_gaps downloads that day again), on read
+# later parts win for the same date. After MAX_PARTS tails the bars are written as a new full part.
+def _price_path(path, symbol, interval):
+    return path / "price_history" / interval / quote(symbol, safe="")
+
+
+def _price_parts(directory):
+    """
+    Files of the current snapshot in seq order (the newest part and the parts since its base)
+    """
+    parts = []
+    for file in directory.glob("part-*.parquet") if directory.exists() else []:
+        _, seq, base = file.stem.split("-")
+        parts.append((int(seq), int(base), file))
+    if not parts:
+        return []
+    parts.sort()
+    base = parts[-1][1]
+    return [(seq, file) for seq, _, file in parts if seq >= base]
+
+
+def _summary_key(summary):
+    return f"{summary['rows']}|{summary['first']}|{summary['last']}|{summary['close']}|{summary['volume']}"
+
+
+def _price_table(hist):
+    df = hist.reset_index().rename(columns={"Date": "date"}).astype({col: float for col in PRICE_COLUMNS})
+    df["date"] = df["date"].astype("datetime64[us]")
+    return pa.Table.from_pandas(df[PRICE_SCHEMA.names], schema=PRICE_SCHEMA, preserve_index=False)
+
+
+def _day_rows(hist):
+    # bars on the last stored day, they are read again by the next tail
+    return int((hist.index >= hist.index[-1].normalize()).sum()) if len(hist) else 0
+
+
+def _refresh_price_history(path, symbol, interval, summary):
+    """
+    Bring the snapshot of one symbol up to summary (backend_sqlite.get_history_summary): nothing if it
+    matches, else the bars of the last stored day and later as a new tail part. A full part is written
+    when the bars before that day changed (backfill) or after MAX_PARTS tails.
+    Returns (part files in seq order, number of files written)
+    """
+    directory = _price_path(path, symbol, interval)
+    key = _summary_key(summary)
+    with _file_lock(directory):
+        parts = _price_parts(directory)
+        meta = _metadata(parts[-1][1]) if parts else {}
+        if meta.get("key") == key:
+            return [file for _, file in parts], 0
+        seq = parts[-1][0] + 1 if parts else 0
+
+        tail = None
+        if parts and len(parts) <= MAX_PARTS and meta.get("first") == summary["first"]:
+            day = pd.Timestamp(meta["last"]).normalize().strftime("%Y-%m-%d %H:%M:%S")
+            tail = backend_sqlite.get_price_history(symbol, interval, start=day)
+            # the rows before that day must be unchanged
+            if int(meta["rows"]) - int(meta["day_rows"]) + len(tail) != summary["rows"]:
+                tail = None
+        if tail is not None:
+            base, hist = parts[0][0], tail
+        else:
+            backend_perf.count("snapshot.rebuild")
+            base, hist = seq, backend_sqlite.get_price_history(symbol, interval)
+        if hist.empty:
+            return [file for _, file in parts], 0
+        last = hist.index[-1].strftime("%Y-%m-%d %H:%M:%S")
+        _write(_price_table(hist), directory / f"part-{seq:06d}-{base:06d}.parquet",
+               key=key, rows=summary["rows"], first=summary["first"], last=last, day_rows=_day_rows(hist))
+        if base == seq:
+            # parts of the previous full snapshot and the single file of older versions
+            for _, file in parts:
+                file.unlink(missing_ok=True)
+            (directory.parent / f"{directory.name}.parquet").unlink(missing_ok=True)
+        return [file for _, file in _price_parts(directory)], 1
+
+
+@backend_perf.timed()
+def read_price_history(symbol, interval, start=None, end=None, columns=None) -> pd.DataFrame:
+    """
+    Stored OHLCV bars like backend_sqlite.get_price_history (nothing is downloaded)
+    Args:
+    - start, end: 'yyyy-mm-dd hh:mm:ss' strings or None
+    - columns: subset of Open, High, Low, Close, Volume, default all
+    """
+    columns = list(columns or PRICE_COLUMNS)
+    path = directory("market")
+    summary = backend_sqlite.get_history_summary(symbol, interval) if path is not None else None
+    if summary is None:
+        return backend_sqlite.get_price_history(symbol, interval, start, end)[columns]
+    files, _ = _refresh_price_history(path, symbol, interval, summary)
+    df = pa.concat_tables([pq.read_table(file, columns=["date"] + columns, memory_map=True) for file in files]) \
+        .to_pandas(split_blocks=True)
+    df = df.set_index(pd.DatetimeIndex(df.pop("date"), name="Date"))
+    if len(files) > 1:
+        # a tail repeats the last day of the part before it
+        df = df[~df.index.duplicated(keep="last")]
+    return df.loc[pd.Timestamp(start) if start is not None else None:pd.Timestamp(end) if end is not None else None]
+
+
+def refresh(tables=("transactions", "positions", "price_history")):
+    """
+    Bring the snapshots up to date, e.g. after an import or a refresh_worker run
+    Returns {table: rows or files written}
+    """
+    written = {}
+    if "transactions" in tables:
+        written["transactions"] = refresh_transactions()
+    if "positions" in tables and directory("portfolio") is not None:
+        written["positions"] = int(refresh_positions()[1])
+    path = directory("market")
+    if "price_history" in tables and path is not None:
+        written["price_history"] = 0
+        for row in backend_sqlite.get_history_coverages().to_dict("records"):
+            summary = backend_sqlite.get_history_summary(row["symbol"], row["interval"])
+            if summary is not None:
+                written["price_history"] += _refresh_price_history(path, row["symbol"], row["interval"], summary)[1]
+    return written
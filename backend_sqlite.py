@@ -1,135 +1,1001 @@
-from sqlalchemy import create_engine, text
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import backend_positions
+import backend_perf
 
-DB_PORTFOLIO_URL = "sqlite:///portfolio.db"
-engine_portfolio = create_engine(DB_PORTFOLIO_URL)
-DB_WATCHLIST_URL = "sqlite:///watchlist.db"
-engine_watchlist = create_engine(DB_WATCHLIST_URL)
+def create_sqlite_engine(url):
+    """
+    One pooled engine per database file. Connections run in WAL mode (readers don't block the writer)
+    and wait for locks instead of failing. pysqlite would start transactions only before DML, so
+    BEGIN is emitted explicitly and migrations/bulk writes are atomic.
+    """
+    engine = create_engine(url, pool_size=5, max_overflow=10, pool_pre_ping=True,
+                           connect_args={"check_same_thread": False, "timeout": 30})
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql(conn.info.get("begin", "BEGIN"))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+        backend_perf.count("db.queries")
+        backend_perf.record("db.query", ms, sql=" ".join(statement.split())[:80])
+
+    return engine
+
+# Database locations: PORTFOLIO_DATA_DIR for all files, or one URL per database
+DATA_DIR = os.environ.get("PORTFOLIO_DATA_DIR", ".")
+DB_URLS = {
+    "portfolio": os.environ.get("PORTFOLIO_DB_URL", f"sqlite:///{Path(DATA_DIR) / 'portfolio.db'}"),
+    "watchlist": os.environ.get("WATCHLIST_DB_URL", f"sqlite:///{Path(DATA_DIR) / 'watchlist.db'}"),
+    "market": os.environ.get("MARKET_DB_URL", f"sqlite:///{Path(DATA_DIR) / 'market.db'}"),
+}
+_engines = {}
+
+@contextmanager
+def begin_immediate(engine):
+    """
+    Transaction that takes the write lock at BEGIN (BEGIN IMMEDIATE): read-modify-write sequences
+    inside it see no concurrent writer, other threads and processes wait for it (busy_timeout)
+    """
+    with engine.connect() as conn:
+        conn.info["begin"] = "BEGIN IMMEDIATE"
+        try:
+            with conn.begin():
+                yield conn
+        finally:
+            conn.info.pop("begin", None)
+
+def get_engine(name):
+    """
+    Engine of a database ("portfolio", "watchlist", "market"), created on first use
+    """
+    if name not in _engines:
+        _engines[name] = create_sqlite_engine(DB_URLS[name])
+    return _engines[name]
+
+def configure(**urls):
+    """
+    Point databases to other locations, e.g. configure(portfolio="sqlite:////data/alice/portfolio.db")
+    """
+    for name, url in urls.items():
+        if name not in DB_URLS:
+            raise ValueError(f"Unknown database: {name}")
+        DB_URLS[name] = url
+        engine = _engines.pop(name, None)
+        if engine is not None:
+            engine.dispose()
+    _snapshots.clear()
+
+def __getattr__(name):
+    # engine_portfolio, engine_watchlist, engine_market: lazy, for existing callers
+    if name.startswith("engine_") and name[len("engine_"):] in DB_URLS:
+        return get_engine(name[len("engine_"):])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+TRANSACTION_COLUMNS = ["date", "transaction_type", "transaction_info", "buy", "sell", "fees", "buy_sell", "quantity",
+                       "Ticker", "price_per_unit", "platform", "currency"]
+NUMERIC_TRANSACTION_COLUMNS = ["buy", "sell", "fees", "quantity", "price_per_unit"]
+
+def transaction_hashes(df: pd.DataFrame, seen=None) -> pd.Series:
+    """
+    Stable 64 bit content hash per transaction. Identical rows are numbered (n-th occurrence) so that
+    repeated identical orders stay distinct, while importing the same rows again gives the same hashes.
+    Args:
+    - seen: {content hash: count} of earlier chunks of the same import, updated in place
+    """
+    normalized = {}
+    for col in TRANSACTION_COLUMNS:
+        values = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if col in NUMERIC_TRANSACTION_COLUMNS:
+            normalized[col] = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+        elif col == "date":
+            dates = backend_positions.parse_dates(values).to_numpy().astype("datetime64[s]")
+            normalized[col] = dates.astype(np.int64)
+        else:
+            normalized[col] = values.astype(object).where(values.notna(), "").astype(str).str.strip().to_numpy(dtype=object)
+    content = pd.Series(pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy(), index=df.index)
+    occurrence = content.groupby(content).cumcount()
+    if seen is not None:
+        occurrence += content.map(seen).fillna(0).astype(int)
+        for key, count in content.value_counts().items():
+            seen[key] = seen.get(key, 0) + count
+    final = pd.util.hash_pandas_object(pd.DataFrame({"content": content, "n": occurrence}), index=False)
+    return pd.Series(final.to_numpy().view(np.int64), index=df.index, name="tx_hash")
+
+def to_iso_dates(values) -> pd.Series:
+    """
+    Dates as ISO 8601 text: 'yyyy-mm-dd', with ' hh:mm:ss' if there is a time. Sorts and compares
+    correctly as text. Values that can't be parsed are kept as they are.
+    """
+    values = pd.Series(values).astype(object)
+    parsed = backend_positions.parse_dates(values)
+    iso = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object) \
+        .where(parsed != parsed.dt.normalize(), parsed.dt.strftime("%Y-%m-%d").astype(object))
+    return iso.where(parsed.notna(), values)
+
+def _insert_rows(conn, table, df: pd.DataFrame, cols, verb="INSERT") -> int:
+    rows = df[cols].astype(object)
+    params = list(rows.where(rows.notna(), None).itertuples(index=False, name=None))
+    if not params:
+        return 0
+    # plain DB-API executemany, no per-row parameter compilation
+    result = conn.exec_driver_sql(f"""{verb} INTO {table} ({", ".join(f"[{col}]" for col in cols)})
+                                      VALUES ({", ".join("?" for _ in cols)})""", params)
+    return result.rowcount
+
+def _insert_or_ignore(conn, df: pd.DataFrame) -> int:
+    # rows whose tx_hash already exists are skipped by the UNIQUE constraint
+    cols = [col for col in TRANSACTION_COLUMNS if col in df.columns] + ["tx_hash"]
+    if "date" in df.columns:
+        df = df.assign(date=to_iso_dates(df["date"]))
+    inserted = _insert_rows(conn, "transactions", df, cols, verb="INSERT OR IGNORE")
+    if inserted:
+        bump_data_version("transactions", conn)
+    return inserted
+
+# --- Schema migrations ---
+# PRAGMA user_version is the number of applied migrations of a database file. Migrations are only
+# appended, never changed: each one runs once per file, in its own transaction.
+_migrated = set()
+
+def migrate(engine, migrations) -> int:
+    """
+    Apply the pending migrations, returns the schema version
+    """
+    with engine.connect() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    for number, migration in enumerate(migrations[version:], start=version + 1):
+        with engine.begin() as conn:
+            # another process may have migrated in the meantime
+            if conn.exec_driver_sql("PRAGMA user_version").scalar() >= number:
+                continue
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+        version = number
+    return version
+
+def ensure_schema(engine, migrations):
+    # once per database and process
+    key = (str(engine.url), id(migrations))
+    if key not in _migrated:
+        migrate(engine, migrations)
+        _migrated.add(key)
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info([{table}])")]
+
+def _migrate_typed_transactions(conn):
+    """
+    Typed transactions table with ISO dates. Rows of an old untyped table (DataFrame.to_sql) are
+    copied over, their rowid becomes the id so the positions watermark stays valid.
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE transactions_typed (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            transaction_type TEXT, transaction_info TEXT,
+            buy REAL, sell REAL, fees REAL, buy_sell TEXT, quantity REAL,
+            Ticker TEXT, price_per_unit REAL, platform TEXT, currency TEXT,
+            tx_hash INTEGER NOT NULL UNIQUE
+        )""")
+    if _table_columns(conn, "transactions"):
+        old = pd.read_sql(text("SELECT rowid AS id, * FROM transactions ORDER BY rowid"), conn)
+        old = old.loc[:, ~old.columns.duplicated()]
+        for col in TRANSACTION_COLUMNS:
+            if col not in old.columns:
+                old[col] = None
+        # rehash: older imports hashed dates that did not parse
+        old["tx_hash"] = transaction_hashes(old)
+        for col in NUMERIC_TRANSACTION_COLUMNS:
+            old[col] = pd.to_numeric(old[col], errors="coerce")
+        old["date"] = to_iso_dates(old["date"])
+        _insert_rows(conn, "transactions_typed", old, ["id"] + TRANSACTION_COLUMNS + ["tx_hash"])
+        conn.exec_driver_sql("DROP TABLE transactions")
+    conn.exec_driver_sql("ALTER TABLE transactions_typed RENAME TO transactions")
+    conn.exec_driver_sql("CREATE INDEX ix_transactions_ticker_date ON transactions (Ticker, date)")
+    conn.exec_driver_sql("CREATE INDEX ix_transactions_buy_sell ON transactions (buy_sell)")
+
+def _migrate_positions_view(conn):
+    """
+    meta table and the keyed current_positions view, filled from the transactions on the next read
+    """
+    conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS current_positions")
+    conn.exec_driver_sql("""
+        CREATE TABLE current_positions (
+            Ticker TEXT PRIMARY KEY, Name TEXT, Currency TEXT, Quantity REAL, [Buy Price] REAL,
+            [Cost Basis] REAL, [Realized P&L] REAL, Fees REAL, last_date TEXT,
+            [Current Price] REAL, [Price/Book] REAL, [PE Ratio] REAL, [Market Cap] REAL, [PEG Ratio] REAL,
+            Beta REAL, [Free Cash Flow] REAL, [Revenue Growth YoY (%)] REAL
+        )""")
+    set_meta("positions_watermark", 0, conn)
+
+PORTFOLIO_MIGRATIONS = [
+    _migrate_typed_transactions,
+    _migrate_positions_view,
+]
+
+def insert_transactions(df: pd.DataFrame) -> int:
+    """
+    Insert transactions, rows that are already stored (same tx_hash) are ignored
+    Returns the number of inserted rows
+    """
+    engine = get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    if "tx_hash" not in df.columns:
+        df = df.assign(tx_hash=transaction_hashes(df))
+    with engine.begin() as conn:
+        inserted = _insert_or_ignore(conn, df)
+    apply_position_deltas(engine)
+    return inserted
+
+def _json_list(values):
+    values = [values] if isinstance(values, str) else list(values)
+    return pd.Series(values, dtype=object).to_json(orient="values")
+
+def _date_bound(value, end=False):
+    # ISO text bounds, an end date without time includes the whole day
+    value = pd.Timestamp(value)
+    if end and value == value.normalize():
+        return "<", (value + pd.DateOffset(days=1)).strftime("%Y-%m-%d")
+    return ("<=" if end else ">="), value.strftime("%Y-%m-%d %H:%M:%S" if value != value.normalize() else "%Y-%m-%d")
+
+def query_transactions(tickers=None, start=None, end=None, buy_sell=None, transaction_types=None, columns=None,
+                       engine=None) -> pd.DataFrame:
+    """
+    Transactions filtered in SQL, uses the (Ticker, date) and buy_sell indexes
+    Args:
+    - tickers: ticker or list of tickers
+    - start, end: date range (inclusive), an end date without time includes the whole day
+    - buy_sell: "BUY"/"SELL" or a list of them
+    - transaction_types: value(s) of transaction_type
+    - columns: columns to return, default TRANSACTION_COLUMNS
+    Returns: DataFrame in insert order
+    """
+    engine = engine or get_engine("portfolio")
+    columns = list(columns) if columns is not None else TRANSACTION_COLUMNS
+    unknown = [col for col in columns if col not in TRANSACTION_COLUMNS + ["id"]]
+    if unknown:
+        raise ValueError(f"Unknown transaction columns: {unknown}")
+    where, params = [], {}
+    for name, values in (("Ticker", tickers), ("buy_sell", buy_sell), ("transaction_type", transaction_types)):
+        if values is not None:
+            where.append(f"{name} IN (SELECT value FROM json_each(:{name}))")
+            params[name] = _json_list(values)
+    if start is not None:
+        op, params["start"] = _date_bound(start)
+        where.append(f"date {op} :start")
+    if end is not None:
+        op, params["end"] = _date_bound(end, end=True)
+        where.append(f"date {op} :end")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    query = f"""SELECT {", ".join(f"[{col}]" for col in columns)} FROM transactions
+                WHERE {" AND ".join(where) or "1"} ORDER BY id"""
+    return pd.read_sql(text(query), engine, params=params)
+
+# table -> data version the snapshot was read at, see transactions_snapshot
+_snapshots = {}
+
+def transactions_snapshot(engine=None) -> pd.DataFrame:
+    """
+    All transactions, read once and shared until the table changes (data version in meta).
+    Every reader of a page render gets the same DataFrame, don't modify it in place.
+    """
+    engine = engine or get_engine("portfolio")
+    key = str(engine.url)
+    version = data_version("transactions", engine)
+    cached = _snapshots.get(key)
+    if cached is None or cached[0] != version:
+        backend_perf.count("snapshot.miss")
+        cached = (version, _read_snapshot(engine))
+        _snapshots[key] = cached
+    else:
+        backend_perf.count("snapshot.hit")
+    return cached[1]
 
-def insert_transactions(df: pd.DataFrame):
-    df.to_sql("transactions", engine_portfolio, if_exists="append", index=False)
+def _read_snapshot(engine):
+    # the Parquet snapshot (backend_snapshots) is used for the configured portfolio database
+    if engine is get_engine("portfolio"):
+        import backend_snapshots
+        return backend_snapshots.read_transactions()
+    return get_transactions(engine)
 
-def get_transactions(engine=engine_portfolio) -> pd.DataFrame:
+def get_transactions(engine=None) -> pd.DataFrame:
+    engine = engine or get_engine("portfolio")
     try:
-        return pd.read_sql("SELECT * FROM transactions", engine)
+        ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+        columns = ", ".join(f"[{col}]" for col in TRANSACTION_COLUMNS)
+        return pd.read_sql(f"SELECT {columns} FROM transactions ORDER BY id", engine)
     except Exception as e:
         print(f"Fehler beim Laden der Transaktionen: {e}")
         # Return empty DataFrame with expected columns
-        return pd.DataFrame(columns=[
-            "date", "transaction_type", "transaction_info", "buy", "buy_currency",
-            "sell", "sell_currency", "fees", "buy_sell", "quantity", "Ticker", "price_per_unit", "platform", "currency"
-        ])
+        return pd.DataFrame(columns=TRANSACTION_COLUMNS)
 
+# --- Materialized positions (current_positions) ---
+# Position columns are maintained incrementally from the transactions (weighted-average cost),
+# KPI columns are written by update_positions. meta.positions_watermark is the last applied transaction id.
+POSITION_VIEW_COLUMNS = ["Ticker", "Name", "Currency", "Quantity", "Buy Price", "Cost Basis", "Realized P&L", "Fees", "last_date"]
+KPI_COLUMNS = ["Current Price", "Price/Book", "PE Ratio", "Market Cap", "PEG Ratio", "Beta", "Free Cash Flow",
+               "Revenue Growth YoY (%)"]
+
+def get_meta(key, default=None, engine=None):
+    engine = engine or get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT value FROM meta WHERE key = :key"), {"key": key}).first()
+    return row[0] if row else default
+
+def data_version(table, engine=None) -> int:
+    """
+    Counter that changes with every write to table, cheap to poll (one primary key lookup)
+    """
+    engine = engine or get_engine("portfolio")
+    return int(get_meta(f"version:{table}", 0, engine))
+
+def data_versions(tables, engine=None) -> tuple:
+    """
+    Data versions of several tables in one query, in the order of tables (e.g. as part of a cache key)
+    """
+    engine = engine or get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    keys = [f"version:{table}" for table in tables]
+    with engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT key, value FROM meta WHERE key IN (SELECT value FROM json_each(:keys))"),
+                                 {"keys": _json_list(keys)}).all())
+    return tuple(int(rows.get(key, 0)) for key in keys)
+
+def bump_data_version(table, conn):
+    conn.execute(text("""INSERT INTO meta (key, value) VALUES (:key, 1)
+                         ON CONFLICT(key) DO UPDATE SET value = value + 1"""), {"key": f"version:{table}"})
+
+def bump_external_version(table):
+    """
+    Bump the data version of a table in another database (watchlist.db, market.db), they have no meta
+    table of their own, all versions are kept in portfolio.db
+    """
+    engine = get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    with engine.begin() as conn:
+        bump_data_version(table, conn)
+
+def set_meta(key, value, conn):
+    conn.execute(text("INSERT OR REPLACE INTO meta (key, value) VALUES (:key, :value)"), {"key": key, "value": str(value)})
+
+def _read_transactions_where(engine, where="1", params=None):
+    try:
+        return pd.read_sql(text(f"SELECT * FROM transactions WHERE {where} ORDER BY id"), engine, params=params or {})
+    except Exception:
+        return pd.DataFrame()
+
+def _position_rows(tx: pd.DataFrame, method="average") -> pd.DataFrame:
+    positions = backend_positions.compute_positions(tx, method=method)
+    last_date = tx["date"].groupby(tx["Ticker"], observed=True).max()
+    positions["last_date"] = positions["Ticker"].map(last_date).dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+    return positions
+
+def _upsert_positions(conn, positions: pd.DataFrame):
+    if positions.empty:
+        return
+    bump_data_version("current_positions", conn)
+    rows = positions[POSITION_VIEW_COLUMNS].astype(object)
+    rows.columns = [f"p{i}" for i in range(len(POSITION_VIEW_COLUMNS))]
+    params = rows.where(rows.notna(), None).to_dict("records")
+    columns = ", ".join(f"[{col}]" for col in POSITION_VIEW_COLUMNS)
+    values = ", ".join(f":p{i}" for i in range(len(POSITION_VIEW_COLUMNS)))
+    updates = ", ".join(f"[{col}] = excluded.[{col}]" for col in POSITION_VIEW_COLUMNS[1:])
+    conn.execute(text(f"INSERT INTO current_positions ({columns}) VALUES ({values}) ON CONFLICT(Ticker) DO UPDATE SET {updates}"), params)
+
+@backend_perf.timed()
+def apply_position_deltas(engine=None) -> int:
+    """
+    Apply the transactions inserted since the last call to current_positions. Only the affected tickers
+    are touched: their stored state is the opening position, the new rows are applied on top. Tickers
+    that got back-dated rows are recomputed from their own transactions.
+    Watermark, state and upsert are read and written in one BEGIN IMMEDIATE transaction, so concurrent
+    callers (sessions, refresh worker) never apply the same rows twice.
+    Returns the number of applied transactions.
+    """
+    engine = engine or get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    # cheap check without the write lock, most calls come from read paths with nothing pending
+    with engine.connect() as conn:
+        pending = conn.execute(text("""SELECT EXISTS (SELECT 1 FROM transactions
+                                       WHERE id > (SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'positions_watermark'))""")).scalar()
+    if not pending:
+        return 0
+
+    with begin_immediate(engine) as conn:
+        watermark = int(conn.execute(text("SELECT value FROM meta WHERE key = 'positions_watermark'")).scalar() or 0)
+        new = _read_transactions_where(conn, "id > :watermark", {"watermark": watermark})
+        if new.empty:
+            # applied by another caller in the meantime
+            return 0
+        new_tx = backend_positions.prepare_transactions(new)
+        tickers = [t for t in new["Ticker"].dropna().unique()]
+        state = pd.read_sql(text("SELECT * FROM current_positions WHERE Ticker IN (SELECT value FROM json_each(:tickers))"),
+                            conn, params={"tickers": pd.Series(tickers).to_json(orient="values")}).set_index("Ticker")
+
+        first_new = new_tx["date"].groupby(new_tx["Ticker"], observed=True).min()
+        last_date = pd.to_datetime(state["last_date"]).reindex(first_new.index)
+        quantity = state["Quantity"].reindex(first_new.index)
+        full = first_new.index[(first_new < last_date) | (quantity < -backend_positions.EPS)]
+        incremental = [t for t in first_new.index if t not in set(full)]
+
+        results = []
+        if incremental:
+            opening = state.loc[state.index.intersection(incremental)]
+            opening = opening[opening["Quantity"] > backend_positions.EPS]
+            opening_rows = pd.DataFrame({
+                "date": opening["last_date"], "buy_sell": "BUY", "quantity": opening["Quantity"],
+                "price_per_unit": opening["Cost Basis"] / opening["Quantity"], "fees": 0.0,
+                "Ticker": opening.index, "currency": opening["Currency"], "transaction_info": opening["Name"],
+            })
+            delta = _position_rows(backend_positions.prepare_transactions(
+                pd.concat([opening_rows, new[new["Ticker"].isin(incremental)]], ignore_index=True)))
+            previous = state.reindex(delta["Ticker"])
+            delta["Realized P&L"] += previous["Realized P&L"].fillna(0).to_numpy()
+            delta["Fees"] += previous["Fees"].fillna(0).to_numpy()
+            results.append(delta)
+        # all transactions of the affected tickers: recomputed positions and their holdings index rows
+        history = _read_transactions_where(conn, "Ticker IN (SELECT value FROM json_each(:tickers))",
+                                           {"tickers": _json_list(tickers)})
+        if len(full):
+            results.append(_position_rows(backend_positions.prepare_transactions(history[history["Ticker"].isin(full)])))
+
+        for positions in results:
+            _upsert_positions(conn, positions)
+        if tickers:
+            _replace_holdings_index(conn, tickers, history)
+        set_meta("positions_watermark", int(new["id"].max()), conn)
+    return len(new)
+
+def rebuild_positions(engine=None) -> int:
+    """
+    Repair: recompute current_positions from all transactions, keeps the KPI columns
+    """
+    engine = engine or get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    transactions = _read_transactions_where(engine)
+    positions = _position_rows(backend_positions.prepare_transactions(transactions)) if not transactions.empty \
+        else pd.DataFrame(columns=POSITION_VIEW_COLUMNS)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM current_positions WHERE Ticker NOT IN (SELECT value FROM json_each(:tickers))"),
+                     {"tickers": positions["Ticker"].to_json(orient="values")})
+        bump_data_version("current_positions", conn)
+        _upsert_positions(conn, positions)
+        conn.exec_driver_sql("DELETE FROM holdings_index")
+        _replace_holdings_index(conn, list(positions["Ticker"]), transactions)
+        set_meta("positions_watermark", int(transactions["id"].max()) if not transactions.empty else 0, conn)
+    return len(transactions)
+
+def check_positions_consistency(engine=None, tolerance=1e-6) -> pd.DataFrame:
+    """
+    Compare the incremental state with a full recompute. Returns the mismatching tickers (empty if consistent)
+    """
+    engine = engine or get_engine("portfolio")
+    apply_position_deltas(engine)
+    transactions = _read_transactions_where(engine)
+    expected = _position_rows(backend_positions.prepare_transactions(transactions)).set_index("Ticker") \
+        if not transactions.empty else pd.DataFrame(columns=POSITION_VIEW_COLUMNS).set_index("Ticker")
+    stored = pd.read_sql("SELECT * FROM current_positions", engine).set_index("Ticker")
+    cols = ["Quantity", "Cost Basis", "Realized P&L", "Fees"]
+    joined = expected[cols].join(stored[cols], how="outer", lsuffix=" (expected)", rsuffix=" (stored)")
+    bad = pd.Series(False, index=joined.index)
+    for col in cols:
+        a, b = joined[f"{col} (expected)"].astype(float), joined[f"{col} (stored)"].astype(float)
+        bad |= ~np.isclose(a, b, rtol=tolerance, atol=tolerance)
+    return joined[bad]
+
+@backend_perf.timed()
 def update_positions(df: pd.DataFrame):
     """
-    Update the current positions in the backend.
+    Update the KPI columns of the current positions in the backend.
     """
     # Remove duplicate columns before writing to SQL
     df = df.loc[:, ~df.columns.duplicated()]
-    df.to_sql("current_positions", engine_portfolio, if_exists="replace", index=False)
+    cols = [col for col in KPI_COLUMNS if col in df.columns]
+    if df.empty or not cols:
+        return
+    engine = get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    rows = df[["Ticker"] + cols].astype(object)
+    rows.columns = ["ticker"] + [f"k{i}" for i in range(len(cols))]
+    params = rows.where(rows.notna(), None).to_dict("records")
+    updates = ", ".join(f"[{col}] = :k{i}" for i, col in enumerate(cols))
+    # only rows whose KPIs differ are written, an unchanged write-back keeps the data version (and the caches)
+    unchanged = " AND ".join(f"[{col}] IS :k{i}" for i, col in enumerate(cols))
+    with engine.begin() as conn:
+        result = conn.execute(text(f"UPDATE current_positions SET {updates} WHERE Ticker = :ticker AND NOT ({unchanged})"), params)
+        if result.rowcount:
+            bump_data_version("current_positions", conn)
 
-def get_current_positions(engine=engine_portfolio) -> pd.DataFrame:
+def get_current_positions(engine=None, apply_pending=True) -> pd.DataFrame:
+    """
+    Read the materialized positions, pending transactions are applied first
+    Args:
+    - apply_pending: False reads the table as it is, without writing (e.g. from background loops)
+    """
+    engine = engine or get_engine("portfolio")
+    if apply_pending:
+        apply_position_deltas(engine)
+    else:
+        ensure_schema(engine, PORTFOLIO_MIGRATIONS)
     return pd.read_sql("SELECT * FROM current_positions", engine)
 
-def get_watchlist(engine=engine_watchlist) -> pd.DataFrame:
+WATCHLIST_COLUMNS = ["Name", "Ticker", "Currency", "Comment"]
+
+def _migrate_typed_watchlist(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE watchlist_typed (
+            id INTEGER PRIMARY KEY, Name TEXT, Ticker TEXT NOT NULL, Currency TEXT, Comment TEXT
+        )""")
+    if _table_columns(conn, "watchlist"):
+        conn.exec_driver_sql("""INSERT INTO watchlist_typed (Name, Ticker, Currency, Comment)
+                                SELECT Name, Ticker, Currency, Comment FROM watchlist
+                                WHERE Ticker IS NOT NULL ORDER BY rowid""")
+        conn.exec_driver_sql("DROP TABLE watchlist")
+    conn.exec_driver_sql("ALTER TABLE watchlist_typed RENAME TO watchlist")
+    conn.exec_driver_sql("CREATE INDEX ix_watchlist_ticker ON watchlist (Ticker)")
+
+WATCHLIST_MIGRATIONS = [
+    _migrate_typed_watchlist,
+]
+
+def get_watchlist(engine=None) -> pd.DataFrame:
+    engine = engine or get_engine("watchlist")
     try:
-        return pd.read_sql("SELECT * FROM watchlist", engine)
+        ensure_schema(engine, WATCHLIST_MIGRATIONS)
+        return pd.read_sql("SELECT Name, Ticker, Currency, Comment FROM watchlist ORDER BY id", engine)
     except Exception as e:
         print(f"Fehler beim Laden der Watchlist: {e}")
-        return pd.DataFrame(columns=["Name", "Ticker", "Currency", "Comment"])
+        return pd.DataFrame(columns=WATCHLIST_COLUMNS)
 
-def add_to_watchlist(Name, Ticker, Currency, Comment, engine=engine_watchlist):
-    df = pd.DataFrame([{
-        "Name": Name,
-        "Ticker": Ticker,
-        "Currency": Currency,
-        "Comment": Comment
-    }])
-    df.to_sql("watchlist", engine, if_exists="append", index=False)
+def add_to_watchlist(Name, Ticker, Currency, Comment, engine=None):
+    engine = engine or get_engine("watchlist")
+    ensure_schema(engine, WATCHLIST_MIGRATIONS)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO watchlist (Name, Ticker, Currency, Comment) VALUES (:name, :ticker, :currency, :comment)"),
+                     {"name": Name, "ticker": Ticker, "currency": Currency, "comment": Comment})
+    bump_external_version("watchlist")
 
 def remove_from_watchlist(Ticker):
-    with engine_watchlist.begin() as conn:
+    engine = get_engine("watchlist")
+    ensure_schema(engine, WATCHLIST_MIGRATIONS)
+    with engine.begin() as conn:
         query = text("DELETE FROM watchlist WHERE Ticker = :ticker")
         conn.execute(query, {"ticker": Ticker})
+    bump_external_version("watchlist")
     print(f"Removed {Ticker} from watchlist")
 
-def read_yuh_csv(file) -> pd.DataFrame:
+# --- Symbol index (portfolio.db), see backend_symbols ---
+SYMBOL_INDEX_COLUMNS = ["ticker", "currency", "symbol", "quote_currency", "asset_class", "source", "status",
+                        "failures", "checked_at", "retry_at", "last_error"]
+
+def _migrate_symbol_index(conn):
+    # currency '' matches every currency of the ticker
+    conn.exec_driver_sql("""
+        CREATE TABLE symbol_index (
+            ticker TEXT NOT NULL, currency TEXT NOT NULL DEFAULT '',
+            symbol TEXT NOT NULL, quote_currency TEXT, asset_class TEXT,
+            source TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'unverified',
+            failures INTEGER NOT NULL DEFAULT 0, checked_at TEXT, retry_at TEXT, last_error TEXT,
+            PRIMARY KEY (ticker, currency)
+        )""")
+
+PORTFOLIO_MIGRATIONS.append(_migrate_symbol_index)
+
+def get_symbol_index(engine=None) -> pd.DataFrame:
+    """
+    All entries of the symbol index (SYMBOL_INDEX_COLUMNS)
+    """
+    engine = engine or get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    return pd.read_sql(f"SELECT {', '.join(SYMBOL_INDEX_COLUMNS)} FROM symbol_index ORDER BY ticker, currency", engine)
+
+def store_symbol_index(entries, engine=None) -> int:
+    """
+    Insert or replace index entries (list of dicts with SYMBOL_INDEX_COLUMNS, missing keys are NULL)
+    """
+    engine = engine or get_engine("portfolio")
+    if not entries:
+        return 0
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    rows = pd.DataFrame(list(entries)).reindex(columns=SYMBOL_INDEX_COLUMNS)
+    rows["currency"] = rows["currency"].fillna("")
+    rows["failures"] = rows["failures"].fillna(0)
+    rows["status"] = rows["status"].fillna("unverified")
+    with engine.begin() as conn:
+        count = _insert_rows(conn, "symbol_index", rows, SYMBOL_INDEX_COLUMNS, verb="INSERT OR REPLACE")
+        bump_data_version("symbol_index", conn)
+    return count
+
+def delete_symbol_index(ticker, currency="", engine=None):
+    engine = engine or get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM symbol_index WHERE ticker = ? AND currency = ?", (ticker, currency or ""))
+        bump_data_version("symbol_index", conn)
+
+# --- As-of holdings index (portfolio.db), see backend_holdings ---
+# Running quantity / cost basis per ticker and transaction date, kept up to date by apply_position_deltas
+def _replace_holdings_index(conn, tickers, transactions: pd.DataFrame):
+    """
+    Recompute the index rows of the tickers from their transactions
+    """
+    conn.execute(text("DELETE FROM holdings_index WHERE Ticker IN (SELECT value FROM json_each(:tickers))"),
+                 {"tickers": _json_list(tickers)})
+    if not transactions.empty:
+        rows = backend_positions.holdings_index(transactions)
+        rows["date"] = pd.DatetimeIndex(rows["date"]).strftime("%Y-%m-%d %H:%M:%S")
+        _insert_rows(conn, "holdings_index", rows, backend_positions.HOLDINGS_INDEX_COLUMNS)
+    bump_data_version("holdings_index", conn)
+
+def _migrate_holdings_index(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE holdings_index (
+            Ticker TEXT NOT NULL, date TEXT NOT NULL,
+            quantity REAL NOT NULL, cost_basis REAL NOT NULL, bought REAL NOT NULL, sold REAL NOT NULL,
+            PRIMARY KEY (Ticker, date)
+        ) WITHOUT ROWID""")
+    transactions = pd.read_sql(text("SELECT * FROM transactions ORDER BY id"), conn)
+    _replace_holdings_index(conn, transactions["Ticker"].dropna().unique(), transactions)
+
+PORTFOLIO_MIGRATIONS.append(_migrate_holdings_index)
+
+def get_holdings_index(engine=None, apply_pending=True) -> pd.DataFrame:
     """
-    Read a yuh csv file and create a pandas dataframe
+    The whole holdings index sorted by Ticker and date (HOLDINGS_INDEX_COLUMNS), pending
+    transactions are applied first
+    Args:
+    - apply_pending: False reads the table as it is, without writing (e.g. the lookups of backend_holdings)
+    """
+    engine = engine or get_engine("portfolio")
+    if apply_pending:
+        apply_position_deltas(engine)
+    else:
+        ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    return pd.read_sql(f"SELECT {', '.join(backend_positions.HOLDINGS_INDEX_COLUMNS)} FROM holdings_index ORDER BY Ticker, date", engine)
+
+YUH_REQUIRED_COLUMNS = ["DATE", "ACTIVITY TYPE", "ACTIVITY NAME", "DEBIT", "DEBIT CURRENCY", "CREDIT", "CREDIT CURRENCY",
+                        "FEES/COMMISSION", "BUY/SELL", "QUANTITY", "ASSET", "PRICE PER UNIT"]
+YUH_COLUMN_MAP = {
+    "DATE": "date",
+    "ACTIVITY TYPE": "transaction_type",
+    "ACTIVITY NAME": "transaction_info",
+    "DEBIT": "buy",     # buy stocks, -xxx from bank account view
+    "DEBIT CURRENCY": "buy_currency",
+    "CREDIT": "sell",
+    "CREDIT CURRENCY": "sell_currency",
+    "FEES/COMMISSION": "fees",
+    "BUY/SELL": "buy_sell",
+    "QUANTITY": "quantity",
+    "ASSET": "Ticker",
+    "PRICE PER UNIT": "price_per_unit"
+}
+
+def _normalize_yuh_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    # only use specific types and columns
+    df = df[df['ACTIVITY TYPE'].isin(['INVEST_ORDER_EXECUTED', 'CASH_TRANSACTION_RELATED_OTHER'])]
+    df = df[YUH_REQUIRED_COLUMNS].rename(columns=YUH_COLUMN_MAP)
+    df["platform"] = "Yuh"
+
+    # merge buy_currency and sell_currency and take the one that is not NULL, then remove the original columns
+    df["currency"] = df["buy_currency"].combine_first(df["sell_currency"])
+    df = df.drop(columns=["buy_currency", "sell_currency"])
+    for col in NUMERIC_TRANSACTION_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+@backend_perf.timed()
+def read_yuh_csv(file, chunksize=50_000) -> pd.DataFrame:
+    """
+    Stream a yuh csv file into the transactions table, chunk by chunk
+    Deduplication happens in SQLite via the UNIQUE tx_hash index (INSERT OR IGNORE), so the cost
+    grows with the size of the file, not with the size of the database.
+    Returns: DataFrame with rows/inserted/duplicates per chunk
     """
     try:
-        df = pd.read_csv(file, sep=';', engine='python', on_bad_lines='skip')
+        chunks = pd.read_csv(file, sep=';', on_bad_lines='skip', dtype=str, chunksize=chunksize)
+        first = next(chunks, None)
     except Exception as e:
         print(f"Fehler beim Einlesen der CSV: {e}")
         return pd.DataFrame({"Fehler": [str(e)]})
+    if first is None:
+        return pd.DataFrame(columns=["chunk", "rows", "inserted", "duplicates"])
 
-    required_cols = ["DATE", "ACTIVITY TYPE", "ACTIVITY NAME", "DEBIT", "DEBIT CURRENCY", "CREDIT", "CREDIT CURRENCY", "FEES/COMMISSION", "BUY/SELL", "QUANTITY", "ASSET", "PRICE PER UNIT"]
-    missing_cols = [col for col in required_cols if col not in df.columns]
+    missing_cols = [col for col in YUH_REQUIRED_COLUMNS if col not in first.columns]
     if missing_cols:
         error_msg = f"Fehlende Spalten in der CSV: {missing_cols}"
         print("read_yuh_csv()", error_msg)
-        return pd.DataFrame({"Fehler": [error_msg], "Gefundene Spalten": [str(list(df.columns))]})
+        return pd.DataFrame({"Fehler": [error_msg], "Gefundene Spalten": [str(list(first.columns))]})
 
-    # Read existing transactions from the database
+    engine = get_engine("portfolio")
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    seen, report = {}, []
     try:
-        existing = get_transactions()
-    except Exception:
-        existing = pd.DataFrame()
+        for i, chunk in enumerate(_chain(first, chunks)):
+            df = _normalize_yuh_chunk(chunk)
+            df["tx_hash"] = transaction_hashes(df, seen)
+            with engine.begin() as conn:
+                inserted = _insert_or_ignore(conn, df)
+            report.append({"chunk": i, "rows": len(df), "inserted": inserted, "duplicates": len(df) - inserted})
+    except Exception as e:
+        print(f"Fehler beim Einlesen der CSV: {e}")
+        report.append({"chunk": len(report), "rows": 0, "inserted": 0, "duplicates": 0, "Fehler": str(e)})
+    apply_position_deltas(engine)
 
-    # only use specific types and columns
-    df = df[df['ACTIVITY TYPE'].isin(['INVEST_ORDER_EXECUTED', 'CASH_TRANSACTION_RELATED_OTHER'])]
-    
-    df = df[["DATE", "ACTIVITY TYPE", "ACTIVITY NAME", "DEBIT", "DEBIT CURRENCY", "CREDIT", "CREDIT CURRENCY", "FEES/COMMISSION", "BUY/SELL", "QUANTITY", "ASSET", "PRICE PER UNIT"]]
-    column_map = {
-        "DATE": "date",
-        "ACTIVITY TYPE": "transaction_type",
-        "ACTIVITY NAME": "transaction_info",
-        "DEBIT": "buy",     # buy stocks, -xxx from bank account view
-        "DEBIT CURRENCY": "buy_currency",
-        "CREDIT": "sell",
-        "CREDIT CURRENCY": "sell_currency",
-        "FEES/COMMISSION": "fees",
-        "BUY/SELL": "buy_sell",
-        "QUANTITY": "quantity",
-        "ASSET": "Ticker",
-        "PRICE PER UNIT": "price_per_unit"
-    }
-    df.rename(columns=column_map, inplace=True)
-    df["platform"] = "Yuh"
+    report = pd.DataFrame(report)
+    print(f"Inserted {report['inserted'].sum()} new transactions from Yuh CSV, {report['duplicates'].sum()} duplicates")
+    return report
 
-    # merge buy_currency and sell_currency and take the one that is not NULL, then remove the original columns
-    df["currency"] = df["buy_currency"].combine_first(df["sell_currency"])
-    df.drop(columns=["buy_currency", "sell_currency"], inplace=True)
-
-    # If the table is empty, insert all
-    if existing.empty:
-        insert_transactions(df)
-        print(f"Inserted {len(df)} new transactions from Yuh CSV")
-        print(f"df", df)
-        return df
-
-    # Find new transactions (rows not in existing)
-    # Assumes all columns must match for a transaction to be considered duplicate
-    merged = df.merge(existing.drop_duplicates(), how='left', indicator=True)
-    new_rows = merged[merged['_merge'] == 'left_only'].drop('_merge', axis=1)
-
-    if not new_rows.empty:
-        insert_transactions(new_rows)
-        print(f"Merged {len(new_rows)} new transactions from Yuh CSV")
-        print(f"new_rows", new_rows)
-    return new_rows
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+def update_current_prices(prices, engine=None) -> int:
+    """
+    Update the current price of several tickers in the current_positions table, one transaction
+    Args:
+    - prices: {ticker: price} or Series indexed by Ticker, missing prices are skipped
+    Returns the number of updated positions
+    """
+    engine = engine or get_engine("portfolio")
+    params = [(float(price), ticker) for ticker, price in dict(prices).items() if pd.notnull(price)]
+    if not params:
+        return 0
+    ensure_schema(engine, PORTFOLIO_MIGRATIONS)
+    with engine.begin() as conn:
+        result = conn.exec_driver_sql("UPDATE current_positions SET [Current Price] = ? WHERE Ticker = ?", params)
+        bump_data_version("current_positions", conn)
+    return result.rowcount
 
 def update_current_price(ticker, price):
     """
     Update the current price for a given ticker in the current_positions table.
     """
-    import sqlite3
-    conn = sqlite3.connect("portfolio.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE current_positions SET [Current Price]=? WHERE Ticker=?",
-        (price, ticker)
-    )
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    update_current_prices({ticker: price})
+
+# --- Price history store (market.db) ---
+def _migrate_price_history(conn):
+    # IF NOT EXISTS: market.db files created before the migrations keep their bars
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS price_history (
+            symbol TEXT NOT NULL, interval TEXT NOT NULL, date TEXT NOT NULL,
+            Open REAL, High REAL, Low REAL, Close REAL, Volume REAL,
+            PRIMARY KEY (symbol, interval, date)
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS price_history_coverage (
+            symbol TEXT NOT NULL, interval TEXT NOT NULL,
+            start TEXT NOT NULL, "end" TEXT NOT NULL, fetched_at TEXT NOT NULL,
+            PRIMARY KEY (symbol, interval)
+        )""")
+
+MARKET_MIGRATIONS = [
+    _migrate_price_history,
+]
+
+def get_price_history(symbol, interval, start=None, end=None, engine=None) -> pd.DataFrame:
+    """
+    Read stored OHLCV bars of a symbol, optionally sliced to [start, end] ('yyyy-mm-dd hh:mm:ss' strings)
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    query = "SELECT date, Open, High, Low, Close, Volume FROM price_history WHERE symbol = :symbol AND interval = :interval"
+    params = {"symbol": symbol, "interval": interval}
+    if start is not None:
+        query += " AND date >= :start"
+        params["start"] = start
+    if end is not None:
+        query += " AND date <= :end"
+        params["end"] = end
+    df = pd.read_sql(text(query + " ORDER BY date"), engine, params=params)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop("date")), name="Date")
+    return df
+
+def get_close_summary(symbols, as_of, start, interval="1d", engine=None) -> pd.DataFrame:
+    """
+    Per symbol from the stored closes, aggregated in SQL instead of reading every bar (nothing is downloaded):
+    High, Low and Count of the closes since start, and the last close on or before each as_of date
+    (columns 'Close <date>', looking back at most 10 days)
+    Args:
+    - as_of: list of pd.Timestamp
+    - start: pd.Timestamp, start of the high/low window
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    symbols_json = _json_list(symbols)
+    where = "symbol IN (SELECT value FROM json_each(?)) AND interval = ?"
+    summary = pd.DataFrame(index=pd.Index(list(dict.fromkeys(symbols)), name="symbol"))
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"""
+            SELECT symbol, MAX(Close), MIN(Close), COUNT(Close) FROM price_history
+            WHERE {where} AND date >= ? GROUP BY symbol""",
+            (symbols_json, interval, start.strftime("%Y-%m-%d"))).fetchall()
+        stats = pd.DataFrame(rows, columns=["symbol", "High", "Low", "Count"]).set_index("symbol")
+        summary = summary.join(stats)
+        for date in as_of:
+            # bare column with MAX(): SQLite returns the Close of the row with the latest date
+            rows = conn.exec_driver_sql(f"""
+                SELECT symbol, MAX(date), Close FROM price_history
+                WHERE {where} AND date >= ? AND date <= ? GROUP BY symbol""",
+                (symbols_json, interval, (date - pd.DateOffset(days=10)).strftime("%Y-%m-%d"),
+                 date.strftime("%Y-%m-%d 23:59:59"))).fetchall()
+            closes = pd.Series({symbol: close for symbol, _, close in rows}, dtype=float)
+            summary[f"Close {date:%Y-%m-%d}"] = closes.reindex(summary.index)
+    summary["Count"] = summary["Count"].fillna(0)
+    return summary
+
+def get_last_closes(symbols, interval="1d", engine=None) -> dict:
+    """
+    Last stored close per symbol, nothing is downloaded. Returns {symbol: close}, symbols without bars are missing
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    with engine.connect() as conn:
+        # bare column with MAX(): SQLite returns the Close of the row with the latest date
+        rows = conn.exec_driver_sql("""
+            SELECT symbol, MAX(date), Close FROM price_history
+            WHERE symbol IN (SELECT value FROM json_each(?)) AND interval = ? GROUP BY symbol""",
+            (_json_list(symbols), interval)).fetchall()
+    return {symbol: close for symbol, _, close in rows}
+
+def upsert_price_history(symbol, interval, df: pd.DataFrame, engine=None):
+    """
+    Insert or overwrite bars (DataFrame with DatetimeIndex and OHLCV columns), bumps the price_history data version
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    if df.empty:
+        return
+    rows = pd.DataFrame({col: pd.to_numeric(df[col], errors="coerce") if col in df.columns else None
+                         for col in ["Open", "High", "Low", "Close", "Volume"]}, index=df.index)
+    rows = rows.astype(object).where(rows.notna(), None)
+    rows["date"] = df.index.strftime("%Y-%m-%d %H:%M:%S")
+    rows["symbol"] = symbol
+    rows["interval"] = interval
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT OR REPLACE INTO price_history (symbol, interval, date, Open, High, Low, Close, Volume)
+            VALUES (:symbol, :interval, :date, :Open, :High, :Low, :Close, :Volume)"""),
+            rows.to_dict("records"))
+    bump_external_version("price_history")
+
+def get_history_coverage(symbol, interval, engine=None):
+    """
+    Returns the stored range as dict(start, end, fetched_at) or None if nothing is stored
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    with engine.connect() as conn:
+        row = conn.execute(text("""SELECT start, "end", fetched_at FROM price_history_coverage
+                                   WHERE symbol = :symbol AND interval = :interval"""),
+                           {"symbol": symbol, "interval": interval}).mappings().first()
+    return dict(row) if row else None
+
+def get_history_summary(symbol, interval, engine=None):
+    """
+    What is stored for (symbol, interval), from the primary key index: dict(rows, first, last) plus
+    Close and Volume of the last bar, or None if nothing is stored. Changes with every stored bar, also
+    when the last bar is overwritten with a newer price.
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    params = {"symbol": symbol, "interval": interval}
+    with engine.connect() as conn:
+        rows, first, last = conn.execute(text("""SELECT COUNT(*), MIN(date), MAX(date) FROM price_history
+                                                 WHERE symbol = :symbol AND interval = :interval"""), params).one()
+        if not rows:
+            return None
+        close, volume = conn.execute(text("""SELECT Close, Volume FROM price_history
+                                             WHERE symbol = :symbol AND interval = :interval AND date = :last"""),
+                                     {**params, "last": last}).one()
+    return {"rows": rows, "first": first, "last": last, "close": close, "volume": volume}
+
+def get_history_coverages(engine=None) -> pd.DataFrame:
+    """
+    Stored range of every (symbol, interval): columns symbol, interval, start, end, fetched_at
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    return pd.read_sql('SELECT symbol, interval, start, "end", fetched_at FROM price_history_coverage', engine)
+
+def set_history_coverage(symbol, interval, start, end, fetched_at, engine=None):
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    with engine.begin() as conn:
+        conn.execute(text("""INSERT OR REPLACE INTO price_history_coverage (symbol, interval, start, "end", fetched_at)
+                             VALUES (:symbol, :interval, :start, :end, :fetched_at)"""),
+                     {"symbol": symbol, "interval": interval, "start": start, "end": end, "fetched_at": fetched_at})
+
+# --- Quote / fundamentals cache (market.db), see backend_fundamentals ---
+def _migrate_quote_cache(conn):
+    conn.exec_driver_sql("""
+        CREATE TABLE quote_cache (
+            symbol TEXT PRIMARY KEY,
+            [Current Price] REAL, price_at TEXT,
+            [Price/Book] REAL, [PE Ratio] REAL, [Market Cap] REAL, [PEG Ratio] REAL, Beta REAL,
+            [Free Cash Flow] REAL, [Revenue Growth YoY (%)] REAL, fundamentals_at TEXT,
+            failures INTEGER NOT NULL DEFAULT 0, retry_at TEXT, last_error TEXT
+        )""")
+
+MARKET_MIGRATIONS.append(_migrate_quote_cache)
+
+def get_quote_cache(symbols, engine=None) -> pd.DataFrame:
+    """
+    Cached quotes of the symbols, DataFrame indexed by symbol (symbols never fetched are missing)
+    """
+    engine = engine or get_engine("market")
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    return pd.read_sql(text("SELECT * FROM quote_cache WHERE symbol IN (SELECT value FROM json_each(:symbols))"),
+                       engine, params={"symbols": _json_list(symbols)}).set_index("symbol")
+
+def store_quote_prices(prices, fetched_at, engine=None):
+    """
+    Store fresh prices {symbol: price}
+    """
+    engine = engine or get_engine("market")
+    params = [(symbol, float(price), fetched_at) for symbol, price in prices.items()]
+    if not params:
+        return
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""
+            INSERT INTO quote_cache (symbol, [Current Price], price_at) VALUES (?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET [Current Price] = excluded.[Current Price], price_at = excluded.price_at""", params)
+    bump_external_version("quote_cache")
+
+def store_fundamentals(quotes, fetched_at, engine=None):
+    """
+    Store fresh fundamentals {symbol: quote dict with the KPI columns}, clears the failure backoff.
+    The price is not touched.
+    """
+    engine = engine or get_engine("market")
+    fields = KPI_COLUMNS[1:]
+    params = [(symbol, *[quote.get(field) for field in fields], fetched_at) for symbol, quote in quotes.items()]
+    if not params:
+        return
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    columns = ", ".join(f"[{field}]" for field in fields)
+    updates = ", ".join(f"[{field}] = excluded.[{field}]" for field in fields)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"""
+            INSERT INTO quote_cache (symbol, {columns}, fundamentals_at) VALUES ({", ".join("?" for _ in range(len(fields) + 2))})
+            ON CONFLICT(symbol) DO UPDATE SET {updates}, fundamentals_at = excluded.fundamentals_at,
+                failures = 0, retry_at = NULL, last_error = NULL""", params)
+    bump_external_version("quote_cache")
+
+def store_quote_failures(failures, engine=None):
+    """
+    Record failed fundamentals fetches {symbol: (failures, retry_at, error message)}
+    """
+    engine = engine or get_engine("market")
+    params = [(symbol, count, retry_at, error) for symbol, (count, retry_at, error) in failures.items()]
+    if not params:
+        return
+    ensure_schema(engine, MARKET_MIGRATIONS)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("""
+            INSERT INTO quote_cache (symbol, failures, retry_at, last_error) VALUES (?, ?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET failures = excluded.failures, retry_at = excluded.retry_at,
+                last_error = excluded.last_error""", params)
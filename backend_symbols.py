@@ -0,0 +1,215 @@
+import time
+import threading
+import pandas as pd
+import backend_perf
+import backend_sqlite
+
+# Broker ticker -> provider symbol, quote currency and asset class. The index (symbol_index table) is
+# built once per (ticker, currency) and validated with one bulk price download (refresh_worker.py).
+# Pairs that are not indexed yet resolve by the default rules, without a network call. User overrides
+# are kept as they are. Symbols the provider doesn't know are marked failed with a backoff, the fetch
+# layer skips them until the next validation.
+
+# Broker tickers whose provider symbol doesn't follow the rules: ticker -> (symbol, asset class)
+DEFAULT_SYMBOLS = {
+    "ADA": ("ADA-USD", "crypto"),
+    "ALG": ("ALGO-USD", "crypto"),
+    "ASML": ("ASML.AS", "equity"),
+    "DOT": ("DOT-USD", "crypto"),
+    "ETH": ("ETH-USD", "crypto"),
+    "LNK": ("LINK-USD", "crypto"),
+    "LTC": ("LTC-USD", "crypto"),
+    "XBT": ("BTC-USD", "crypto"),
+    "RND": ("RENDER-USD", "crypto"),
+    "VAX": ("AVAX-USD", "crypto"),
+    "SOL": ("SOL-USD", "crypto"),
+    "XRP": ("XRP-USD", "crypto"),
+    "GAL": ("GALA-USD", "crypto"),
+    "AAV": ("AAVE-USD", "crypto"),
+    "BNT": ("BNT-USD", "crypto"),
+    "POL": ("POL-USD", "crypto"),
+    "ZRX": ("ZRX-USD", "crypto"),
+    "CHDVD SW Equity": ("CHDVD.SW", "etf"),
+}
+ASSET_CLASSES = ["equity", "etf", "fund", "bond", "crypto", "commodity", "fx", "index"]
+
+# Failed symbols are not validated (or fetched) again before 1 h, 2 h, 4 h, ... at most 7 days
+RETRY_BASE = pd.Timedelta(hours=1)
+RETRY_MAX = pd.Timedelta(days=7)
+RELOAD_INTERVAL = 5.0  # seconds between checks whether another process changed the index
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_lock = threading.Lock()
+_state = {"url": None, "version": None, "checked": 0.0, "entries": {}, "failed": {}}
+
+
+def _guess_asset_class(symbol):
+    if symbol.endswith("=X"):
+        return "fx"
+    if symbol.startswith("^"):
+        return "index"
+    if symbol.endswith("-USD"):
+        return "crypto"
+    return "equity"
+
+
+def rule_symbol(ticker, currency):
+    """
+    Symbol by the default rules: DEFAULT_SYMBOLS, CHF listings on SIX get '.SW'. Provider symbols of
+    indices (^SSMI) and FX pairs (USDCHF=X) are used as they are.
+    Returns (symbol, quote currency, asset class)
+    """
+    if ticker in DEFAULT_SYMBOLS:
+        symbol, asset_class = DEFAULT_SYMBOLS[ticker]
+        return symbol, "USD" if asset_class == "crypto" else currency, asset_class
+    if ticker.startswith("^") or ticker.endswith("=X"):
+        return ticker, currency, _guess_asset_class(ticker)
+    symbol = f"{ticker}.SW" if currency == "CHF" else ticker
+    return symbol, currency, _guess_asset_class(symbol)
+
+
+def _load():
+    index = backend_sqlite.get_symbol_index()
+    entries = {(row["ticker"], row["currency"]): row for row in index.to_dict("records")}
+    failed = {}
+    for row in entries.values():
+        if row["status"] == "failed" and isinstance(row["retry_at"], str):
+            failed[row["symbol"]] = max(failed.get(row["symbol"], ""), row["retry_at"])
+    return entries, failed
+
+
+def _current():
+    """
+    The index in memory, reloaded when the symbol_index data version changed
+    """
+    now = time.monotonic()
+    url = backend_sqlite.DB_URLS["portfolio"]
+    if _state["url"] == url and now - _state["checked"] < RELOAD_INTERVAL:
+        return _state
+    with _lock:
+        version = backend_sqlite.data_version("symbol_index")
+        if _state["url"] != url or _state["version"] != version:
+            backend_perf.count("symbols.reload")
+            _state["entries"], _state["failed"] = _load()
+            _state["url"], _state["version"] = url, version
+        _state["checked"] = now
+    return _state
+
+
+def invalidate():
+    _state["checked"] = 0.0
+    _state["version"] = None
+
+
+def lookup(ticker, currency):
+    """
+    Index entry of the pair (dict with SYMBOL_INDEX_COLUMNS) or None. User overrides come first, the
+    entry for this currency before the one for all currencies ('').
+    """
+    entries = _current()["entries"]
+    found = [entry for entry in (entries.get((ticker, currency or "")), entries.get((ticker, ""))) if entry is not None]
+    return next((entry for entry in found if entry["source"] == "user"), found[0] if found else None)
+
+
+def resolve_symbol(ticker, currency):
+    """
+    Map a broker ticker to the provider symbol: the index entry or, if not indexed, the default rules
+    """
+    entry = lookup(ticker, currency)
+    return entry["symbol"] if entry else rule_symbol(ticker, currency)[0]
+
+
+def failed_symbols(symbols, now=None):
+    """
+    Symbols whose validation failed and that are still in backoff, they are not fetched
+    """
+    now = (now or pd.Timestamp.now()).strftime(DATE_FORMAT)
+    failed = _current()["failed"]
+    return {symbol for symbol in symbols if failed.get(symbol, "") > now}
+
+
+def is_failed(symbol, now=None):
+    return bool(failed_symbols([symbol], now))
+
+
+def retry_after(failures):
+    return min(RETRY_BASE * 2 ** max(failures - 1, 0), RETRY_MAX)
+
+
+@backend_perf.timed()
+def build_index(pairs, provider, now=None, force=False):
+    """
+    Add and validate index entries for (ticker, currency) pairs with one bulk price download: a symbol
+    without a price is marked failed. Only pairs that are new, unverified or failed with an expired
+    backoff are checked (all with force). The symbol comes from the default rules, user overrides keep
+    theirs. There is no guessing of other symbols, a wrong listing would quote in another currency.
+    Returns the entries that were written (DataFrame with SYMBOL_INDEX_COLUMNS)
+    """
+    now = now or pd.Timestamp.now()
+    stamp = now.strftime(DATE_FORMAT)
+    todo = {}
+    for ticker, currency in dict.fromkeys(pairs):
+        if not isinstance(ticker, str) or not ticker:
+            continue
+        currency = currency if isinstance(currency, str) else ""
+        entry = lookup(ticker, currency)
+        due = entry is None or entry["status"] == "unverified" or \
+            (entry["status"] == "failed" and (entry["retry_at"] or "") <= stamp)
+        if force or due:
+            user = entry is not None and entry["source"] == "user"
+            todo[(ticker, currency)] = (entry, entry["symbol"] if user else rule_symbol(ticker, currency)[0])
+    if not todo:
+        return pd.DataFrame(columns=backend_sqlite.SYMBOL_INDEX_COLUMNS)
+
+    symbols = list(dict.fromkeys(symbol for _, symbol in todo.values()))
+    backend_perf.count("provider.calls")
+    try:
+        with backend_perf.span("provider.download_prices", symbols=len(symbols)):
+            prices = provider.download_prices(symbols)
+    except Exception as e:
+        # provider down: nothing is known about the symbols, keep the index as it is
+        print(f"Symbol validation failed: {e}")
+        return pd.DataFrame(columns=backend_sqlite.SYMBOL_INDEX_COLUMNS)
+
+    rows = []
+    for (ticker, currency), (entry, symbol) in todo.items():
+        if entry is not None and entry["source"] == "user":
+            row = dict(entry)
+        else:
+            _, quote_currency, asset_class = rule_symbol(ticker, currency)
+            row = {"ticker": ticker, "currency": currency, "symbol": symbol, "quote_currency": quote_currency,
+                   "asset_class": asset_class, "source": "default" if ticker in DEFAULT_SYMBOLS else "rule"}
+        row["checked_at"] = stamp
+        if symbol in prices:
+            row.update(status="ok", failures=0, retry_at=None, last_error=None)
+        else:
+            failures = int((entry or {}).get("failures") or 0) + 1
+            row.update(status="failed", failures=failures, retry_at=(now + retry_after(failures)).strftime(DATE_FORMAT),
+                       last_error=f"no price for {symbol}")
+            print(f"Symbol {symbol} for {ticker}-{currency} not found (failure {failures}), retry after {row['retry_at']}")
+        rows.append(row)
+    backend_sqlite.store_symbol_index(rows)
+    invalidate()
+    return pd.DataFrame(rows, columns=backend_sqlite.SYMBOL_INDEX_COLUMNS)
+
+
+def set_override(ticker, currency, symbol, asset_class=None, quote_currency=None):
+    """
+    User mapping of a broker ticker, currency None or '' for all currencies of the ticker. The symbol
+    is validated on the next build_index.
+    """
+    currency = currency or ""
+    backend_sqlite.store_symbol_index([{
+        "ticker": ticker, "currency": currency, "symbol": symbol, "source": "user", "status": "unverified",
+        "quote_currency": quote_currency or currency or None, "asset_class": asset_class or _guess_asset_class(symbol),
+    }])
+    invalidate()
+
+
+def remove_entry(ticker, currency=""):
+    """
+    Remove an index entry (e.g. a user override), the pair is indexed again by the rules
+    """
+    backend_sqlite.delete_symbol_index(ticker, currency)
+    invalidate()
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import backend_cache
+import backend_perf
+import backend_positions
+import backend_history
+import backend_fx
+import backend_symbols
+
+# Grid of valuation points per chart interval, intraday intervals use the timestamps of the bars
+GRID_FREQ = {"1d": "B", "1wk": "W-FRI", "1mo": "BME"}
+INTRADAY_INTERVALS = {"1m", "15m", "1h"}
+
+# (period, interval) -> (fingerprint of the transactions, value series), see get_valuation_series
+_series_cache = {}
+# (currency, target) pairs without FX rates that were reported already, see fx_matrix
+_missing_fx = set()
+
+
+def period_start(period, first_date=None):
+    """
+    Start of a period: '1mo', '5y', 'max' (first transaction) or a DateOffset dict like {"months": 1}
+    """
+    now = pd.Timestamp.now()
+    if isinstance(period, dict):
+        return (now - pd.DateOffset(**period)).normalize()
+    if period == "max":
+        return pd.Timestamp(first_date).normalize() if first_date is not None else now.normalize()
+    return now.normalize() - backend_history.PERIOD_OFFSETS.get(period, backend_history.PERIOD_OFFSETS["1mo"])
+
+
+def holdings_matrix(tx, dates):
+    """
+    Quantity held per ticker at each date (dates x tickers), from the cumulative signed quantities
+    Args:
+    - tx: output of backend_positions.prepare_transactions
+    - dates: sorted DatetimeIndex
+    """
+    tickers = tx.attrs["tickers"]
+    changes = pd.DataFrame({"date": tx["date"], "code": tx["code"], "q": tx["signed_quantity"]}) \
+        .groupby(["date", "code"])["q"].sum().unstack(fill_value=0.0) \
+        .reindex(columns=range(len(tickers)), fill_value=0.0).cumsum()
+    idx = changes.index.searchsorted(dates, side="right") - 1
+    held = changes.to_numpy()[np.clip(idx, 0, None)] if len(changes) else np.zeros((len(dates), len(tickers)))
+    held[idx < 0] = 0.0
+    return pd.DataFrame(held, index=dates, columns=pd.Index(tickers, name="Ticker"))
+
+
+@backend_cache.cached(ttl=3600, tables=("price_history",))
+def load_closes(symbols, start, interval="1d"):
+    """
+    Close prices of all symbols joined on one index (last known close carried forward). Cached until
+    new bars are stored (e.g. the intraday bars of the "1 Tag" chart), at most an hour.
+    Args:
+    - symbols: tuple of provider symbols
+    - start: first date needed
+    - interval: intraday intervals use their own bars, all others the stored daily closes
+    """
+    base = interval if interval in INTRADAY_INTERVALS else "1d"
+    closes = {}
+    for symbol in symbols:
+        close = backend_history.get_history_range(symbol, start=start, interval=base, columns=["Close"])["Close"].dropna()
+        closes[symbol] = close[~close.index.duplicated(keep="last")]
+    return pd.DataFrame(closes, columns=list(symbols)).sort_index().ffill()
+
+
+def close_matrix(symbols, dates, interval="1d", fill_start=True):
+    """
+    Close prices aligned on dates (dates x symbols), last known close on or before each date.
+    Dates before the first known close get the first close, or NaN with fill_start=False.
+    """
+    dates = pd.DatetimeIndex(dates)
+    # month start as cache key, so consecutive days share the loaded prices
+    start = (dates.min() - pd.DateOffset(days=7)).to_period("M").start_time
+    closes = load_closes(tuple(symbols), start, interval)
+    if fill_start:
+        closes = closes.bfill()
+    if closes.empty:
+        return pd.DataFrame(np.nan, index=dates, columns=list(symbols))
+    idx = closes.index.searchsorted(dates, side="right") - 1
+    values = closes.to_numpy()[np.clip(idx, 0, None)]
+    if not fill_start:
+        values[idx < 0] = np.nan
+    return pd.DataFrame(values, index=dates, columns=list(symbols))
+
+
+def fx_matrix(currencies, dates, target=backend_fx.BASE_CURRENCY):
+    """
+    FX rates to target per ticker currency (dates x tickers), one rate series per distinct currency.
+    NaN for currencies without any rate (never parity), they are reported once per process.
+    """
+    rates = {currency: backend_fx.get_rates(currency, dates, target) for currency in pd.unique(currencies)}
+    missing = [currency for currency, rate in rates.items() if np.isnan(rate).all() and (currency, target) not in _missing_fx]
+    if missing:
+        _missing_fx.update((currency, target) for currency in missing)
+        print(f"No FX rate to {target} for {', '.join(map(str, missing))}: positions in these currencies are not valued")
+    return pd.DataFrame({i: rates[currency] for i, currency in enumerate(currencies)}, index=dates)
+
+
+def date_grid(start, end, interval):
+    if interval in INTRADAY_INTERVALS:
+        return None  # defined by the intraday bars
+    grid = pd.date_range(start.normalize(), end.normalize(), freq=GRID_FREQ.get(interval, "B"))
+    # always end with today so the last point is the current value
+    if len(grid) == 0 or grid[-1] != end.normalize():
+        grid = grid.append(pd.DatetimeIndex([end.normalize()]))
+    return grid
+
+
+@backend_perf.timed()
+def valuation_matrix(tx, dates, interval="1d"):
+    """
+    Value in CHF per ticker at each date: holdings * close * fx, in one vectorized product
+    """
+    currencies = tx.attrs["info"]["Currency"].reindex(tx.attrs["tickers"])
+    return value_holdings(holdings_matrix(tx, dates), currencies, interval)
+
+
+def value_holdings(held, currencies, interval="1d"):
+    """
+    Value in CHF of held quantities (dates x tickers, e.g. from holdings_matrix or backend_holdings).
+    NaN where a ticker is held but its currency has no FX rate, sums (pandas) skip these positions.
+    Args:
+    - currencies: trading currency per ticker (Series indexed by Ticker), CHF where missing
+    """
+    dates = held.index
+    tickers = held.columns
+    currencies = currencies.reindex(tickers).fillna(backend_fx.BASE_CURRENCY).to_numpy()
+    symbols = tuple(backend_symbols.resolve_symbol(t, c) for t, c in zip(tickers, currencies))
+
+    # only symbols that were ever held in the window need prices
+    active = (held.abs() > backend_positions.EPS).any(axis=0).to_numpy()
+    values = np.zeros(held.shape)
+    if active.any():
+        active_symbols = tuple(np.array(symbols, dtype=object)[active])
+        prices = np.nan_to_num(close_matrix(active_symbols, dates, interval).to_numpy(), nan=0.0)
+        fx = fx_matrix(currencies[active], dates).to_numpy()
+        quantities = held.to_numpy()[:, active]
+        values[:, active] = np.where(np.abs(quantities) > backend_positions.EPS, quantities * prices * fx, 0.0)
+    return pd.DataFrame(values, index=dates, columns=held.columns)
+
+
+def _intraday_grid(tx, start, interval):
+    # timestamps of the intraday bars of all held symbols
+    positions = backend_positions.compute_positions(tx)
+    held = positions[positions["Quantity"] > backend_positions.EPS]
+    stamps = pd.DatetimeIndex([])
+    for ticker, currency in zip(held["Ticker"], held["Currency"]):
+        hist = backend_history.get_history_range(backend_symbols.resolve_symbol(ticker, currency), start=start, interval=interval)
+        stamps = stamps.union(hist.index)
+    return stamps
+
+
+def valuation_series(tx, start, end=None, interval="1d"):
+    """
+    Total portfolio value in CHF for every grid point between start and end
+    """
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+    dates = date_grid(start, end, interval) if interval not in INTRADAY_INTERVALS else _intraday_grid(tx, start, interval)
+    if dates is None or len(dates) == 0 or tx.empty:
+        return pd.Series(dtype=float, name="Value (CHF)")
+    return valuation_matrix(tx, dates, interval).sum(axis=1).rename("Value (CHF)")
+
+
+def extend_valuation(series, tx, start, interval="1d"):
+    """
+    Extend an existing value series with the new days only. The last point is recomputed because it
+    may have been valued with an intraday price. Points before start are dropped.
+    """
+    if series is None or series.empty:
+        return valuation_series(tx, start, interval=interval)
+    last = series.index[-1]
+    if last.normalize() < start.normalize() or interval in INTRADAY_INTERVALS:
+        return valuation_series(tx, start, interval=interval)
+    new = valuation_series(tx, last, interval=interval)
+    series = pd.concat([series[series.index < last], new])
+    return series[series.index >= start]
+
+
+def _fingerprint(tx):
+    if tx.empty:
+        return 0
+    return int(pd.util.hash_pandas_object(tx[["code", "date", "signed_quantity"]], index=False).sum())
+
+
+@backend_perf.timed()
+def get_valuation_series(df, period="1y", interval="1d"):
+    """
+    Portfolio value series in CHF for a chart period, extended incrementally between calls as long as
+    the transactions did not change
+    Args:
+    - df: transactions table
+    - period: '1d'..'max' like the dashboard or a DateOffset dict
+    """
+    tx = backend_positions.prepare_transactions(df)
+    if tx.empty:
+        return pd.Series(dtype=float, name="Value (CHF)")
+    start = period_start(period, tx["date"].min())
+    key = (str(period), interval)
+    fingerprint = _fingerprint(tx)
+    cached = _series_cache.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        backend_perf.count("valuation.extend")
+        series = extend_valuation(cached[1], tx, start, interval)
+    else:
+        backend_perf.count("valuation.full")
+        series = valuation_series(tx, start, interval=interval)
+    _series_cache[key] = (fingerprint, series)
+    return series
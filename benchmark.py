@@ -0,0 +1,327 @@
+"""
+Benchmarks with synthetic portfolios and the offline FakeProvider, no network needed
+
+    python benchmark.py                                  # 1k and 100k rows
+    python benchmark.py --sizes 1k,100k,1M --repeat 5
+    python benchmark.py --only read_yuh_csv,valuation_series --compare benchmark_results/old.json
+    python benchmark.py --generate 100k --output-csv yuh_100k.csv   # only write a synthetic Yuh CSV
+
+Every benchmark runs once as warm-up (reported as first_s, usually the cold path), `repeat` times
+timed and once more under tracemalloc for the peak memory. Results are written as JSON.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import backend_cache
+import backend_sqlite
+import backend_market_data
+import backend_symbols
+import backend_valuation
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+# currency of the synthetic tickers and how often it occurs
+CURRENCY_WEIGHTS = {"USD": 0.5, "CHF": 0.25, "EUR": 0.15, "GBP": 0.05, "SEK": 0.05}
+# crypto tickers as Yuh names them (see backend_symbols.DEFAULT_SYMBOLS), traded in USD
+CRYPTO_TICKERS = ["XBT", "ETH", "SOL", "LNK", "LTC", "VAX"]
+
+
+# --- Synthetic data ---
+def synthetic_tickers(n, seed=0) -> pd.DataFrame:
+    """
+    n tickers with Name and Currency, the first few are crypto
+    """
+    rng = np.random.default_rng(seed)
+    crypto = CRYPTO_TICKERS[:max(0, min(len(CRYPTO_TICKERS), n // 20))]
+    stocks = [f"S{i:04d}" for i in range(n - len(crypto))]
+    currencies = rng.choice(list(CURRENCY_WEIGHTS), len(stocks), p=list(CURRENCY_WEIGHTS.values()))
+    return pd.DataFrame({
+        "Ticker": crypto + stocks,
+        "Name": [f"{t} Crypto" for t in crypto] + [f"Company {t}" for t in stocks],
+        "Currency": ["USD"] * len(crypto) + list(currencies),
+    })
+
+
+def synthetic_transactions(rows, n_tickers=300, seed=0, start="2015-01-01", provider=None) -> pd.DataFrame:
+    """
+    Transactions table (TRANSACTION_COLUMNS, ISO dates) with BUY/SELL orders at the FakeProvider close
+    of the day. Some tickers are traded much more often than others. Sells are smaller than buys,
+    so most positions stay open.
+    """
+    rng = np.random.default_rng(seed)
+    provider = provider or backend_market_data.FakeProvider()
+    tickers = synthetic_tickers(n_tickers, seed)
+    popularity = 1 / np.arange(1, n_tickers + 1) ** 0.8
+    pick = rng.choice(n_tickers, rows, p=popularity / popularity.sum())
+
+    start = pd.Timestamp(start)
+    days = (pd.Timestamp.now().normalize() - start).days
+    seconds = np.sort(rng.integers(0, days * 86_400, rows))
+    dates = start + pd.to_timedelta(seconds, unit="s")
+    dates = dates.floor("min")
+
+    is_buy = rng.random(rows) < 0.65
+    quantity = np.where(is_buy, rng.integers(1, 21, rows), rng.integers(1, 11, rows)).astype(float)
+    price = np.empty(rows)
+    for code in np.unique(pick):
+        mask = pick == code
+        ticker, currency = tickers.loc[code, "Ticker"], tickers.loc[code, "Currency"]
+        price[mask] = provider._close(backend_symbols.resolve_symbol(ticker, currency), dates[mask])
+    price = price.round(4)
+    amount = (quantity * price).round(2)
+    fees = np.round(1 + amount * 0.001, 2)
+    side = np.where(is_buy, "BUY", "SELL")
+    return pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d %H:%M:%S"),
+        "transaction_type": "INVEST_ORDER_EXECUTED",
+        "transaction_info": [f"{s} {q:g}x {n}" for s, q, n in zip(side, quantity, tickers["Name"].to_numpy()[pick])],
+        "buy": np.where(is_buy, -amount, np.nan),
+        "sell": np.where(is_buy, np.nan, amount),
+        "fees": fees,
+        "buy_sell": side,
+        "quantity": quantity,
+        "Ticker": tickers["Ticker"].to_numpy()[pick],
+        "price_per_unit": price,
+        "platform": "Yuh",
+        "currency": tickers["Currency"].to_numpy()[pick],
+    })
+
+
+def to_yuh_csv(tx: pd.DataFrame, path, other_share=0.05, seed=0):
+    """
+    Write transactions in the Yuh export format (';', day-first dates), with some cash rows
+    that the importer filters out
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.to_datetime(tx["date"])
+    yuh = pd.DataFrame({
+        "DATE": dates.dt.strftime("%d/%m/%Y %H:%M"),
+        "ACTIVITY TYPE": tx["transaction_type"],
+        "ACTIVITY NAME": tx["transaction_info"],
+        "DEBIT": tx["buy"],
+        "DEBIT CURRENCY": tx["currency"].where(tx["buy_sell"] == "BUY"),
+        "CREDIT": tx["sell"],
+        "CREDIT CURRENCY": tx["currency"].where(tx["buy_sell"] == "SELL"),
+        "CARD NUMBER": None,
+        "LOCALITY": None,
+        "RECIPIENT": None,
+        "SENDER": None,
+        "FEES/COMMISSION": tx["fees"],
+        "BUY/SELL": tx["buy_sell"],
+        "QUANTITY": tx["quantity"],
+        "ASSET": tx["Ticker"],
+        "PRICE PER UNIT": tx["price_per_unit"],
+    })
+    n_other = int(len(yuh) * other_share)
+    if n_other:
+        other = pd.DataFrame({
+            "DATE": yuh["DATE"].sample(n_other, random_state=seed, replace=True).to_numpy(),
+            "ACTIVITY TYPE": "CARD_TRANSACTION",
+            "ACTIVITY NAME": "Migros",
+            "DEBIT": -rng.uniform(5, 200, n_other).round(2),
+            "DEBIT CURRENCY": "CHF",
+        })
+        yuh = pd.concat([yuh, other], ignore_index=True)
+    yuh.to_csv(path, sep=";", index=False)
+
+
+def split_monthly(csv_path, directory):
+    """
+    Split a Yuh CSV into one export per month (like the monthly statements), for the bulk import
+    """
+    yuh = pd.read_csv(csv_path, sep=";", dtype=str)
+    directory = Path(directory)
+    directory.mkdir(exist_ok=True)
+    for month, rows in yuh.groupby(yuh["DATE"].str[6:10] + "-" + yuh["DATE"].str[3:5]):
+        rows.to_csv(directory / f"yuh_{month}.csv", sep=";", index=False)
+
+
+# --- Runner ---
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def use_data_dir(path):
+    """
+    Point all databases to path and drop everything cached in memory
+    """
+    backend_sqlite.configure(**{name: f"sqlite:///{Path(path) / f'{name}.db'}" for name in backend_sqlite.DB_URLS})
+    backend_cache.get_backend().clear()
+    backend_valuation._series_cache.clear()
+
+
+def measure(run, setup=None, repeat=3):
+    """
+    Returns dict with first_s (warm-up run), runs, min_s, median_s and peak_mb (tracemalloc)
+    """
+    def once():
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
+
+    first = once()
+    runs = [once() for _ in range(repeat)]
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"first_s": round(first, 4), "runs": [round(r, 4) for r in runs], "min_s": round(min(runs), 4),
+            "median_s": round(statistics.median(runs), 4), "peak_mb": round(peak / 2**20, 2)}
+
+
+def render_dashboard():
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(str(Path(__file__).parent / "streamlit_dashboard.py"), default_timeout=600)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+
+def benchmarks(csv_path, workdir):
+    """
+    (name, setup, run) of all benchmarks for one synthetic portfolio. The setups leave the
+    databases in the state the benchmark needs.
+    """
+    import backend_analysis
+    import backend_holdings
+    import backend_import
+    import backend_returns
+    import backend_snapshots
+
+    loaded = Path(workdir) / "loaded"
+    counter = iter(range(10**6))
+
+    def fresh_db():
+        path = Path(workdir) / f"empty{next(counter)}"
+        path.mkdir()
+        use_data_dir(path)
+
+    def loaded_db():
+        use_data_dir(loaded)
+
+    def cold_caches():
+        loaded_db()
+
+    return [
+        ("read_yuh_csv", fresh_db, lambda: backend_sqlite.read_yuh_csv(csv_path)),
+        ("bulk_import[monthly files]", fresh_db, lambda: backend_import.import_path(Path(workdir) / "monthly")),
+        ("get_current_positions", loaded_db, lambda: backend_analysis.get_current_positions()),
+        ("get_current_positions[fifo]", loaded_db, lambda: backend_analysis.get_current_positions(method="fifo")),
+        ("get_total_up2_chf", loaded_db, lambda: backend_analysis.get_total_up2_chf({"months": 1})),
+        ("read_transactions[5 columns]", loaded_db,
+         lambda: backend_snapshots.read_transactions(["date", "Ticker", "buy_sell", "quantity", "price_per_unit"])),
+        ("holdings_at[250 dates]", loaded_db,
+         lambda: backend_holdings.holdings_at(pd.date_range("2015-01-01", pd.Timestamp.now(), periods=250))),
+        ("valuation_series[1y]", cold_caches, lambda: backend_analysis.get_total_graph_chf("1y", "1d")),
+        ("valuation_series[max,1wk]", cold_caches, lambda: backend_analysis.get_total_graph_chf("max", "1wk")),
+        ("returns[all periods]", loaded_db,
+         lambda: backend_returns.compute_returns(backend_sqlite.transactions_snapshot())),
+        ("dashboard_render", cold_caches, render_dashboard),
+    ]
+
+
+def run_benchmarks(sizes, n_tickers=300, repeat=3, only=None, seed=0):
+    backend_market_data.set_provider(backend_market_data.FakeProvider())
+    results = []
+    for size in sizes:
+        rows = SIZES.get(size) or int(size)
+        with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as workdir:
+            csv_path = Path(workdir) / "yuh.csv"
+            to_yuh_csv(synthetic_transactions(rows, n_tickers, seed), csv_path, seed=seed)
+            split_monthly(csv_path, Path(workdir) / "monthly")
+            (Path(workdir) / "loaded").mkdir()
+            use_data_dir(Path(workdir) / "loaded")
+            backend_sqlite.read_yuh_csv(csv_path)
+
+            for name, setup, run in benchmarks(csv_path, workdir):
+                if only and name not in only:
+                    continue
+                if name == "dashboard_render":
+                    try:
+                        import streamlit.testing.v1  # noqa: F401
+                    except ImportError:
+                        print(f"{name}: skipped, streamlit is not installed")
+                        continue
+                result = {"name": name, "rows": rows, "tickers": n_tickers, **measure(run, setup, repeat)}
+                print(f"{name:30} {size:>6}  first {result['first_s']:8.3f}s  median {result['median_s']:8.3f}s  "
+                      f"peak {result['peak_mb']:8.1f} MB", flush=True)
+                results.append(result)
+    return results
+
+
+def compare(results, baseline_path):
+    """
+    Print the median times relative to an earlier result file
+    """
+    baseline = {(r["name"], r["rows"]): r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    print(f"\nCompared to {baseline_path}:")
+    for r in results:
+        old = baseline.get((r["name"], r["rows"]))
+        if old:
+            ratio = r["median_s"] / old["median_s"] if old["median_s"] else float("nan")
+            print(f"{r['name']:30} {r['rows']:>8}  {old['median_s']:8.3f}s -> {r['median_s']:8.3f}s  x{ratio:5.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Timing and peak memory benchmarks on synthetic portfolios")
+    parser.add_argument("--sizes", default="1k,100k", help="comma separated: 1k, 10k, 100k, 1M or row counts")
+    parser.add_argument("--tickers", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma separated benchmark names")
+    parser.add_argument("--output", help="result file, default benchmark_results/<date>-<commit>.json")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--generate", metavar="SIZE", help="only write a synthetic Yuh CSV of this size")
+    parser.add_argument("--output-csv", default="yuh_synthetic.csv")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        rows = SIZES.get(args.generate) or int(args.generate)
+        to_yuh_csv(synthetic_transactions(rows, args.tickers, args.seed), args.output_csv, seed=args.seed)
+        print(f"Wrote {rows} transactions to {args.output_csv}")
+        return
+
+    only = set(args.only.split(",")) if args.only else None
+    results = run_benchmarks(args.sizes.split(","), args.tickers, args.repeat, only, args.seed)
+    commit = _commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = Path(args.output) if args.output else \
+        Path("benchmark_results") / f"{pd.Timestamp.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Bulk import of broker exports into the portfolio database: all CSV files of a directory or a zip
+archive, parsed in parallel, the broker is detected per file (see backend_import.ADAPTERS).
+
+    python bulk_import.py exports/                  # directory, recursive
+    python bulk_import.py yuh_2015-2025.zip --broker Yuh
+    python bulk_import.py exports/ --report import_report.csv
+"""
+import argparse
+import backend_import
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import broker CSV exports (directory, zip or file)")
+    parser.add_argument("path", help="directory, zip archive or CSV file")
+    parser.add_argument("--broker", choices=sorted(backend_import.ADAPTERS), help="skip the detection, use this adapter for all files")
+    parser.add_argument("--max-workers", type=int, default=None, help="parser processes (default: one per CPU)")
+    parser.add_argument("--report", help="write the per-file report to this CSV")
+    args = parser.parse_args(argv)
+
+    report = backend_import.import_path(args.path, broker=args.broker, max_workers=args.max_workers)
+    print(report.to_string(index=False))
+    if args.report:
+        report.to_csv(args.report, index=False)
+    return report
+
+
+if __name__ == "__main__":
+    main()
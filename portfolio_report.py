@@ -0,0 +1,112 @@
+"""
+Positions and valuation report from the local databases, without Streamlit
+
+    python portfolio_report.py                                   # table on stdout
+    python portfolio_report.py --format csv --output report.csv
+    python portfolio_report.py --data-dir /data/alice --valuation 1y --format json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+import pandas as pd
+import backend_sqlite
+import backend_market_data
+import backend_symbols
+import backend_positions
+import backend_history
+import backend_fx
+import backend_valuation
+
+REPORT_COLUMNS = ["Ticker", "Name", "Currency", "Quantity", "Buy Price", "Cost Basis", "Current Price",
+                  "Unrealized P&L", "Realized P&L", "Fees", "Value (CHF)", "Weight (%)"]
+
+
+def _last_close(ticker, currency):
+    hist = backend_history.get_history_range(backend_symbols.resolve_symbol(ticker, currency),
+                                             start=pd.Timestamp.now().normalize() - pd.DateOffset(days=10))
+    return hist["Close"].iloc[-1] if not hist.empty else None
+
+
+def positions_report(method="average") -> pd.DataFrame:
+    """
+    Open positions with price, unrealized P&L and value in CHF. Prices come from the quote cache
+    (refresh_worker.py), the last stored close if a symbol was never quoted.
+    """
+    if method == "average":
+        positions = backend_sqlite.get_current_positions()[backend_positions.POSITION_COLUMNS]
+    else:
+        positions = backend_positions.compute_positions(backend_sqlite.transactions_snapshot(), method=method)
+    positions = positions[positions["Quantity"] > backend_positions.EPS].reset_index(drop=True)
+
+    symbols = [backend_symbols.resolve_symbol(t, c) for t, c in zip(positions["Ticker"], positions["Currency"])]
+    prices = backend_sqlite.get_quote_cache(symbols)["Current Price"].reindex(symbols).to_numpy()
+    positions["Current Price"] = prices
+    missing = positions["Current Price"].isna()
+    positions.loc[missing, "Current Price"] = [_last_close(t, c) for t, c in
+                                               zip(positions.loc[missing, "Ticker"], positions.loc[missing, "Currency"])]
+    positions["Current Price"] = pd.to_numeric(positions["Current Price"], errors="coerce")
+
+    positions = backend_positions.add_unrealized_pnl(positions)
+    positions["Value (CHF)"] = backend_fx.convert(positions["Current Price"], positions["Currency"]) * positions["Quantity"]
+    positions["Weight (%)"] = positions["Value (CHF)"] / positions["Value (CHF)"].sum() * 100
+    return positions[REPORT_COLUMNS].sort_values("Value (CHF)", ascending=False).reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print or export a positions/valuation report")
+    parser.add_argument("--data-dir", help="directory with portfolio.db, watchlist.db and market.db")
+    parser.add_argument("--portfolio-db", help="SQLAlchemy URL of the portfolio database")
+    parser.add_argument("--market-db", help="SQLAlchemy URL of the market data database")
+    parser.add_argument("--method", choices=["average", "fifo"], default="average", help="cost basis method")
+    parser.add_argument("--valuation", metavar="PERIOD", help="add the value series, e.g. 1mo, 1y, max")
+    parser.add_argument("--interval", default="1d", help="interval of the value series (1d, 1wk, 1mo)")
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    parser.add_argument("--output", "-o", help="file to write, default stdout")
+    parser.add_argument("--provider", choices=["yfinance", "fake"], default="yfinance",
+                        help="source for missing history (fake: offline)")
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        backend_sqlite.configure(**{name: f"sqlite:///{Path(args.data_dir) / f'{name}.db'}" for name in backend_sqlite.DB_URLS})
+    if args.portfolio_db:
+        backend_sqlite.configure(portfolio=args.portfolio_db)
+    if args.market_db:
+        backend_sqlite.configure(market=args.market_db)
+    if args.provider == "fake":
+        backend_market_data.set_provider(backend_market_data.FakeProvider())
+
+    positions = positions_report(args.method)
+    series = None
+    if args.valuation:
+        series = backend_valuation.get_valuation_series(backend_sqlite.transactions_snapshot(), args.valuation, args.interval)
+
+    if args.format == "json":
+        report = {
+            "generated_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "total_chf": float(positions["Value (CHF)"].sum()),
+            "positions": json.loads(positions.to_json(orient="records")),
+        }
+        if series is not None:
+            report["valuation"] = {date.strftime("%Y-%m-%d %H:%M:%S"): value for date, value in series.items()}
+        text = json.dumps(report, indent=2)
+    elif args.format == "csv":
+        text = positions.to_csv(index=False)
+        if series is not None:
+            text += "\n" + series.rename_axis("Date").to_csv()
+    else:
+        text = positions.round(2).to_string(index=False)
+        text += f"\n\nTotal (CHF): {positions['Value (CHF)'].sum():,.2f}"
+        if series is not None and not series.empty:
+            change = series.iloc[-1] - series.iloc[0]
+            text += (f"\nValue {args.valuation}: {series.iloc[0]:,.2f} -> {series.iloc[-1]:,.2f} CHF "
+                     f"({change:+,.2f}, {len(series)} points)")
+
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
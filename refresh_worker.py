@@ -0,0 +1,136 @@
+"""
+Refresh worker: keeps quotes, fundamentals, FX rates and daily history of all positions and
+watchlist entries in the local databases, so the dashboard only reads SQLite.
+
+    python refresh_worker.py --once                 # one run, e.g. from cron
+    python refresh_worker.py --interval 300         # daemon, every 5 minutes
+    python refresh_worker.py --once --provider fake # offline, deterministic fake data
+"""
+import argparse
+import time
+import pandas as pd
+import backend_sqlite
+import backend_market_data
+import backend_symbols
+import backend_fundamentals
+import backend_history
+import backend_fx
+import backend_positions
+import backend_risk
+import backend_snapshots
+import backend_perf
+
+PROVIDERS = {
+    "yfinance": backend_market_data.YFinanceProvider,
+    "fake": backend_market_data.FakeProvider,
+}
+
+
+def refresh_targets() -> pd.DataFrame:
+    """
+    (Ticker, Currency) of the open positions and the watchlist, without duplicates
+    """
+    positions = backend_sqlite.get_current_positions()
+    positions = positions[positions["Quantity"] > backend_positions.EPS]
+    watchlist = backend_sqlite.get_watchlist()
+    targets = pd.concat([positions[["Ticker", "Currency"]], watchlist[["Ticker", "Currency"]]], ignore_index=True)
+    return targets.dropna(subset=["Ticker"]).drop_duplicates().reset_index(drop=True)
+
+
+def history_start():
+    # same year rounding as the FX series, the valuation needs everything since the first transaction
+    first = backend_sqlite.query_transactions(buy_sell=["BUY", "SELL"], columns=["date"])["date"].min()
+    start = pd.Timestamp(first) if isinstance(first, str) else pd.Timestamp.now() - pd.DateOffset(years=1)
+    return start.to_period("Y").start_time
+
+
+def run_once(provider, max_workers=4, history=True):
+    """
+    One refresh of all targets. Returns a summary dict (symbols, errors, seconds, provider calls, queries)
+    """
+    started = time.monotonic()
+    backend_perf.start_run("refresh")
+    try:
+        return _run_once(provider, max_workers, history, started)
+    finally:
+        # the run is logged as JSON (PORTFOLIO_PERF_LOG) even when it failed
+        backend_perf.end_run()
+
+
+def _run_once(provider, max_workers, history, started):
+    targets = refresh_targets()
+    # new pairs are validated once, later runs only re-check failed symbols whose backoff expired
+    pairs = list(zip(targets["Ticker"], targets["Currency"]))
+    backend_symbols.build_index(pairs, provider)
+    symbols = [backend_symbols.resolve_symbol(t, c) for t, c in pairs]
+    failed = backend_symbols.failed_symbols(symbols)
+    unique = [symbol for symbol in dict.fromkeys(symbols) if symbol not in failed]
+
+    # prices every run, fundamentals only when stale and not in backoff
+    _, stale_infos = backend_fundamentals.stale_symbols(backend_sqlite.get_quote_cache(unique), unique)
+    # also writes the KPI columns of the positions
+    errors = backend_fundamentals.refresh(unique, stale_infos, provider, max_workers=max_workers)
+
+    benchmarks = [backend_risk.benchmark_symbol(name) for name in backend_risk.BENCHMARKS]
+    currencies = list(targets["Currency"].dropna().unique()) + [currency for _, currency in benchmarks]
+    fx = list(dict.fromkeys(s for currency in currencies for s in backend_fx.fx_symbols(currency)))
+    if history:
+        start = history_start()
+        # benchmarks of the risk section (the symbols price_matrix reads), for the beta
+        for symbol in dict.fromkeys(unique + fx + [symbol for symbol, _ in benchmarks]):
+            backend_history.fill_gaps(symbol, "1d", start, provider)
+    else:
+        for symbol in fx:
+            backend_history.fill_gaps(symbol, "1d", pd.Timestamp.now().normalize() - pd.DateOffset(days=7), provider)
+
+    # columnar snapshots of the new bars and KPIs for the readers
+    backend_snapshots.refresh()
+
+    refreshed_at = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    with backend_sqlite.engine_portfolio.begin() as conn:
+        backend_sqlite.set_meta("last_refresh", refreshed_at, conn)
+        backend_sqlite.set_meta("last_refresh_errors", len(errors), conn)
+    counters = backend_perf.current().counters
+    return {"refreshed_at": refreshed_at, "symbols": len(unique), "unknown_symbols": len(failed), "fx": len(fx), "errors": len(errors),
+            "seconds": round(time.monotonic() - started, 2), "provider_calls": counters["provider.calls"],
+            "queries": counters["db.queries"]}
+
+
+def run_forever(provider, interval, max_workers=4, history=True):
+    """
+    Run every `interval` seconds (measured from the start of a run) until interrupted
+    """
+    next_run = time.monotonic()
+    while True:
+        try:
+            print(run_once(provider, max_workers=max_workers, history=history), flush=True)
+        except Exception as e:
+            # keep the daemon alive, the next run may succeed
+            print(f"Refresh failed: {e}", flush=True)
+        next_run += interval
+        time.sleep(max(0.0, next_run - time.monotonic()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch market data into the local databases")
+    parser.add_argument("--once", action="store_true", help="run once and exit (cron)")
+    parser.add_argument("--interval", type=float, default=300, help="seconds between runs (default 300)")
+    parser.add_argument("--provider", choices=sorted(PROVIDERS), default="yfinance")
+    parser.add_argument("--max-workers", type=int, default=4, help="parallel fundamentals requests")
+    parser.add_argument("--rate-limit", type=float, default=2.0, help="provider calls per second")
+    parser.add_argument("--no-history", action="store_true", help="skip the daily price history")
+    args = parser.parse_args(argv)
+
+    provider = backend_market_data.RateLimitedProvider(PROVIDERS[args.provider](), args.rate_limit)
+    backend_market_data.set_provider(provider)
+    if args.once:
+        print(run_once(provider, max_workers=args.max_workers, history=not args.no_history))
+        return
+    try:
+        run_forever(provider, args.interval, max_workers=args.max_workers, history=not args.no_history)
+    except KeyboardInterrupt:
+        print("Refresh worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
+import functools
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
 import backend_sqlite  # Importiere das Backend-Modul
 import backend_analysis  # Importiere das Backend-Modul für Analysen
+import backend_history  # Lokaler Kursverlauf-Speicher
+import backend_risk  # Risikokennzahlen
+import backend_returns  # Rendite (TWR/XIRR)
+import backend_charts  # Chart-Daten auf Punktebudget reduzieren
+import backend_screener  # Screener über die Watchlist
+import backend_import  # Bulk-Import (mehrere Dateien/Broker)
+import backend_symbols  # Symbol-Index (Broker-Ticker -> Yahoo)
+import backend_market_data  # Datenquelle (Provider)
+import backend_perf  # Zeitmessung
+import backend_live  # Live-Kurse
 
 # TODO: Verknüpfung von Transaktionen und Portfolie
 # TODO: Berechnung Performance und aktueller Portfoliostand
@@ -13,135 +23,348 @@ import backend_analysis  # Importiere das Backend-Modul für Analysen
 
 # Page config
 st.set_page_config(page_title="Portfolio Dashboard", layout="wide")
+backend_perf.start_run("rerun")
 
-# --- Input Data ---
-with st.spinner("Lade aktuelle Positionen..."):
-    current_positions = backend_analysis.get_current_positions()
 
-# Entferne doppelte Spaltennamen
-current_positions = current_positions.loc[:, ~current_positions.columns.duplicated()]
+def plotly_chart(fig, name):
+    # Rendern eines Charts mit Zeitmessung und Anzahl Punkte
+    points = sum(len(trace.x) for trace in fig.data if getattr(trace, "x", None) is not None)
+    with backend_perf.span(f"plot.{name}", points=points):
+        st.plotly_chart(fig, use_container_width=True)
+
 
-# --- Preis & Kennzahlen ---
-if "Current Price" not in current_positions.columns or current_positions["Current Price"].isnull().any():
-    # Fallback: Hole die Preise direkt bzw. neu
-    current_positions["Current Price"] = current_positions.apply(
-        lambda row: backend_analysis.fetch_kpis(row["Ticker"], row["Currency"]).get("Current Price", None), axis=1
-    )
+def price_trace(hist, style, budget):
+    # Kursverlauf als Linie (downsampled) oder als Kerzen (OHLC aggregiert), höchstens budget Punkte
+    if style == "Kerzen":
+        candles = backend_charts.to_ohlc(hist, budget)
+        return go.Candlestick(x=candles.index, open=candles["Open"].to_numpy(), high=candles["High"].to_numpy(),
+                              low=candles["Low"].to_numpy(), close=candles["Close"].to_numpy(), name="Kurs")
+    close = backend_charts.downsample(hist["Close"], budget)
+    return go.Scatter(x=close.index, y=close.to_numpy(), mode="lines", name="Kurs", line=dict(color="royalblue"))
+
+
+def fragment(fn=None, run_every=None):
+    # Abschnitt, der bei Änderung seiner eigenen Eingaben (oder alle run_every Sekunden) allein neu läuft
+    # (st.fragment), ein solcher Teil-Rerun wird als eigener Lauf gemessen
+    if fn is None:
+        return functools.partial(fragment, run_every=run_every)
+
+    @st.fragment(run_every=run_every)
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        partial = not backend_perf.active()
+        if partial:
+            backend_perf.start_run(f"fragment.{fn.__name__}")
+        try:
+            with backend_perf.span(f"fragment.{fn.__name__}"):
+                return fn(*args, **kwargs)
+        finally:
+            if partial:
+                backend_perf.end_run()
+    return wrapper
+
+
+# Zeitraum und Intervall der Portfolio Entwicklung
+change_duration = {
+    "1 Tag": ("1d", "1m"),
+    "1 Woche": ("1wk", "1d"),
+    "1 Monat": ("1mo", "1d"),
+    "6 Monate": ("6mo", "1d"),
+    "1 Jahr": ("1y", "1d"),
+    "5 Jahre": ("5y", "1wk"),
+    "10 Jahre": ("10y", "1wk"),
+    "20 Jahre": ("20y", "1mo"),
+    "Max": ("max", "1mo")
+}
+
+# Zeitraum-Auswahl für Kursentwicklung
+duration_map = {
+    "1 Tag": ("1d", "1m"),
+    "1 Woche": ("1wk", "15m"),
+    "1 Monat": ("1mo", "1d"),
+    "6 Monate": ("6mo", "1d"),
+    "1 Jahr": ("1y", "1d"),
+    "5 Jahre": ("5y", "1d"),
+    "10 Jahre": ("10y", "1wk"),
+    "20 Jahre": ("20y", "1wk"),
+    "Max": ("max", "1wk")
+}
+
+risk_periods = {"6 Monate": "6mo", "1 Jahr": "1y", "2 Jahre": "2y", "5 Jahre": "5y", "10 Jahre": "10y", "20 Jahre": "20y"}
+
+
+@fragment
+def portfolio_development(returns, chart_budget):
+    # Zeitraum-Wechsel rechnet nur diesen Abschnitt neu
+    st.markdown("### 📈 Portfolio Entwicklung")
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        selected_change = st.selectbox("Zeitraum Portfolio Entwicklung:", list(change_duration.keys()), index=4)
+    total_period, total_interval = change_duration[selected_change]
 
-current_positions["Value (CHF)"] = current_positions.apply(lambda row: backend_analysis.convert_to_chf(row) * row["Quantity"], axis=1)
-current_positions["Profit/Loss"] = (current_positions["Current Price"] - current_positions["Buy Price"]) * current_positions["Quantity"]
-current_positions["Profit/Loss (%)"] = ((current_positions["Current Price"] - current_positions["Buy Price"]) / current_positions["Buy Price"]) * 100
+    # --- Rendite: zeitgewichtet (TWR) und geldgewichtet (XIRR) für alle Zeiträume ---
+    period_labels = {period: label for label, (period, _) in change_duration.items()}
+    portfolio_returns = returns[returns["Ticker"] == backend_returns.PORTFOLIO].set_index("Period")
+    with col2:
+        if total_period in portfolio_returns.index:
+            growth = portfolio_returns.loc[total_period]
+            st.metric(f"Value Development ({selected_change})", f"{growth['TWR (%)']:.2f} %",
+                      help=f"Zeitgewichtet (TWR). Geldgewichtet: {growth['MWR (%)']:.2f} % "
+                           f"({growth['XIRR p.a. (%)']:.2f} % p.a.)")
+        else:
+            st.metric("Value Development", "–")
+    total_series = backend_analysis.get_total_graph_chf(total_period, total_interval)
+    fig_total = go.Figure()
+    total_points = backend_charts.downsample(total_series, chart_budget)
+    fig_total.add_trace(go.Scatter(x=total_points.index, y=total_points.to_numpy(), mode="lines", name="Portfolio (CHF)",
+                                   line=dict(color="seagreen")))
+    fig_total.update_layout(title=f"Portfolio Wert ({selected_change})", xaxis_title="Datum", yaxis_title="CHF", height=400)
+    plotly_chart(fig_total, "portfolio_total")
+
+    with st.expander("📐 Renditen nach Zeitraum"):
+        st.markdown("**Portfolio**")
+        st.dataframe(portfolio_returns.drop(columns="Ticker").rename(index=period_labels).round(2), use_container_width=True)
+        return_measure = st.radio("Kennzahl pro Position:", ["TWR (%)", "MWR (%)", "XIRR p.a. (%)"], horizontal=True)
+        per_ticker = returns.pivot(index="Ticker", columns="Period", values=return_measure)
+        per_ticker = per_ticker.reindex(columns=[p for p in period_labels if p in per_ticker.columns]).rename(columns=period_labels)
+        st.dataframe(per_ticker.round(2), use_container_width=True)
+
+
+@fragment
+def price_history(tickers, label, chart_style, chart_budget, markers=False):
+    # Kursentwicklung einer Position (mit Kauf/Verkauf-Markern) oder eines Watchlist-Eintrags
+    selected_name = st.selectbox(label, tickers["Name"])
+    ticker_values = tickers[tickers["Name"] == selected_name]["Ticker"].values
+    selected_ticker = ticker_values[0] if len(ticker_values) > 0 else None
 
-# --- Rundung ---
-round_cols = ["Buy Price", "Current Price", "Value (CHF)", "Profit/Loss", "Profit/Loss (%)", "EPS", "PE Ratio",
-              "PEG Ratio", "Beta", "Free Cash Flow", "Revenue Growth YoY (%)"]
-existing_round_cols = [col for col in round_cols if col in current_positions.columns]
-current_positions[existing_round_cols] = current_positions[existing_round_cols].round(3)
+    selected_duration = st.selectbox("Zeitraum für Kursentwicklung:", list(duration_map.keys()), index=5)
+    period, interval = duration_map[selected_duration]
+
+    if not selected_ticker:
+        return
+    hist = backend_history.get_history(selected_ticker, period, interval)
+    fig = go.Figure()
+    fig.add_trace(price_trace(hist, chart_style, chart_budget))
+    fig.update_layout(title=f"Kursentwicklung von {selected_ticker} ({selected_duration}, {interval})",
+                      xaxis_title="Datum", yaxis_title="Kurs", height=500, xaxis_rangeslider_visible=False)
+    if not markers:
+        plotly_chart(fig, "watchlist_history")
+        return
+
+    # Get transactions for this ticker in the visible range and add buy/sell points to graph
+    transactions = pd.DataFrame(columns=["date", "buy_sell", "price_per_unit", "quantity"])
+    if not hist.empty:
+        transactions = backend_sqlite.query_transactions(tickers=selected_ticker, buy_sell=["BUY", "SELL"],
+                                                         start=hist.index[0], end=hist.index[-1],
+                                                         columns=["date", "buy_sell", "price_per_unit", "quantity"])
+        transactions["date"] = pd.to_datetime(transactions["date"], format="ISO8601", errors="coerce")
+        transactions = backend_charts.clip_markers(transactions, hist.index[0], hist.index[-1] + pd.DateOffset(days=1),
+                                                   chart_budget)
+
+    # Buy markers
+    buys = transactions[transactions["buy_sell"] == "BUY"]
+    buy_dates = buys["date"]
+    buy_prices = buys["price_per_unit"]
+    # buy_prices = [hist["Close"].loc[date] if date in hist.index else None for date in buy_dates]
+    fig.add_trace(go.Scatter(
+        x=buy_dates, y=buy_prices,
+        mode="markers", name="Buy",
+        marker=dict(color="green", size=12, symbol="triangle-up", line=dict(width=2, color="black")),
+        showlegend=True
+    ))
+
+    # Sell markers
+    sells = transactions[transactions["buy_sell"] == "SELL"]
+    sell_dates = sells["date"]
+    sell_prices = sells["price_per_unit"]
+    # sell_prices = [hist["Close"].loc[date] if date in hist.index else None for date in sell_dates]
+    fig.add_trace(go.Scatter(
+        x=sell_dates, y=sell_prices,
+        mode="markers", name="Sell",
+        marker=dict(color="red", size=12, symbol="triangle-down", line=dict(width=2, color="black")),
+        showlegend=True
+    ))
+
+    plotly_chart(fig, "position_history")
+
+
+@fragment
+def risk_section(current_positions):
+    # --- Risiko der aktuellen Positionen ---
+    st.markdown("### ⚠️ Risiko")
+    col1, col2, col3 = st.columns([1, 1, 1])
+    with col1:
+        risk_benchmark = st.selectbox("Benchmark:", list(backend_risk.BENCHMARKS.keys()))
+    with col2:
+        risk_period = st.selectbox("Zeitraum Risiko:", list(risk_periods.keys()), index=1)
+    with col3:
+        risk_level = st.selectbox("Konfidenzniveau VaR:", [0.95, 0.99], format_func=lambda level: f"{level:.0%}")
+    risk = backend_risk.portfolio_risk(current_positions, risk_benchmark, risk_periods[risk_period], risk_level)
+    summary = risk["summary"]
+    cols = st.columns(5)
+    cols[0].metric("Volatilität p.a.", f"{summary['Volatility (%)']:.2f} %")
+    cols[1].metric(f"VaR 1 Tag ({risk_level:.0%})", f"{summary['VaR hist. (%)']:.2f} %",
+                   help=f"parametrisch: {summary['VaR param. (%)']:.2f} %")
+    cols[2].metric(f"CVaR 1 Tag ({risk_level:.0%})", f"{summary['CVaR hist. (%)']:.2f} %",
+                   help=f"parametrisch: {summary['CVaR param. (%)']:.2f} %")
+    cols[3].metric("Max Drawdown", f"{summary['Max Drawdown (%)']:.2f} %")
+    cols[4].metric(f"Beta ({risk_benchmark})", f"{summary['Beta']:.2f}")
+
+    fig_risk = go.Figure()
+    rolling_volatility = risk["rolling_volatility"][backend_risk.PORTFOLIO].dropna()
+    fig_risk.add_trace(go.Scatter(x=rolling_volatility.index, y=rolling_volatility.values, mode="lines",
+                                  name="Volatilität (63 Tage)", line=dict(color="firebrick")))
+    fig_risk.update_layout(title="Rollierende Volatilität p.a. (%)", xaxis_title="Datum", yaxis_title="%", height=350)
+    plotly_chart(fig_risk, "rolling_volatility")
+
+    with st.expander("Risiko pro Position und Korrelationen"):
+        st.dataframe(risk["per_ticker"].round(3), use_container_width=True)
+        fig_corr = go.Figure(go.Heatmap(z=risk["correlation"].to_numpy(), x=risk["correlation"].columns,
+                                        y=risk["correlation"].index, zmin=-1, zmax=1, colorscale="RdBu"))
+        fig_corr.update_layout(title="Korrelation der Tagesrenditen", height=500)
+        plotly_chart(fig_corr, "correlation")
+
+
+def live_positions(interval, total_value_chf):
+    # --- Live-Kurse: nur die seit dem letzten Lauf geänderten Zeilen werden übernommen ---
+    feed = backend_live.get_feed(interval)
+    if st.session_state.get("live_feed") != id(feed):
+        st.session_state["live_feed"] = id(feed)
+        st.session_state["live_seq"] = -1
+    changes, seq, live_total, full = feed.changes_since(st.session_state["live_seq"])
+    if full:
+        st.session_state["live_table"] = changes
+    elif not changes.empty:
+        st.session_state["live_table"].loc[changes.index, changes.columns] = changes
+    st.session_state["live_seq"] = seq
+    live_table = st.session_state["live_table"]
+
+    st.markdown("### 📡 Live-Kurse")
+    st.metric("Total Value Portfolio (live)", f"{live_total:.3f} CHF", delta=f"{live_total - total_value_chf:.3f} CHF")
+    st.dataframe(live_table[live_table["held"]].drop(columns="held").round(3), use_container_width=True)
+    watched = live_table[~live_table["held"]]
+    if not watched.empty:
+        with st.expander(f"Watchlist ({len(watched)})"):
+            st.dataframe(watched[["Name", "Current Price", "Change (%)"]].round(3), use_container_width=True)
+    stats = feed.stats
+    st.caption(f"{len(changes)} Zeilen aktualisiert · {stats['ticks']} Abfragen ({stats['provider_calls']} Provider-Aufrufe, "
+               f"{stats['skipped_ticks']} übersprungen) · letzte: {stats['last_tick'] or '–'} ({stats['last_tick_ms']} ms) · "
+               f"Quelle: {feed.provider.name}")
+
+
+def show_watchlist():
+    # --- Watchlist aus Datenbank laden ---
+    watchlist = backend_analysis.get_watchlist()
+    st.markdown("### 👀 Watchlist")
+    # Kurse & Kennzahlen für alle Einträge in einem Batch
+    quotes = backend_analysis.fetch_kpis_bulk(tuple(watchlist["Ticker"]), tuple(watchlist["Currency"]))
+    st.dataframe(watchlist.merge(quotes, left_on="Ticker", right_index=True, how="left"), use_container_width=True)
+    return watchlist
+
+
+@fragment
+def screener(watchlist):
+    # --- Screener über die ganze Watchlist (Kennzahlen aus dem Cache, keine Abfrage pro Ticker) ---
+    st.markdown("### 🔎 Screener")
+    universe = backend_screener.load_universe(watchlist)
+    metric_columns = list(backend_screener.RANK_ASCENDING)
+    default_filters = pd.DataFrame({"Kennzahl": ["PE Ratio", "Momentum 6M (%)"], "Operator": ["<=", ">"], "Wert": [25.0, 0.0]})
+    filter_table = st.data_editor(
+        default_filters, num_rows="dynamic", use_container_width=True, key="screener_filters",
+        column_config={
+            "Kennzahl": st.column_config.SelectboxColumn(options=metric_columns, required=True),
+            "Operator": st.column_config.SelectboxColumn(options=[op for op in backend_screener.OPS if op != "between"], required=True),
+            "Wert": st.column_config.NumberColumn(required=True),
+        })
+    screen_filters = [(row["Kennzahl"], row["Operator"], row["Wert"]) for _, row in filter_table.dropna().iterrows()]
+
+    col1, col2, col3 = st.columns([3, 1, 1])
+    with col1:
+        rank_by = st.multiselect("Ranking nach (gleich gewichtet):", metric_columns, default=["PE Ratio", "Momentum 6M (%)"])
+    with col2:
+        page_size = st.selectbox("Zeilen pro Seite:", [25, 50, 100], index=1)
+    with col3:
+        screen_page = st.number_input("Seite:", min_value=1, value=1, step=1)
+    screen_rows, screen_total, screen_pages = backend_screener.screen(
+        universe, screen_filters, weights={column: 1.0 for column in rank_by},
+        sort_by=None if rank_by else "Market Cap", page=screen_page, page_size=page_size)
+    st.caption(f"{screen_total} von {len(universe)} Titeln erfüllen die Filter · Seite {min(screen_page, screen_pages)} von {screen_pages}")
+    st.dataframe(screen_rows.round(2), use_container_width=True, hide_index=True)
+    without_kpis = int(universe["Current Price"].isna().sum())
+    if without_kpis:
+        st.caption(f"{without_kpis} Titel ohne Kennzahlen, `python refresh_worker.py` lädt sie in den Cache.")
+
+
+# --- Input Data ---
+# Positionen mit Wert (CHF) und P&L, gecacht bis Transaktionen, Positionen oder Kurse geschrieben werden
+with st.spinner("Lade aktuelle Positionen..."):
+    current_positions = backend_analysis.get_positions_overview().copy()
 
 # --- Portfolio Summary ---
 total_value_chf = current_positions["Value (CHF)"].sum()
-growth_pct = 10  # TODO: dynamic calculation of growth percentage
 
 # --- Seitenwahl ---
 page = st.sidebar.radio("Seite wählen", ["Portfolio", "Watchlist & Kursentwicklung"])
 
+# --- Datenstand (refresh_worker.py) ---
+last_refresh = backend_sqlite.get_meta("last_refresh")
+st.sidebar.caption(f"🔄 Zuletzt aktualisiert: {last_refresh}" if last_refresh
+                   else "🔄 Noch keine Aktualisierung, starte `python refresh_worker.py`")
+
+show_perf = st.sidebar.checkbox("⏱️ Performance anzeigen")
+
+# --- Live-Kurse (nur die neusten Kurse, im Hintergrund abgefragt) ---
+live_mode = st.sidebar.checkbox("📡 Live-Kurse")
+live_interval = st.sidebar.number_input("Live-Intervall (Sekunden)", min_value=1, max_value=300, value=5,
+                                        disabled=not live_mode)
+
+# --- Darstellung der Charts ---
+chart_style = st.sidebar.radio("Kursdarstellung", ["Linie", "Kerzen"], horizontal=True)
+chart_budget = st.sidebar.number_input("📉 Max. Punkte pro Chart", min_value=200, max_value=20000,
+                                       value=backend_charts.DEFAULT_POINT_BUDGET, step=100)
+
+# --- Wartung der Positionstabelle ---
+with st.sidebar.expander("🛠️ Wartung"):
+    if st.button("Positionen neu aufbauen"):
+        backend_sqlite.rebuild_positions()
+        st.success("Positionen wurden aus allen Transaktionen neu berechnet.")
+    if st.button("Konsistenz prüfen"):
+        mismatches = backend_sqlite.check_positions_consistency()
+        if mismatches.empty:
+            st.success("Positionen sind konsistent.")
+        else:
+            st.warning(f"{len(mismatches)} Positionen weichen ab:")
+            st.dataframe(mismatches)
+
 if page == "Portfolio":
     st.title("📊 Live Portfolio Dashboard")
     # --- Portfolio Summary ---
-    col1, col2 = st.columns([1, 1])
-    with col1:
-        st.metric("Total Value Portfolio", f"{total_value_chf:.3f} CHF")
-    with col2:
-        st.metric("Value Development", f"{growth_pct:.2f} %")
+    st.metric("Total Value Portfolio", f"{total_value_chf:.3f} CHF")
+    if live_mode:
+        fragment(live_positions, run_every=live_interval)(live_interval, total_value_chf)
 
     # Spaltenanordnung
     cols_order = ["Name", "Ticker", "Currency", "Quantity", "Buy Price", "Current Price", "Value (CHF)",
-                  "Profit/Loss", "Profit/Loss (%)", "Price/Book", "PE Ratio", "Market Cap", "PEG Ratio", "Beta",
+                  "Profit/Loss", "Profit/Loss (%)", "TWR (%)", "XIRR p.a. (%)", "Cost Basis", "Realized P&L", "Fees", "Price/Book", "PE Ratio", "Market Cap", "PEG Ratio", "Beta",
                   "Free Cash Flow", "Revenue Growth YoY (%)"]
 
+    # --- Rendite seit Beginn pro Position (gecacht bis sich Transaktionen oder Kurse ändern) ---
+    returns = backend_returns.get_returns(backend_sqlite.transactions_snapshot())
+    since_start = returns[returns["Period"] == "max"].set_index("Ticker")
+    current_positions["TWR (%)"] = current_positions["Ticker"].map(since_start["TWR (%)"]).round(3)
+    current_positions["XIRR p.a. (%)"] = current_positions["Ticker"].map(since_start["XIRR p.a. (%)"]).round(3)
 
     # --- Portfolio Entwicklungsdiagramm ---
-    change_duration = {
-        "1 Tag": ("1d", "1m"),
-        "1 Woche": ("1wk", "1d"),
-        "1 Monat": ("1mo", "1d"),
-        "6 Monate": ("6mo", "1d"),
-        "1 Jahr": ("1y", "1d"),
-        "5 Jahre": ("5y", "1wk"),
-        "10 Jahre": ("10y", "1wk"),
-        "20 Jahre": ("20y", "1mo"),
-        "Max": ("max", "1mo")
-    }
-
-    st.markdown("### 📈 Portfolio Entwicklung")
+    portfolio_development(returns, chart_budget)
 
     # circle diagram of share per stock - left side
     fig1 = go.Figure()
     fig1.add_trace(go.Pie(labels=current_positions["Name"], values=current_positions["Value (CHF)"], name="Portfolio Share"))
     fig1.update_layout(title="Portfolio Share by Stock")
-    st.plotly_chart(fig1, use_container_width=True)
-
-    portfolio_tickers = pd.concat([current_positions[["Name", "Ticker"]]])
-    selected_name = st.selectbox("Wähle eine Position aus dem Portfolio:", portfolio_tickers["Name"])
-    portfolio_ticker_values = portfolio_tickers[portfolio_tickers["Name"] == selected_name]["Ticker"].values
-    selected_portfolio_ticker = portfolio_ticker_values[0] if len(portfolio_ticker_values) > 0 else None
-
-    # Zeitraum-Auswahl für Kursentwicklung
-    duration_map = {
-        "1 Tag": ("1d", "1m"),
-        "1 Woche": ("1wk", "15m"),
-        "1 Monat": ("1mo", "1d"),
-        "6 Monate": ("6mo", "1d"),
-        "1 Jahr": ("1y", "1d"),
-        "5 Jahre": ("5y", "1d"),
-        "10 Jahre": ("10y", "1wk"),
-        "20 Jahre": ("20y", "1wk"),
-        "Max": ("max", "1wk")
-    }
-    selected_duration = st.selectbox("Zeitraum für Kursentwicklung:", list(duration_map.keys()), index=5)
-    period, interval = duration_map[selected_duration]
-
-    if selected_portfolio_ticker:
-        @st.cache_data(ttl=3600)
-        def get_history(ticker, period, interval):
-            return yf.Ticker(ticker).history(period=period, interval=interval)
-
-        hist = get_history(selected_portfolio_ticker, period, interval)
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=hist.index, y=hist["Close"], mode="lines", name="Kurs", line=dict(color="royalblue")))
-        fig.update_layout(title=f"Kursentwicklung von {selected_portfolio_ticker} ({selected_duration}, {interval})",
-                          xaxis_title="Datum", yaxis_title="Kurs", height=500)
-        
-        # Get transactions for this ticker and add buy/sell points to graph
-        transactions = backend_sqlite.get_transactions()
-        transactions = transactions[transactions["Ticker"] == selected_portfolio_ticker].copy()
-        transactions["date"] = pd.to_datetime(transactions["date"], dayfirst=True, errors="coerce")
-
-        # Buy markers
-        buys = transactions[transactions["buy_sell"] == "BUY"]
-        buy_dates = buys["date"]
-        buy_prices = buys["price_per_unit"]
-        # buy_prices = [hist["Close"].loc[date] if date in hist.index else None for date in buy_dates]
-        fig.add_trace(go.Scatter(
-            x=buy_dates, y=buy_prices,
-            mode="markers", name="Buy",
-            marker=dict(color="green", size=12, symbol="triangle-up", line=dict(width=2, color="black")),
-            showlegend=True
-        ))
-
-        # Sell markers
-        sells = transactions[transactions["buy_sell"] == "SELL"]
-        sell_dates = sells["date"]
-        sell_prices = sells["price_per_unit"]
-        # sell_prices = [hist["Close"].loc[date] if date in hist.index else None for date in sell_dates]
-        fig.add_trace(go.Scatter(
-            x=sell_dates, y=sell_prices,
-            mode="markers", name="Sell",
-            marker=dict(color="red", size=12, symbol="triangle-down", line=dict(width=2, color="black")),
-            showlegend=True
-        ))
+    plotly_chart(fig1, "portfolio_share")
 
-        st.plotly_chart(fig, use_container_width=True)
+    price_history(current_positions[["Name", "Ticker"]], "Wähle eine Position aus dem Portfolio:", chart_style, chart_budget,
+                  markers=True)
 
     st.markdown("### 📌 Current Positions")
     # Display table with sorting enabled
@@ -166,43 +389,45 @@ if page == "Portfolio":
             num_rows="dynamic"
         )
 
-        # Check for edits and update database
-        for idx, row in edited_positions.iterrows():
-            orig_price = current_positions.loc[idx, "Current Price"]
-            new_price = row["Current Price"]
-            if pd.notnull(new_price) and new_price != orig_price:
-                ticker = row["Ticker"]
-                backend_sqlite.update_current_price(ticker, new_price)
-                current_positions.loc[idx, "Current Price"] = new_price  # update in-memory
+        # Check for edits and update database (all edited prices in one transaction)
+        orig_prices = current_positions["Current Price"].reindex(edited_positions.index)
+        new_prices = edited_positions["Current Price"]
+        changed = new_prices.notna() & (new_prices != orig_prices) & edited_positions.index.isin(current_positions.index)
+        if changed.any():
+            backend_sqlite.update_current_prices(dict(zip(edited_positions.loc[changed, "Ticker"], new_prices[changed])))
+            current_positions.loc[changed[changed].index, "Current Price"] = new_prices[changed]  # update in-memory
 
 
+    st.markdown("---")
+    risk_section(current_positions)
+
     # --- Alle Transaktionen anzeigen ---
     st.markdown("---")
     st.markdown("### 📑 Alle Transaktionen")
     try:
-        transactions_df = backend_sqlite.get_transactions()
+        transactions_df = backend_sqlite.transactions_snapshot()
         st.dataframe(transactions_df, use_container_width=True, height=400)
     except Exception as e:
         st.warning(f"Transaktionen konnten nicht geladen werden: {e}")
 
     # --- Datenimport (Yuh csv, ...) ---
     st.markdown("---")
-    st.markdown("### 📥 Yuh CSV Import")
-    yuh_file = st.file_uploader("Wähle eine Yuh CSV-Datei zum Hinzufügen zur Datenbank aus", type=["csv"])
-    if yuh_file is not None:
-        yuh_df = backend_sqlite.read_yuh_csv(yuh_file)
-        st.markdown("**Vorschau der importierten Yuh CSV-Datei:**")
-        st.dataframe(yuh_df, use_container_width=True)
+    st.markdown("### 📥 CSV Import")
+    st.caption(f"Unterstützte Broker: {', '.join(backend_import.ADAPTERS)}. Mehrere Dateien oder ZIP-Archive möglich, "
+               "bereits importierte Transaktionen werden übersprungen.")
+    import_files = st.file_uploader("Wähle CSV-Dateien oder ZIP-Archive zum Hinzufügen zur Datenbank aus",
+                                    type=["csv", "zip"], accept_multiple_files=True)
+    if import_files:
+        # nur neu ausgewählte Dateien importieren, andere Eingaben zeigen den letzten Bericht
+        import_key = tuple(file.file_id for file in import_files)
+        if st.session_state.get("import_key") != import_key:
+            st.session_state["import_report"] = backend_import.import_sources(backend_import.upload_sources(import_files))
+            st.session_state["import_key"] = import_key
+        st.markdown("**Import-Bericht pro Datei:**")
+        st.dataframe(st.session_state["import_report"], use_container_width=True)
 
 elif page == "Watchlist & Kursentwicklung":
     st.title("👀 Watchlist & Kursentwicklung")
-    # --- Watchlist aus Datenbank laden ---
-    def show_watchlist():
-        watchlist = backend_sqlite.get_watchlist()
-        st.markdown("### 👀 Watchlist")
-        st.dataframe(watchlist, use_container_width=True)
-        return watchlist
-
     # --- Watchlist hinzufügen, entfernen und anzeigen ---
     st.markdown("#### ➕ Unternehmen zur Watchlist hinzufügen")
     with st.form("add_watchlist_form"):
@@ -231,45 +456,59 @@ elif page == "Watchlist & Kursentwicklung":
 
     st.markdown("#### ➖ Unternehmen aus der Watchlist entfernen")
     with st.form("remove_watchlist_form"):
-        remove_ticker = st.selectbox("Wähle ein Unternehmen zum Entfernen:", backend_sqlite.get_watchlist()["Ticker"].tolist(), key="remove_ticker")
+        remove_ticker = st.selectbox("Wähle ein Unternehmen zum Entfernen:", backend_analysis.get_watchlist()["Ticker"].tolist(), key="remove_ticker")
         remove_btn = st.form_submit_button("Aus Watchlist entfernen")
         if remove_btn and remove_ticker:
             backend_sqlite.remove_from_watchlist(remove_ticker)
             st.success(f"{remove_ticker} wurde aus der Watchlist entfernt!")
 
+    # --- Symbol-Index: Broker-Ticker -> Yahoo-Symbol (geprüft vom refresh_worker, eigene Zuordnungen) ---
+    with st.expander("🔤 Symbol-Zuordnung"):
+        st.caption("Nicht gefundene Symbole (Status 'failed') werden bis zur nächsten Prüfung nicht abgefragt. "
+                   "Eigene Zuordnungen (Quelle 'user') werden nie überschrieben.")
+        st.dataframe(backend_sqlite.get_symbol_index(), use_container_width=True)
+        with st.form("symbol_override_form"):
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                sym_ticker = st.text_input("Broker-Ticker", key="sym_ticker")
+            with col2:
+                sym_currency = st.selectbox("Währung", ["", "USD", "EUR", "CHF"], key="sym_currency",
+                                            format_func=lambda c: c or "alle")
+            with col3:
+                sym_symbol = st.text_input("Yahoo-Symbol", key="sym_symbol")
+            with col4:
+                sym_class = st.selectbox("Anlageklasse", backend_symbols.ASSET_CLASSES, key="sym_class")
+            if st.form_submit_button("Zuordnung speichern") and sym_ticker and sym_symbol:
+                backend_symbols.set_override(sym_ticker, sym_currency, sym_symbol, asset_class=sym_class)
+                st.success(f"{sym_ticker} → {sym_symbol} gespeichert, wird bei der nächsten Prüfung validiert.")
+        if st.button("Symbole jetzt prüfen"):
+            targets = pd.concat([backend_sqlite.get_current_positions(), backend_sqlite.get_watchlist()])
+            checked = backend_symbols.build_index(list(zip(targets["Ticker"], targets["Currency"])),
+                                                  backend_market_data.get_provider())
+            st.success(f"{len(checked)} Zuordnungen geprüft, {int((checked['status'] == 'failed').sum())} nicht gefunden.")
+
     watchlist = show_watchlist()  # Watchlist nach dem Hinzufügen/Entfernen neu laden und anzeigen
 
+    st.markdown("---")
+    screener(watchlist)
+
     # --- Kursentwicklung ---
     st.markdown("---")
     st.markdown("### 📈 Kursentwicklung anzeigen")
     all_tickers = pd.concat([current_positions[["Name", "Ticker"]], watchlist[["Name", "Ticker"]]])
-    selected_name = st.selectbox("Wähle eine Position aus dem Portfolio oder Watchlist:", all_tickers["Name"])
-    ticker_values = all_tickers[all_tickers["Name"] == selected_name]["Ticker"].values
-    selected_ticker = ticker_values[0] if len(ticker_values) > 0 else None
-
-    # Zeitraum-Auswahl für Kursentwicklung
-    duration_map = {
-        "1 Tag": ("1d", "1m"),
-        "1 Woche": ("1wk", "15m"),
-        "1 Monat": ("1mo", "1d"),
-        "6 Monate": ("6mo", "1d"),
-        "1 Jahr": ("1y", "1d"),
-        "5 Jahre": ("5y", "1d"),
-        "10 Jahre": ("10y", "1wk"),
-        "20 Jahre": ("20y", "1wk"),
-        "Max": ("max", "1wk")
-    }
-    selected_duration = st.selectbox("Zeitraum für Kursentwicklung:", list(duration_map.keys()), index=5)
-    period, interval = duration_map[selected_duration]
-
-    if selected_ticker:
-        @st.cache_data(ttl=3600)
-        def get_history(ticker, period, interval):
-            return yf.Ticker(ticker).history(period=period, interval=interval)
-
-        hist = get_history(selected_ticker, period, interval)
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=hist.index, y=hist["Close"], mode="lines", name="Kurs", line=dict(color="royalblue")))
-        fig.update_layout(title=f"Kursentwicklung von {selected_ticker} ({selected_duration}, {interval})",
-                          xaxis_title="Datum", yaxis_title="Kurs", height=500)
-        st.plotly_chart(fig, use_container_width=True)
+    price_history(all_tickers, "Wähle eine Position aus dem Portfolio oder Watchlist:", chart_style, chart_budget)
+
+# --- Performance (backend_perf) ---
+perf = backend_perf.end_run()
+if show_perf:
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        counters = perf["counters"]
+        st.metric("Rerun", f"{perf['total_ms']:,.0f} ms")
+        st.caption(f"{counters.get('db.queries', 0)} DB-Abfragen · {counters.get('provider.calls', 0)} Provider-Aufrufe · "
+                   f"Cache {counters.get('cache.hit', 0)} Treffer / {counters.get('cache.miss', 0)} neu berechnet")
+        spans = pd.DataFrame.from_dict(perf["spans"], orient="index").rename_axis("Schritt")
+        if not spans.empty:
+            st.dataframe(spans.sort_values("total_ms", ascending=False), use_container_width=True)
+        st.markdown("**Langsamste Aufrufe**")
+        st.dataframe(pd.DataFrame(perf["slowest"]), hide_index=True, use_container_width=True)
+        st.json(counters, expanded=False)
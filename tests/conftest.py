@@ -0,0 +1,44 @@
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import backend_sqlite
+import backend_snapshots
+import backend_market_data
+
+
+@pytest.fixture
+def portfolio_db(tmp_path, monkeypatch):
+    """
+    Empty databases in tmp_path and the offline FakeProvider, the configured locations are restored after
+    """
+    urls = dict(backend_sqlite.DB_URLS)
+    monkeypatch.setattr(backend_snapshots, "ENABLED", False)
+    backend_market_data.set_provider(backend_market_data.FakeProvider())
+    backend_sqlite.configure(**{name: f"sqlite:///{tmp_path / name}.db" for name in urls})
+    yield backend_sqlite.get_engine("portfolio")
+    backend_sqlite.configure(**urls)
+    backend_market_data.set_provider(None)
+
+
+def transactions(rows):
+    """
+    Transactions table from (date, buy_sell, ticker, quantity, price, fees) tuples
+    """
+    df = pd.DataFrame(rows, columns=["date", "buy_sell", "Ticker", "quantity", "price_per_unit", "fees"])
+    df["currency"] = "CHF"
+    df["transaction_info"] = df["Ticker"]
+    return df
+
+
+def insert_pending(df):
+    """
+    Insert transactions without applying them to current_positions (like a concurrent writer)
+    """
+    engine = backend_sqlite.get_engine("portfolio")
+    backend_sqlite.ensure_schema(engine, backend_sqlite.PORTFOLIO_MIGRATIONS)
+    with engine.begin() as conn:
+        return backend_sqlite._insert_or_ignore(conn, df.assign(tx_hash=backend_sqlite.transaction_hashes(df)))
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import backend_charts
+
+
+def random_walk(n, freq="min", seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-01", periods=n, freq=freq)
+    return pd.Series(100 + np.cumsum(rng.normal(0, 1, n)), index=index)
+
+
+def test_lttb_keeps_budget_and_ends():
+    series = random_walk(10_000)
+    keep = backend_charts.lttb(backend_charts._as_float(series.index), series.to_numpy(), 500)
+    assert len(keep) == 500
+    assert keep[0] == 0 and keep[-1] == len(series) - 1
+    assert (np.diff(keep) > 0).all()
+    # nothing to drop
+    assert (backend_charts.lttb(np.arange(10.0), np.arange(10.0), 20) == np.arange(10)).all()
+
+
+def test_minmax_keeps_budget_ends_and_extremes():
+    y = random_walk(10_001, seed=1).to_numpy()
+    keep = backend_charts.minmax(y, 500)
+    assert len(keep) <= 500
+    assert keep[0] == 0 and keep[-1] == len(y) - 1
+    assert np.argmax(y) in keep and np.argmin(y) in keep
+
+
+def test_downsample_drops_nan_and_keeps_ends():
+    series = random_walk(5_000, seed=2)
+    series.iloc[[0, 100, 4_999]] = np.nan
+    for method in ("lttb", "minmax"):
+        reduced = backend_charts.downsample(series, budget=300, method=method)
+        assert len(reduced) <= 300 and reduced.notna().all()
+        assert reduced.index[0] == series.index[1] and reduced.index[-1] == series.index[-2]
+    assert len(backend_charts.downsample(series.iloc[:50], budget=300)) == 49
+
+
+def test_to_ohlc_keeps_budget_and_range():
+    close = random_walk(30 * 24 * 60, seed=3)
+    hist = pd.DataFrame({"Open": close.shift(1).fillna(close), "High": close + 0.5, "Low": close - 0.5,
+                         "Close": close, "Volume": 1.0})
+    bars = backend_charts.to_ohlc(hist, budget=1500)
+    assert len(bars) <= 1500
+    assert bars["Open"].iloc[0] == hist["Open"].iloc[0] and bars["Close"].iloc[-1] == hist["Close"].iloc[-1]
+    assert bars["High"].max() == hist["High"].max() and bars["Low"].min() == hist["Low"].min()
+    assert bars["Volume"].sum() == hist["Volume"].sum()
+    # a close-only series fits the budget as it is
+    small = backend_charts.to_ohlc(hist[["Close"]].iloc[:100], budget=1500)
+    assert len(small) == 100 and (small["High"] == small["Close"]).all()
@@ -0,0 +1,50 @@
+import pandas as pd
+import backend_sqlite
+import backend_market_data
+import backend_fundamentals
+
+NOW = pd.Timestamp("2024-06-03 12:00:00")
+
+
+def stamp(age):
+    return (NOW - age).strftime(backend_fundamentals.DATE_FORMAT)
+
+
+def test_backoff_doubles_up_to_one_day():
+    minutes = [backend_fundamentals.backoff(n) / pd.Timedelta(minutes=1) for n in range(1, 5)]
+    assert minutes == [5, 10, 20, 40]
+    assert backend_fundamentals.backoff(30) == backend_fundamentals.BACKOFF_MAX == pd.Timedelta(days=1)
+
+
+def test_stale_symbols_by_ttl_and_backoff():
+    old, fresh = pd.Timedelta(days=2), pd.Timedelta(minutes=2)
+    cache = pd.DataFrame({
+        "Current Price": [1.0, 1.0, 1.0, None],
+        "price_at": [stamp(fresh), stamp(pd.Timedelta(minutes=6)), stamp(old), None],
+        "fundamentals_at": [stamp(pd.Timedelta(hours=23)), stamp(old), stamp(old), None],
+        "retry_at": [None, None, stamp(-pd.Timedelta(minutes=3)), stamp(-pd.Timedelta(minutes=3))],
+    }, index=pd.Index(["FRESH", "STALE", "BACKOFF", "UNKNOWN"], name="symbol"))
+
+    prices, infos = backend_fundamentals.stale_symbols(cache, list(cache.index) + ["NEW"], now=NOW)
+    # the price TTL is 5 minutes, fundamentals a day; in backoff only the price is refreshed,
+    # a symbol in backoff that never had a price is left alone, a never fetched one gets both
+    assert prices == ["STALE", "BACKOFF", "NEW"]
+    assert infos == ["STALE", "NEW"]
+
+
+def test_failed_fundamentals_back_off(portfolio_db):
+    provider = backend_market_data.FakeProvider(failing={"BAD"})
+    backend_fundamentals.refresh(["OK", "BAD"], ["OK", "BAD"], provider)
+    cache = backend_sqlite.get_quote_cache(["OK", "BAD"])
+    assert cache.loc["OK", "Current Price"] is not None and pd.isna(cache.loc["OK", "retry_at"])
+    assert cache.loc["BAD", "failures"] == 1
+    first_retry = pd.Timestamp(cache.loc["BAD", "retry_at"]) - pd.Timestamp.now()
+    assert pd.Timedelta(minutes=4) < first_retry <= pd.Timedelta(minutes=5)
+
+    backend_fundamentals.refresh([], ["BAD"], provider)
+    cache = backend_sqlite.get_quote_cache(["BAD"])
+    assert cache.loc["BAD", "failures"] == 2
+    assert pd.Timestamp(cache.loc["BAD", "retry_at"]) - pd.Timestamp.now() > pd.Timedelta(minutes=9)
+
+    # fresh or waiting: nothing to refresh
+    assert backend_fundamentals.stale_symbols(backend_sqlite.get_quote_cache(["OK", "BAD"]), ["OK", "BAD"]) == ([], [])
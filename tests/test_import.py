@@ -0,0 +1,36 @@
+import backend_sqlite
+import backend_import
+
+HEADER = "date,buy_sell,quantity,Ticker,price_per_unit,fees,currency\n"
+JANUARY = "2024-01-15 10:00:00,BUY,10,AAA,100,1,CHF\n"
+FEBRUARY = "2024-02-15 10:00:00,BUY,5,AAA,110,1,CHF\n"
+MARCH = "2024-03-15 10:00:00,SELL,3,AAA,120,1,CHF\n"
+
+
+class Upload:
+    # stands in for streamlit's UploadedFile
+    def __init__(self, name, text):
+        self.name = name
+        self.data = text.encode()
+
+    def getvalue(self):
+        return self.data
+
+
+def imported(*files):
+    report = backend_import.import_sources(backend_import.upload_sources(files), max_workers=1)
+    return report.set_index("file")[["inserted", "duplicates"]].to_dict("index")
+
+
+def test_overlapping_exports_import_each_row_once(portfolio_db):
+    # two identical orders in February are two transactions, the March export repeats both
+    first = Upload("2024-02.csv", HEADER + JANUARY + FEBRUARY + FEBRUARY)
+    second = Upload("2024-03.csv", HEADER + FEBRUARY + FEBRUARY + MARCH)
+    assert imported(first, second) == {"2024-02.csv": {"inserted": 3, "duplicates": 0},
+                                       "2024-03.csv": {"inserted": 1, "duplicates": 2}}
+    # a later export with three February orders adds the third one only
+    assert imported(Upload("2024-04.csv", HEADER + FEBRUARY * 3)) == {"2024-04.csv": {"inserted": 1, "duplicates": 2}}
+    assert imported(first) == {"2024-02.csv": {"inserted": 0, "duplicates": 3}}
+
+    assert len(backend_sqlite.query_transactions()) == 5
+    assert backend_sqlite.get_current_positions().set_index("Ticker").loc["AAA", "Quantity"] == 22
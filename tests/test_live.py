@@ -0,0 +1,40 @@
+import asyncio
+import numpy as np
+import pytest
+import backend_sqlite
+import backend_fundamentals
+import backend_market_data
+import backend_live
+from conftest import transactions
+
+
+def test_live_ticks_read_only_and_keep_total(portfolio_db, monkeypatch):
+    backend_sqlite.insert_transactions(transactions([
+        ("2024-01-02", "BUY", "AAA", 10, 100.0, 1.0),
+        ("2024-01-03", "BUY", "BBB", 5, 50.0, 1.0),
+        ("2024-01-04", "SELL", "AAA", 4, 120.0, 1.0),
+    ]))
+    backend_sqlite.add_to_watchlist("Ccc", "CCC", "CHF", "")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the live loop must not write or download")
+    # everything after this point is read-only
+    monkeypatch.setattr(backend_sqlite, "apply_position_deltas", fail)
+    monkeypatch.setattr(backend_fundamentals, "refresh", fail)
+    monkeypatch.setattr(backend_fundamentals, "schedule_refresh", fail)
+    feed = backend_market_data.SimulatedQuoteFeed(change_probability=0.5, seed=1)
+    monkeypatch.setattr(feed, "history", fail)
+
+    live = backend_live.LiveQuotes(provider=feed, rate=1000)
+    rows, seq, _, full = live.changes_since()
+    assert full and set(rows.index) == {"AAA", "BBB", "CCC"}
+    for _ in range(10):
+        asyncio.run(live.tick())
+        changes, new_seq, total, full = live.changes_since(seq)
+        assert not full and new_seq >= seq
+        rows.loc[changes.index, changes.columns] = changes
+        seq = new_seq
+    # the incrementally kept total equals the sum over the rows
+    assert total == pytest.approx(rows.loc[rows["held"], "Value (CHF)"].sum())
+    assert rows.loc["AAA", "Value (CHF)"] == pytest.approx(6 * rows.loc["AAA", "Current Price"])
+    assert not rows.loc["CCC", "held"] and np.isfinite(rows.loc["CCC", "Current Price"])
@@ -0,0 +1,34 @@
+import threading
+import time
+import backend_sqlite
+from conftest import transactions, insert_pending
+
+
+def test_concurrent_apply_applies_new_rows_once(portfolio_db, monkeypatch):
+    backend_sqlite.insert_transactions(transactions([
+        ("2024-01-02", "BUY", "AAA", 1000, 10.0, 5.0),
+        ("2024-02-01", "BUY", "AAA", 1454, 12.0, 5.0),
+    ]))
+    insert_pending(transactions([("2024-03-01", "SELL", "AAA", 4, 15.0, 3.1)]))
+
+    # widen the window between reading the state and writing it back
+    position_rows = backend_sqlite._position_rows
+    def slow_position_rows(*args, **kwargs):
+        time.sleep(0.2)
+        return position_rows(*args, **kwargs)
+    monkeypatch.setattr(backend_sqlite, "_position_rows", slow_position_rows)
+
+    barrier = threading.Barrier(4)
+    applied = []
+    def apply():
+        barrier.wait()
+        applied.append(backend_sqlite.apply_position_deltas())
+    threads = [threading.Thread(target=apply) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(applied) == [0, 0, 0, 1]
+    assert backend_sqlite.check_positions_consistency().empty
+    assert backend_sqlite.get_current_positions().set_index("Ticker").loc["AAA", "Quantity"] == 2450
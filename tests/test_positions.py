@@ -0,0 +1,116 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+import pytest
+import backend_positions
+import backend_sqlite
+from conftest import transactions
+
+COLUMNS = ["Quantity", "Cost Basis", "Realized P&L", "Fees"]
+
+
+def random_transactions(seed, n=400, tickers=("AAA", "BBB", "CCC")):
+    """
+    Buys and sells in date order, sells never exceed the holding and sometimes close it completely;
+    several rows share a day
+    """
+    rng = np.random.default_rng(seed)
+    held = dict.fromkeys(tickers, 0.0)
+    rows = []
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 1500, n)), unit="D")
+    for date in dates:
+        ticker = str(rng.choice(tickers))
+        price = round(float(rng.uniform(10, 200)), 2)
+        fees = round(float(rng.uniform(0, 5)), 2)
+        if held[ticker] > 0 and rng.random() < 0.4:
+            quantity = held[ticker] if rng.random() < 0.25 else float(rng.integers(1, held[ticker] + 1))
+            held[ticker] -= quantity
+            rows.append((date.strftime("%Y-%m-%d"), "SELL", ticker, quantity, price, fees))
+        else:
+            quantity = float(rng.integers(1, 50))
+            held[ticker] += quantity
+            rows.append((date.strftime("%Y-%m-%d"), "BUY", ticker, quantity, price, fees))
+    return transactions(rows)
+
+
+def _in_order(df):
+    # the order compute_positions applies the rows in: by ticker and date, same day in insert order
+    return df.assign(parsed=pd.to_datetime(df["date"], format="ISO8601")).sort_values(["Ticker", "parsed"], kind="stable")
+
+
+def reference_average(df):
+    state = {}
+    for row in _in_order(df).itertuples():
+        q, cost, realized, fees = state.get(row.Ticker, (0.0, 0.0, 0.0, 0.0))
+        if row.buy_sell == "BUY":
+            q, cost = q + row.quantity, cost + row.quantity * row.price_per_unit + row.fees
+        else:
+            removed = cost if row.quantity >= q else cost * row.quantity / q
+            realized += row.quantity * row.price_per_unit - row.fees - removed
+            q, cost = q - row.quantity, cost - removed
+        state[row.Ticker] = (q, cost, realized, fees + row.fees)
+    return pd.DataFrame(state, index=COLUMNS).T.rename_axis("Ticker")
+
+
+def reference_fifo(df):
+    state = {}
+    for row in _in_order(df).itertuples():
+        lots, realized, fees = state.get(row.Ticker, (deque(), 0.0, 0.0))
+        if row.buy_sell == "BUY":
+            lots.append([row.quantity, (row.quantity * row.price_per_unit + row.fees) / row.quantity])
+        else:
+            left, removed = row.quantity, 0.0
+            while left > 0:
+                take = min(left, lots[0][0])
+                removed += take * lots[0][1]
+                lots[0][0] -= take
+                left -= take
+                if lots[0][0] <= 0:
+                    lots.popleft()
+            realized += row.quantity * row.price_per_unit - row.fees - removed
+        state[row.Ticker] = (lots, realized, fees + row.fees)
+    return pd.DataFrame({ticker: (sum(q for q, _ in lots), sum(q * unit for q, unit in lots), realized, fees)
+                         for ticker, (lots, realized, fees) in state.items()}, index=COLUMNS).T.rename_axis("Ticker")
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("method, reference", [("average", reference_average), ("fifo", reference_fifo)])
+def test_compute_positions_matches_loop(seed, method, reference):
+    df = random_transactions(seed)
+    positions = backend_positions.compute_positions(df, method=method).set_index("Ticker")
+    expected = reference(df)
+    pd.testing.assert_frame_equal(positions[COLUMNS].sort_index(), expected.sort_index(), check_dtype=False,
+                                  check_names=False, rtol=1e-9, atol=1e-6)
+
+
+def test_incremental_positions_match_rebuild(portfolio_db):
+    df = random_transactions(3)
+    chunks = np.array_split(np.arange(len(df)), 8)
+    # in date order (incremental path), the fourth chunk last (back-dated rows)
+    for chunk in chunks[:3] + chunks[4:] + [chunks[3]]:
+        backend_sqlite.insert_transactions(df.iloc[chunk])
+        assert backend_sqlite.check_positions_consistency().empty
+
+    incremental = backend_sqlite.get_current_positions().set_index("Ticker")[COLUMNS].sort_index()
+    index_incremental = backend_sqlite.get_holdings_index()
+    backend_sqlite.rebuild_positions()
+    rebuilt = backend_sqlite.get_current_positions().set_index("Ticker")[COLUMNS].sort_index()
+    pd.testing.assert_frame_equal(incremental, rebuilt, rtol=1e-9, atol=1e-6)
+    pd.testing.assert_frame_equal(index_incremental, backend_sqlite.get_holdings_index(), rtol=1e-9, atol=1e-6)
+    pd.testing.assert_frame_equal(rebuilt, reference_average(df).sort_index(), check_names=False, rtol=1e-9, atol=1e-6)
+
+
+def test_average_cost_long_period_without_close():
+    # thousands of partial sells without the position going flat: the scale factor is renormalized
+    rows = [("2020-01-01", "BUY", "AAA", 1.0, 10.0, 0.0)]
+    for i in range(1200):
+        date = (pd.Timestamp("2020-01-02") + pd.Timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S")
+        rows += [(date, "BUY", "AAA", 10.0, 10.0 + i % 7, 0.5), (date, "SELL", "AAA", 10.0, 12.0, 0.0)]
+    df = transactions(rows)
+    with np.errstate(over="raise", invalid="raise"):
+        positions = backend_positions.compute_positions(df).set_index("Ticker")
+        index = backend_positions.holdings_index(df)
+    pd.testing.assert_frame_equal(positions[COLUMNS], reference_average(df), check_dtype=False,
+                                  check_names=False, rtol=1e-9, atol=1e-6)
+    assert index["cost_basis"].notna().all()
+    assert index["cost_basis"].iloc[-1] == pytest.approx(positions.loc["AAA", "Cost Basis"])
@@ -0,0 +1,36 @@
+import pandas as pd
+import backend_sqlite
+import backend_symbols
+import backend_fundamentals
+import backend_analysis
+import backend_holdings
+from conftest import transactions, insert_pending
+
+TABLES = ("current_positions", "holdings_index")
+
+
+def test_quotes_are_written_back_where_they_are_stored(portfolio_db):
+    backend_sqlite.insert_transactions(transactions([("2024-01-02", "BUY", "AAA", 10, 10.0, 1.0)]))
+    symbol = backend_symbols.resolve_symbol("AAA", "CHF")
+    backend_fundamentals.refresh([symbol], [symbol])
+    assert pd.notna(backend_sqlite.get_current_positions().set_index("Ticker").loc["AAA", "Current Price"])
+
+    # fresh quotes: the read path serves them without writing
+    versions = backend_sqlite.data_versions(TABLES)
+    positions = backend_analysis.get_current_positions()
+    assert pd.notna(positions.set_index("Ticker").loc["AAA", "Current Price"])
+    assert backend_sqlite.data_versions(TABLES) == versions
+
+
+def test_holdings_lookups_do_not_apply_pending_rows(portfolio_db):
+    backend_sqlite.insert_transactions(transactions([("2024-01-02", "BUY", "AAA", 10, 10.0, 1.0)]))
+    insert_pending(transactions([("2024-03-01", "SELL", "AAA", 4, 15.0, 0.0)]))
+    versions = backend_sqlite.data_versions(TABLES)
+
+    assert backend_holdings.positions_at(pd.Timestamp("2024-06-01")).loc["AAA", "quantity"] == 10
+    assert backend_holdings.holdings_at(["2024-06-01"]).loc[pd.Timestamp("2024-06-01"), "AAA"] == 10
+    assert backend_sqlite.data_versions(TABLES) == versions
+
+    # the next insert path applies them
+    backend_sqlite.apply_position_deltas()
+    assert backend_holdings.positions_at(pd.Timestamp("2024-06-01")).loc["AAA", "quantity"] == 6
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import backend_returns
+
+
+def reference_irr(amounts, times):
+    # bisection on the rate of one series, NPV falls with the rate when money is paid in first
+    def npv(rate):
+        return sum(a / (1 + rate) ** t for a, t in zip(amounts, times))
+    lo, hi = -0.99, 10.0
+    if np.sign(npv(lo)) == np.sign(npv(hi)):
+        return np.nan
+    for _ in range(200):
+        mid = (lo + hi) / 2
+        lo, hi = (mid, hi) if np.sign(npv(mid)) == np.sign(npv(lo)) else (lo, mid)
+    return (lo + hi) / 2
+
+
+def test_xirr_matches_scalar_reference():
+    rng = np.random.default_rng(0)
+    amounts, times, groups, expected = [], [], [], []
+    for group in range(40):
+        n = int(rng.integers(2, 12))
+        t = np.sort(np.r_[0.0, rng.uniform(0.05, 8, n - 1)])
+        a = np.r_[-rng.uniform(100, 1000, n - 1), 0.0]
+        # final value: growth between -60 % and +300 % over the horizon
+        a[-1] = -a[:-1].sum() * rng.uniform(0.4, 4.0)
+        amounts += list(a)
+        times += list(t)
+        groups += [group] * n
+        expected.append(reference_irr(a, t))
+    # a series without an inflow has no rate
+    amounts += [-100.0, -50.0]
+    times += [0.0, 1.0]
+    groups += [40, 40]
+
+    rates, _ = backend_returns.xirr(amounts, times, groups, 41)
+    np.testing.assert_allclose(rates[:40], expected, rtol=1e-6, atol=1e-8)
+    assert np.isnan(rates[40])
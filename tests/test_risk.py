@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import backend_history
+import backend_market_data
+import backend_risk
+import backend_sqlite
+
+
+def test_rolling_window_push_matches_full_recompute():
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range("2022-01-03", periods=400)
+    returns = pd.DataFrame(rng.normal(0, 0.02, (400, 3)), index=index, columns=["AAA", "BBB", "CCC"])
+    returns.iloc[5:20, 1] = np.nan
+    benchmark = pd.Series(rng.normal(0, 0.01, 400), index=index, name="SMI")
+    window = 63
+
+    volatility, beta = backend_risk.rolling_stats(returns, benchmark, window)
+    # plain pandas rolling windows as the reference (missing returns count as 0)
+    filled = returns.fillna(0)
+    expected_vol = filled.rolling(window).std() * np.sqrt(backend_risk.TRADING_DAYS)
+    expected_beta = filled.rolling(window).cov(benchmark).div(benchmark.rolling(window).var(), axis=0)
+    np.testing.assert_allclose(volatility.to_numpy(), expected_vol.to_numpy(), rtol=1e-8)
+    np.testing.assert_allclose(beta.to_numpy(), expected_beta.to_numpy(), rtol=1e-8)
+
+    rolling = backend_risk.RollingWindow.from_returns(returns.iloc[:100], benchmark, window)
+    for day in range(100, 400):
+        rolling.push(returns.iloc[day].to_numpy(), benchmark.iloc[day])
+        vol, bet = rolling.stats()
+        np.testing.assert_allclose(vol, volatility.iloc[day].to_numpy(), rtol=1e-9)
+        np.testing.assert_allclose(bet, beta.iloc[day].to_numpy(), rtol=1e-9)
+
+
+def test_benchmark_symbols_are_used_verbatim(portfolio_db):
+    assert backend_risk.benchmark_symbol("SMI") == ("^SSMI", "CHF")
+    assert backend_risk.benchmark_symbol("Euro Stoxx 50") == ("^STOXX50E", "EUR")
+    # the benchmark column is read under the symbol the worker prefetches
+    provider = backend_market_data.FakeProvider()
+    backend_market_data.set_provider(provider)
+    prices = backend_risk.price_matrix(["^SSMI"], ["CHF"], pd.Timestamp.now() - pd.DateOffset(months=1))
+    assert prices["^SSMI"].notna().any()
+    assert backend_sqlite.get_history_coverage("^SSMI", "1d") is not None
+    assert backend_sqlite.get_history_coverage("^SSMI.SW", "1d") is None
+
+
+def test_failed_first_download_is_not_retried_on_every_read(portfolio_db, monkeypatch):
+    provider = backend_market_data.FakeProvider(failing={"NOPE"})
+    monkeypatch.setattr(backend_history, "_failed", {})
+    start = pd.Timestamp.now().normalize() - pd.DateOffset(days=30)
+    for _ in range(3):
+        backend_history.fill_gaps("NOPE", "1d", start, provider)
+    assert provider.calls["history"] == 1
+
+    # tried again after FAILED_RETRY
+    monkeypatch.setattr(backend_history, "_failed", {("NOPE", "1d"): pd.Timestamp.now() - pd.Timedelta(seconds=1)})
+    backend_history.fill_gaps("NOPE", "1d", start, provider)
+    assert provider.calls["history"] == 2
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+import backend_screener
+
+
+def universe():
+    return pd.DataFrame({
+        "Ticker": ["A", "B", "C", "D", "E"],
+        "PE Ratio": [10.0, 20.0, -5.0, 0.0, np.nan],
+        "Momentum 3M (%)": [5.0, 15.0, 10.0, np.nan, np.nan],
+    })
+
+
+def test_filters_never_match_missing_values():
+    df = universe()
+    for op, value in [("<", 100.0), (">", -100.0), ("!=", 10.0), ("between", (-100.0, 100.0))]:
+        matched = backend_screener.apply_filters(df, [("PE Ratio", op, value)])
+        assert "E" not in set(matched["Ticker"]), op
+    matched = backend_screener.apply_filters(df, [("PE Ratio", ">", 0), ("Momentum 3M (%)", ">=", 10)])
+    assert list(matched["Ticker"]) == ["B"]
+    assert list(backend_screener.apply_filters(df, [])["Ticker"]) == list(df["Ticker"])
+
+
+def test_score_skips_missing_and_non_positive_ratios():
+    df = universe()
+    scores = backend_screener.score(df, {"PE Ratio": 1.0}).set_axis(df["Ticker"])
+    # PE <= 0 (losses) and NaN are not ranked, the lower positive PE ranks better
+    assert scores["A"] == 100.0 and scores["B"] == 50.0
+    assert scores[["C", "D", "E"]].isna().all()
+
+    scores = backend_screener.score(df, {"PE Ratio": 1.0, "Momentum 3M (%)": 1.0}).set_axis(df["Ticker"])
+    # C and D are scored on the columns they have a value for only, E has none
+    assert scores["C"] == pytest.approx(100 * 2 / 3)
+    assert np.isnan(scores["D"]) and np.isnan(scores["E"])
+    assert scores["B"] == pytest.approx((50.0 + 100.0) / 2)
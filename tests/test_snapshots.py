@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as tm
+import pytest
+import backend_sqlite
+import backend_snapshots
+
+pytest.importorskip("pyarrow")
+
+
+def bars(start, periods, close=100.0):
+    index = pd.date_range(start, periods=periods, freq="D", name="Date")
+    close = close + np.arange(periods, dtype=float)
+    return pd.DataFrame({"Open": close, "High": close + 1, "Low": close - 1, "Close": close,
+                         "Volume": np.full(periods, 1000.0)}, index=index)
+
+
+def parts():
+    directory = backend_snapshots._price_path(backend_snapshots.directory("market"), "AAA", "1d")
+    return sorted(file.name for file in directory.glob("part-*.parquet"))
+
+
+def assert_matches_sql():
+    tm.assert_frame_equal(backend_snapshots.read_price_history("AAA", "1d"),
+                          backend_sqlite.get_price_history("AAA", "1d"), check_freq=False)
+
+
+def test_price_history_snapshot_appends_tails(portfolio_db, monkeypatch):
+    monkeypatch.setattr(backend_snapshots, "ENABLED", True)
+    backend_sqlite.upsert_price_history("AAA", "1d", bars("2024-01-01", 100))
+    backend_sqlite.set_history_coverage("AAA", "1d", "2024-01-01", "2024-04-09", "2024-04-09 10:00:00")
+    assert_matches_sql()
+    assert parts() == ["part-000000-000000.parquet"]
+
+    # only fetched_at moved (fill_gaps found nothing new): the snapshot is kept
+    backend_sqlite.set_history_coverage("AAA", "1d", "2024-01-01", "2024-04-09", "2024-04-09 11:00:00")
+    assert_matches_sql()
+    assert parts() == ["part-000000-000000.parquet"]
+
+    # last bar overwritten and new bars: appended as a tail, the tail wins for the repeated day
+    backend_sqlite.upsert_price_history("AAA", "1d", bars("2024-04-09", 5, close=500.0))
+    assert_matches_sql()
+    assert parts() == ["part-000000-000000.parquet", "part-000001-000000.parquet"]
+    assert backend_snapshots.read_price_history("AAA", "1d", start="2024-04-09")["Close"].iloc[0] == 500.0
+
+    # backfill before the snapshot: written again as one full part
+    backend_sqlite.upsert_price_history("AAA", "1d", bars("2023-12-01", 10))
+    assert_matches_sql()
+    assert parts() == ["part-000002-000002.parquet"]
+
+
+def test_price_history_snapshot_compacts_tails(portfolio_db, monkeypatch):
+    monkeypatch.setattr(backend_snapshots, "ENABLED", True)
+    monkeypatch.setattr(backend_snapshots, "MAX_PARTS", 3)
+    backend_sqlite.upsert_price_history("AAA", "1d", bars("2024-01-01", 10))
+    for day in range(10, 16):
+        backend_sqlite.upsert_price_history("AAA", "1d", bars(pd.Timestamp("2024-01-01") + pd.Timedelta(days=day), 1))
+        assert_matches_sql()
+        assert len(parts()) <= 4
+    assert len(parts()) < 4
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import backend_sqlite
+import backend_fx
+import backend_valuation
+
+
+def test_load_closes_sees_new_intraday_bars(portfolio_db):
+    now = pd.Timestamp.now().floor("min")
+    bars = pd.DataFrame({"Close": [10.0, 11.0]}, index=pd.DatetimeIndex([now - pd.Timedelta(minutes=2), now - pd.Timedelta(minutes=1)]))
+    backend_sqlite.upsert_price_history("AAA", "1m", bars)
+    # fresh coverage: fill_gaps downloads nothing
+    stamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    start = now - pd.Timedelta(hours=1)
+    backend_sqlite.set_history_coverage("AAA", "1m", start.strftime("%Y-%m-%d %H:%M:%S"), stamp, stamp)
+    assert backend_valuation.load_closes(("AAA",), start, "1m")["AAA"].iloc[-1] == 11.0
+
+    backend_sqlite.upsert_price_history("AAA", "1m", pd.DataFrame({"Close": [12.0]}, index=pd.DatetimeIndex([now])))
+    assert backend_valuation.load_closes(("AAA",), start, "1m")["AAA"].iloc[-1] == 12.0
+
+
+def test_value_holdings_without_fx_rate_is_nan(portfolio_db, monkeypatch):
+    dates = pd.DatetimeIndex(["2024-01-02", "2024-01-03"])
+    closes = {"AAA": [10.0, 11.0], "BBB": [20.0, 21.0]}
+    # resolved symbols (AAA.SW, BBB) -> closes of the ticker
+    monkeypatch.setattr(backend_valuation, "close_matrix",
+                        lambda symbols, dates, interval="1d": pd.DataFrame({s: closes[s.split(".")[0]] for s in symbols}, index=dates))
+    # no USD rates stored or downloadable
+    monkeypatch.setattr(backend_fx, "get_rates", lambda currency, dates, target="CHF": np.full(len(dates), 1.0 if currency == target else np.nan))
+    held = pd.DataFrame({"AAA": [1.0, 2.0], "BBB": [0.0, 3.0]}, index=dates)
+    currencies = pd.Series({"AAA": "CHF", "BBB": "USD"})
+
+    values = backend_valuation.value_holdings(held, currencies)
+    # not held: 0, held without rate: NaN instead of the price at parity
+    assert values["AAA"].tolist() == [10.0, 22.0]
+    assert values["BBB"].iloc[0] == 0.0 and np.isnan(values["BBB"].iloc[1])
+    assert values.sum(axis=1).tolist() == [10.0, 22.0]